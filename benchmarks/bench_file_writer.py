@@ -0,0 +1,89 @@
+"""
+Benchmark for the download write path: streams a file from a local HTTP server to disk with the old
+8 KB iter_content loop and with course_downloader._write_body, and reports MB/s and CPU seconds per GB.
+
+    python benchmarks/bench_file_writer.py --size-mb 512 --runs 3 --hash
+
+The server runs in a separate process, so the CPU figures are the downloading side only.
+"""
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from course_downloader import _write_body # noqa: E402
+
+
+def write_body_8k(r, path, mode, hasher=None, bandwidth=None):
+    """The write loop before the adaptive writer, for comparison."""
+    with open(path, mode) as f:
+        for chunk in r.iter_content(chunk_size=8192):
+            if chunk:
+                f.write(chunk)
+                if hasher: hasher.update(chunk)
+
+
+WRITERS = {"8k-loop": write_body_8k, "write_body": _write_body}
+
+
+def start_server(directory, port):
+    server = subprocess.Popen([sys.executable, "-m", "http.server", str(port), "--bind", "127.0.0.1", "--directory", directory],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            requests.head(f"http://127.0.0.1:{port}/", timeout=1)
+            return server
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("benchmark HTTP server did not start")
+
+
+def run_once(session, url, writer, target, use_hash):
+    hasher = hashlib.sha256() if use_hash else None
+    wall, cpu = time.perf_counter(), time.process_time()
+    with session.get(url, stream=True, timeout=300) as r:
+        r.raise_for_status()
+        writer(r, target, 'wb', hasher)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    os.remove(target)
+    return wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=256, help="size of the served file (default: %(default)s)")
+    parser.add_argument("--runs", type=int, default=3, help="runs per writer; the best is reported (default: %(default)s)")
+    parser.add_argument("--hash", action="store_true", help="also compute SHA-256 while writing, as downloads do")
+    parser.add_argument("--port", type=int, default=8799)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as served, tempfile.TemporaryDirectory() as out:
+        with open(os.path.join(served, "file.bin"), 'wb') as f:
+            block = os.urandom(1024 * 1024)
+            for _ in range(args.size_mb):
+                f.write(block)
+        server = start_server(served, args.port)
+        try:
+            session = requests.Session()
+            url = f"http://127.0.0.1:{args.port}/file.bin"
+            size_gb = args.size_mb / 1024
+            print(f"{args.size_mb} MB, best of {args.runs}, hashing {'on' if args.hash else 'off'}")
+            print(f"{'writer':<12}{'MB/s':>10}{'CPU s/GB':>12}")
+            for name, writer in WRITERS.items():
+                runs = [run_once(session, url, writer, os.path.join(out, "file.bin"), args.hash) for _ in range(args.runs)]
+                wall, cpu = min(runs)
+                print(f"{name:<12}{args.size_mb / wall:>10.1f}{cpu / size_gb:>12.2f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
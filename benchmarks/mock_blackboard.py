@@ -0,0 +1,375 @@
+"""
+A local stand-in for the KFUPM Blackboard server, for benchmarks and offline testing. It serves a
+deterministic synthetic catalog with the markup the downloader reads:
+
+- the login form (user_id / password / entry-login), which sets a session cookie
+- the portal's Courses module ('module:_4_1') with 'termHeading-coursefakeclass' term headings
+- course homes with the 'courseMenuPalette_contents' menu
+- nested listContent.jsp folders, with files linked directly or as item attachments
+- /bbcswebdav/ files of configurable sizes, with ETag/Last-Modified, conditional GETs and byte ranges
+
+Pages and files can be delayed to stand in for network and server latency.
+
+    python benchmarks/mock_blackboard.py --port 8798 --course-sizes 10,100,1000 --file-size 16K-256K
+    python course_downloader.py --base-url http://127.0.0.1:8798 download --all --username bench
+
+Any username and password log in. GET /__stats returns what has been served so far as JSON.
+"""
+import argparse
+import json
+import random
+import re
+import secrets
+import threading
+import time
+from email.utils import formatdate
+from html import escape
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+SESSION_COOKIE = "s_session_id"
+# Course menu entries, with the share of a course's items placed in each; entries with no share have no content page
+COURSE_MENU = [("Announcements", None), ("Course Content", 0.7), ("Course Syllabus", 0.05), ("Assignments", 0.2),
+               ("Assessments / Tests", 0.05)]
+BODY_BLOCK_SIZE = 1024 * 1024
+BODY_CHUNK_SIZE = 64 * 1024
+LAST_MODIFIED = formatdate(1700000000, usegmt=True)
+
+
+def parse_size(text):
+    """'64K', '1.5M', '512' -> bytes."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMG]?)I?B?\s*", text.upper())
+    if not match:
+        raise ValueError(f"not a size: {text!r}")
+    return int(float(match.group(1)) * {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}[match.group(2)])
+
+
+def parse_size_range(text):
+    """'64K' -> (65536, 65536); '16K-1M' -> (16384, 1048576)."""
+    low, _, high = text.partition("-")
+    low = parse_size(low)
+    return low, parse_size(high) if high else low
+
+
+class SyntheticCatalog:
+    """
+    The synthetic Blackboard contents: one course per entry of course_sizes (that many files each), spread
+    round-robin over terms. A course's items are split across its menu sections; a folder page holding more
+    than page_size items keeps some files itself and divides the rest among fanout sub-folders. Every tenth
+    file is an attachment of an assignment-style item instead of a direct link. File sizes are drawn from
+    file_size (a (min, max) range in bytes) with a fixed seed, so the same arguments give the same catalog.
+    """
+    def __init__(self, course_sizes=(10,), terms=1, page_size=20, fanout=4, file_size=(64 * 1024, 64 * 1024), seed=0):
+        self.page_size = max(fanout + 1, page_size)
+        self.fanout = max(2, fanout)
+        self._rng = random.Random(seed)
+        self.file_size = file_size
+        self.courses = []  # {"id", "name", "term", "items", "sections": [(name, root content id or None)]}
+        self.pages = {}    # content id -> {"course": course id, "title", "entries": [(kind, id, title)]}
+        self.files = {}    # file id -> (content id of its page, size)
+        self._next_id = 100
+        for index, size in enumerate(course_sizes):
+            course_id = index + 1
+            course = {"id": course_id, "name": f"SYN{size} Synthetic course ({size} items)",
+                      "term": f"Synthetic Term {index % max(1, terms) + 1}", "items": size, "sections": []}
+            remaining = size
+            shares = [share for _, share in COURSE_MENU if share]
+            for section_name, share in COURSE_MENU:
+                if share is None:
+                    course["sections"].append((section_name, None))
+                    continue
+                shares.remove(share)
+                section_items = remaining if not shares else min(remaining, int(size * share))
+                remaining -= section_items
+                course["sections"].append((section_name, self._build_folder(course_id, section_name, section_items)))
+            self.courses.append(course)
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    def _build_folder(self, course_id, title, item_count):
+        content_id = self._new_id()
+        page = {"course": course_id, "title": title, "entries": []}
+        self.pages[content_id] = page
+        if item_count > self.page_size:
+            direct = min(self.page_size - self.fanout, item_count // (self.fanout + 1))
+        else:
+            direct = item_count
+        for _ in range(direct):
+            file_id = self._new_id()
+            self.files[file_id] = (content_id, self._rng.randint(*self.file_size))
+            kind = "attachment" if file_id % 10 == 0 else "file"
+            page["entries"].append((kind, file_id, f"Lecture {file_id}" if kind == "file" else f"Assignment {file_id}"))
+        rest = item_count - direct
+        if rest:
+            per_folder, extra = divmod(rest, self.fanout)
+            for i in range(self.fanout):
+                count = per_folder + (1 if i < extra else 0)
+                if count:
+                    child_id = self._build_folder(course_id, f"Week {i + 1}", count)
+                    page["entries"].append(("folder", child_id, f"Week {i + 1}"))
+        return content_id
+
+    def course(self, course_id):
+        return self.courses[course_id - 1] if 0 < course_id <= len(self.courses) else None
+
+    def file_url(self, file_id):
+        content_id, _ = self.files[file_id]
+        course_id = self.pages[content_id]["course"]
+        return f"/bbcswebdav/pid-{content_id}-dt-content-rid-{file_id}_1/courses/SYN_{course_id}/file_{file_id}.pdf"
+
+    def body(self, file_id, block, start, end):
+        """Yields bytes [start, end) of the file: a unique header, then the shared random block from a per-file offset."""
+        header = b"%%PDF-1.4 synthetic file %d\n" % file_id
+        offset = file_id * 7919
+        position = start
+        while position < end:
+            if position < len(header):
+                piece = header[position:min(end, len(header))]
+            else:
+                k = (position - len(header) + offset) % len(block)
+                piece = block[k:k + min(end - position, BODY_CHUNK_SIZE)]
+            yield piece
+            position += len(piece)
+
+
+def list_url(course_id, content_id):
+    return f"/webapps/blackboard/content/listContent.jsp?course_id=_{course_id}_1&content_id=_{content_id}_1"
+
+
+def render_login(message=""):
+    notice = f'<div id="loginErrorMessage">{escape(message)}</div>' if message else ""
+    return (f"<html><head><title>Blackboard Learn</title></head><body><div id=\"loginBox\">{notice}"
+            "<form name=\"login\" action=\"/webapps/login/\" method=\"POST\">"
+            "<input type=\"text\" name=\"user_id\" id=\"user_id\">"
+            "<input type=\"password\" name=\"password\" id=\"password\">"
+            "<input type=\"submit\" value=\"Login\" name=\"login\" id=\"entry-login\">"
+            "</form></div></body></html>")
+
+
+def render_portal(catalog):
+    terms = {}
+    for course in catalog.courses:
+        terms.setdefault(course["term"], []).append(course)
+    parts = ['<html><head><title>Welcome</title></head><body><div class="portlet" id="module:_4_1">'
+             '<div class="collapsible" id="_4_1termCourses">']
+    for index, (term, courses) in enumerate(terms.items()):
+        parts.append(f'<h3 class="termHeading-coursefakeclass" id="anonymous_element_{index + 1}">'
+                     f'<a href="#" title="Collapse">{escape(term)}</a></h3>')
+        parts.append('<div><ul class="portletList-img courseListing coursefakeclass">')
+        for course in courses:
+            parts.append(f'<li><a href="/webapps/blackboard/execute/launcher?type=Course&amp;id=_{course["id"]}_1&amp;url=">'
+                         f'{escape(course["name"])}</a><div class="courseDataBlock"><span class="name">Instructor:</span>'
+                         f' Synthetic Instructor</div></li>')
+        parts.append('</ul></div>')
+    parts.append('</div></div></body></html>')
+    return "".join(parts)
+
+
+def render_list_page(catalog, content_id):
+    page = catalog.pages[content_id]
+    course = catalog.course(page["course"])
+    parts = [f'<html><head><title>{escape(page["title"])}</title></head><body><div id="navigationPane">'
+             '<ul id="courseMenuPalette_contents" class="courseMenu">']
+    for section_name, section_id in course["sections"]:
+        href = list_url(course["id"], section_id) if section_id else f'/webapps/blackboard/execute/announcement?course_id=_{course["id"]}_1'
+        parts.append(f'<li><a href="{escape(href)}" target="_self"><span title="{escape(section_name)}">{escape(section_name)}</span></a></li>')
+    parts.append(f'</ul></div><div id="content"><h1 id="pageTitleHeader"><span id="pageTitleText">{escape(page["title"])}</span></h1>'
+                 '<ul id="content_listContainer" class="contentList">')
+    for kind, entry_id, title in page["entries"]:
+        if kind == "folder":
+            heading, details = f'<a href="{escape(list_url(course["id"], entry_id))}"><span>{escape(title)}</span></a>', ""
+        elif kind == "file":
+            heading, details = f'<a href="{escape(catalog.file_url(entry_id))}"><span>{escape(title)}</span></a>', ""
+        else:
+            heading = f'<span>{escape(title)}</span>'
+            details = (f'<ul class="attachments clearfix"><li><a href="{escape(catalog.file_url(entry_id))}">'
+                       f'assignment_{entry_id}.pdf</a></li></ul>')
+        parts.append(f'<li class="clearfix liItem read" id="contentListItem:_{entry_id}_1"><div class="item clearfix">'
+                     f'<h3>{heading}</h3></div><div class="details">{details}</div></li>')
+    parts.append('</ul></div></body></html>')
+    return "".join(parts)
+
+
+class MockBlackboardServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, catalog, page_latency=0.0, file_latency=0.0):
+        super().__init__(address, MockBlackboardHandler)
+        self.catalog = catalog
+        self.page_latency = page_latency
+        self.file_latency = file_latency
+        self.sessions = set()
+        self.block = random.Random(1).randbytes(BODY_BLOCK_SIZE)
+        self.stats = {"logins": 0, "pages": 0, "files": 0, "not_modified": 0, "bytes": 0}
+        self._stats_lock = threading.Lock()
+
+    def count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+
+class MockBlackboardHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="text/html; charset=utf-8", headers=None):
+        body = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _redirect(self, location, headers=None):
+        self._send(302, headers={"Location": location, **(headers or {})})
+
+    def _logged_in(self):
+        morsel = SimpleCookie(self.headers.get("Cookie", "")).get(SESSION_COOKIE)
+        return morsel is not None and morsel.value in self.server.sessions
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8", "replace"))
+        if path != "/webapps/login/":
+            self._send(404, "Not found")
+        elif not form.get("user_id") or not form.get("password"):
+            self._send(200, render_login("Enter your username and password."))
+        else:
+            token = secrets.token_hex(16)
+            self.server.sessions.add(token)
+            self.server.count("logins")
+            self._redirect("/webapps/portal/execute/defaultTab", {"Set-Cookie": f"{SESSION_COOKIE}={token}; Path=/; HttpOnly"})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        try:
+            if url.path in ("/", "/webapps/login/"):
+                self._send(200, render_login())
+            elif url.path == "/__stats":
+                with self.server._stats_lock:
+                    self._send(200, json.dumps(self.server.stats), "application/json")
+            elif not self._logged_in():
+                self._redirect("/webapps/login/?new_loc=" + quote(self.path, safe=""))
+            elif url.path == "/webapps/portal/execute/defaultTab":
+                self._page(lambda: render_portal(self.server.catalog))
+            elif url.path == "/webapps/blackboard/execute/launcher":
+                self._launch_course(query)
+            elif url.path == "/webapps/blackboard/content/listContent.jsp":
+                content_id = _bb_id(query.get("content_id"))
+                if content_id not in self.server.catalog.pages:
+                    self._send(404, "Not found")
+                else:
+                    self._page(lambda: render_list_page(self.server.catalog, content_id))
+            elif url.path.startswith("/bbcswebdav/"):
+                self._file(url.path)
+            else:
+                self._send(404, "Not found")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _page(self, render):
+        if self.server.page_latency:
+            time.sleep(self.server.page_latency)
+        self.server.count("pages")
+        self._send(200, render())
+
+    def _launch_course(self, query):
+        # Like Blackboard, the course entry point redirects to the course's first content page
+        course = self.server.catalog.course(_bb_id(query.get("id")))
+        if course is None:
+            self._send(404, "Not found")
+            return
+        first_page = next(section_id for _, section_id in course["sections"] if section_id)
+        self._redirect(list_url(course["id"], first_page))
+
+    def _file(self, path):
+        match = re.search(r"-rid-(\d+)_1/", path)
+        file_id = int(match.group(1)) if match else None
+        if file_id not in self.server.catalog.files:
+            self._send(404, "Not found")
+            return
+        if self.server.file_latency:
+            time.sleep(self.server.file_latency)
+        size = self.server.catalog.files[file_id][1]
+        validators = {"ETag": f'"syn-{file_id}-{size}"', "Last-Modified": LAST_MODIFIED}
+        if self.headers.get("If-None-Match") == validators["ETag"] or (
+                not self.headers.get("If-None-Match") and self.headers.get("If-Modified-Since") == LAST_MODIFIED):
+            self.server.count("not_modified")
+            self.send_response(304)
+            for name, value in validators.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        start, status = 0, 200
+        range_match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if range_match and self.headers.get("If-Range", validators["ETag"]) in (validators["ETag"], LAST_MODIFIED):
+            start = int(range_match.group(1))
+            if start >= size:
+                self._send(416, headers={"Content-Range": f"bytes */{size}"})
+                return
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(size - start))
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        for name, value in validators.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        self.server.count("files")
+        for piece in self.server.catalog.body(file_id, self.server.block, start, size):
+            self.wfile.write(piece)
+        self.server.count("bytes", size - start)
+
+
+def _bb_id(values):
+    """'_123_1' (a Blackboard id query value) -> 123, or None."""
+    match = re.fullmatch(r"_(\d+)_1", (values or [""])[0])
+    return int(match.group(1)) if match else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8798)
+    parser.add_argument("--course-sizes", default="10,100,1000", help="items per synthetic course, comma-separated (default: %(default)s)")
+    parser.add_argument("--terms", type=int, default=1, help="terms the courses are spread over (default: %(default)s)")
+    parser.add_argument("--page-size", type=int, default=20, help="most items on one folder page before sub-folders are used (default: %(default)s)")
+    parser.add_argument("--fanout", type=int, default=4, help="sub-folders per overfull folder (default: %(default)s)")
+    parser.add_argument("--file-size", default="64K", help="file size, or a min-max range such as 16K-4M (default: %(default)s)")
+    parser.add_argument("--page-latency", type=float, default=0.0, help="seconds before each page is answered (default: %(default)s)")
+    parser.add_argument("--file-latency", type=float, default=0.0, help="seconds before each file's headers are sent (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    catalog = SyntheticCatalog([int(size) for size in args.course_sizes.split(",") if size.strip()], terms=args.terms,
+                               page_size=args.page_size, fanout=args.fanout, file_size=parse_size_range(args.file_size), seed=args.seed)
+    server = MockBlackboardServer((args.host, args.port), catalog, args.page_latency, args.file_latency)
+    print(f"Mock Blackboard on http://{args.host}:{server.server_port}/ - {len(catalog.courses)} courses, "
+          f"{len(catalog.pages)} folder pages, {len(catalog.files)} files", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Crawl and download benchmark against the local mock Blackboard (benchmarks/mock_blackboard.py). For
+synthetic courses of 10 to 10,000 items it logs in (by posting the login form over HTTP, or in a browser
+with --browser), scans the course list, then downloads one course twice (a fresh download, then a re-sync
+with nothing changed) and reports pages/s, files/s, MB/s and peak RSS.
+
+    python benchmarks/run_benchmarks.py --save before.json
+    ... make the change ...
+    python benchmarks/run_benchmarks.py --compare before.json
+
+With --compare the exit status is 1 when any throughput drops, or the peak RSS grows, by more than
+--tolerance against the saved results. A run with failed items also exits 1. Each size runs in a fresh
+process, so the peak RSS is for that size only. Each also gets its own temporary home folder, so saved
+sessions, the manifest and the downloads never mix between runs or touch the real ones in ~.
+
+The benchmark drives the downloader through set_base_url, scan_courses, download_selected_courses and
+METRICS, which came with it or shortly before: a baseline can only be recorded at this revision or a
+later one, so --compare gates changes made from here on, not against older releases.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+USERNAME = "bench"
+PASSWORD = "bench"
+# (run, metric) pairs where lower is a regression; peak_rss_mb is checked the other way. The re-sync's pages/s is
+# not gated: with --folder-reuse-hours its unchanged folders are taken from the manifest (FolderListings), so it
+# fetches only the top listings
+GATED_METRICS = [("fresh", "pages_per_second"), ("fresh", "files_per_second"), ("fresh", "mb_per_second"),
+                 ("resync", "files_per_second")]
+
+
+def course_name(size):
+    return f"SYN{size} Synthetic course ({size} items)" # As named by mock_blackboard.SyntheticCatalog
+
+
+def start_mock_server(args):
+    command = [sys.executable, os.path.join(BENCHMARK_DIR, "mock_blackboard.py"), "--port", str(args.port),
+               "--course-sizes", ",".join(map(str, args.sizes)), "--file-size", args.file_size,
+               "--page-latency", str(args.page_latency), "--file-latency", str(args.file_latency)]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    for _ in range(300):
+        try:
+            requests.get(f"http://127.0.0.1:{args.port}/", timeout=1)
+            return server
+        except requests.exceptions.ConnectionError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("mock Blackboard server did not start")
+
+
+def http_login(base_url):
+    """Posts the login form the way the browser does in login(); returns the cookies in Selenium's format."""
+    session = requests.Session()
+    r = session.post(base_url + "webapps/login/", data={"user_id": USERNAME, "password": PASSWORD, "login": "Login"}, timeout=30)
+    r.raise_for_status()
+    return [{"name": c.name, "value": c.value, "domain": c.domain, "path": c.path} for c in session.cookies]
+
+
+def _metric_total(snapshot, name):
+    total = 0
+    for entry in snapshot.get(name, []):
+        value = entry["value"]
+        total += value["count"] if isinstance(value, dict) else value
+    return total
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 # bytes on macOS, KiB elsewhere
+
+
+def run_size(base_url, size, options):
+    """One benchmark round for the course of size items, in a worker process of its own."""
+    home = tempfile.mkdtemp(prefix="bb-bench-")
+    os.environ["HOME"] = os.environ["USERPROFILE"] = home
+    sys.path.insert(0, REPO_DIR)
+    import course_downloader as bb # Only now: its state paths are taken from the home folder at import
+
+    def quiet(message, level=logging.INFO):
+        pass
+
+    try:
+        bb.set_base_url(base_url)
+        browser = options["browser"]
+        started = time.perf_counter()
+        if browser:
+            driver = bb.setup_driver(browser, quiet, headless=True)
+            try:
+                cookies = bb.login(driver, USERNAME, PASSWORD)
+            finally:
+                driver.quit()
+        else:
+            cookies = http_login(base_url)
+        # An HTTP login posts the form directly and is much faster than a browser login; the key says which one was timed
+        record = {"items": size, ("browser_login_seconds" if browser else "http_login_seconds"): time.perf_counter() - started}
+        bb.save_session_cookies(USERNAME, cookies)
+
+        started = time.perf_counter()
+        courses = bb.scan_courses(USERNAME, PASSWORD, browser or "firefox", True, quiet)
+        record["scan_seconds"] = time.perf_counter() - started
+        course = next(c for c in courses if c["name"] == course_name(size))
+
+        download_options = {key: options[key] for key in ("download_workers", "crawl_workers", "folder_reuse_hours") if options[key]}
+        for run in ("fresh", "resync"):
+            bb.METRICS.reset()
+            started = time.perf_counter()
+            results = bb.download_selected_courses([course], os.path.join(home, "downloads"), USERNAME, PASSWORD, quiet,
+                                                   browser_choice=browser or "firefox", http_crawl=not browser,
+                                                   dedupe=options["dedupe"], **download_options)
+            seconds = time.perf_counter() - started
+            snapshot = bb.METRICS.snapshot()
+            pages = _metric_total(snapshot, "page_fetch_seconds")
+            files = results["SAVED"] + results["SKIPPED"]
+            downloaded = _metric_total(snapshot, "bytes_downloaded_total")
+            record[run] = {"seconds": seconds, "pages": pages, "files": files, "failed": results["FAILED"], "bytes": downloaded,
+                           "pages_per_second": pages / seconds, "files_per_second": files / seconds,
+                           "mb_per_second": downloaded / seconds / (1024 * 1024)}
+        record["peak_rss_mb"] = _peak_rss_mb()
+        return record
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+
+def run_benchmarks(args):
+    base_url = f"http://127.0.0.1:{args.port}/"
+    options = {"browser": args.browser, "download_workers": args.download_workers, "crawl_workers": args.crawl_workers,
+               "dedupe": not args.no_dedupe, "folder_reuse_hours": args.folder_reuse_hours}
+    server = start_mock_server(args)
+    try:
+        results = {}
+        for size in args.sizes:
+            rounds = []
+            for _ in range(args.runs):
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    rounds.append(pool.submit(run_size, base_url, size, options).result())
+            results[str(size)] = min(rounds, key=lambda record: record["fresh"]["seconds"])
+            print_record(results[str(size)])
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def print_header():
+    print(f"{'items':>6} {'run':<7}{'seconds':>9}{'pages':>7}{'pages/s':>9}{'files':>7}{'files/s':>9}{'MB/s':>8}{'failed':>7}{'peak RSS MB':>13}")
+
+
+def print_record(record):
+    for run in ("fresh", "resync"):
+        r = record[run]
+        rss = f"{record['peak_rss_mb']:.1f}" if run == "fresh" and record["peak_rss_mb"] is not None else ""
+        print(f"{record['items'] if run == 'fresh' else '':>6} {run:<7}{r['seconds']:>9.2f}{r['pages']:>7}{r['pages_per_second']:>9.1f}"
+              f"{r['files']:>7}{r['files_per_second']:>9.1f}{r['mb_per_second']:>8.1f}{r['failed']:>7}{rss:>13}", flush=True)
+
+
+def compare(baseline, results, tolerance):
+    """Prints the change of every gated figure against baseline; returns the regressions beyond tolerance."""
+    regressions = []
+    for size, record in results.items():
+        before = baseline.get(size)
+        if before is None:
+            print(f"{size} items: not in the baseline")
+            continue
+        checks = [(f"{run} {metric}", before[run][metric], record[run][metric], False) for run, metric in GATED_METRICS]
+        if before.get("peak_rss_mb") and record.get("peak_rss_mb"):
+            checks.append(("peak_rss_mb", before["peak_rss_mb"], record["peak_rss_mb"], True))
+        for label, old, new, higher_is_worse in checks:
+            change = (new - old) / old if old else 0.0
+            worse = change > tolerance if higher_is_worse else change < -tolerance
+            print(f"{size:>6} {label:<24}{old:>10.1f} -> {new:>10.1f}  {change:+7.1%}{'  REGRESSION' if worse else ''}")
+            if worse:
+                regressions.append(f"{size} items: {label}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,1000,10000", type=lambda text: [int(s) for s in text.split(",") if s.strip()],
+                        help="items per synthetic course, comma-separated (default: %(default)s)")
+    parser.add_argument("--runs", type=int, default=1, help="rounds per size; the fastest fresh download is reported (default: %(default)s)")
+    parser.add_argument("--file-size", default="16K", help="file size or min-max range served by the mock (default: %(default)s)")
+    parser.add_argument("--page-latency", type=float, default=0.005, help="mock server delay per page, seconds (default: %(default)s)")
+    parser.add_argument("--file-latency", type=float, default=0.005, help="mock server delay per file, seconds (default: %(default)s)")
+    parser.add_argument("--download-workers", type=int, help="download threads (default: the downloader's default)")
+    parser.add_argument("--crawl-workers", type=int, help="folder pages fetched at once (default: the downloader's default)")
+    parser.add_argument("--no-dedupe", action="store_true", help="run without the content-addressed blob store")
+    parser.add_argument("--folder-reuse-hours", type=float, help="let the re-sync reuse unchanged folders' sub-folders (default: off)")
+    parser.add_argument("--browser", choices=["firefox", "chrome"], help="log in and crawl in this browser instead of over HTTP")
+    parser.add_argument("--port", type=int, default=8798)
+    parser.add_argument("--save", metavar="PATH", help="write the results (and the settings used) to this JSON file")
+    parser.add_argument("--compare", metavar="PATH", help="compare against results saved with --save; exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative change before --compare fails (default: %(default)s)")
+    args = parser.parse_args()
+
+    settings = {key: getattr(args, key) for key in ("file_size", "page_latency", "file_latency", "download_workers", "crawl_workers",
+                                                    "no_dedupe", "folder_reuse_hours", "browser")}
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != settings:
+            print(f"Note: the baseline was recorded with other settings: {baseline.get('settings')}")
+
+    print_header()
+    results = run_benchmarks(args)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+
+    failed = [size for size, record in results.items() if record["fresh"]["failed"] or record["resync"]["failed"]]
+    if failed:
+        print(f"Failed items in the {', '.join(failed)}-item runs; the figures are not comparable.")
+    regressions = compare(baseline["results"], results, args.tolerance) if baseline else []
+    if regressions:
+        print("Regressions: " + "; ".join(regressions))
+    sys.exit(1 if failed or regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
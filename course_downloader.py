@@ -1,38 +1,60 @@
 import os
 import time
 import getpass
+import hashlib
+import json
+import logging
+import email.utils
 import re
 import requests
 import shutil
+import socket
+import sqlite3
+import struct
+import sys
+import tarfile
+import tempfile
 import threading
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-import customtkinter as ctk
+import functools
+import cProfile
+import pstats
+import multiprocessing
+import queue
+import random
+import zipfile
+from collections import Counter, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from html.parser import HTMLParser
+from urllib.parse import urlparse, urljoin, parse_qs, unquote, urlencode
 
-ctk.set_appearance_mode("Dark")
-ctk.set_default_color_theme("blue")
-
-
-
-# --- Selenium Imports (for multi-browser support) ---
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException
-
-# Firefox specific
-from selenium.webdriver.firefox.service import Service as FirefoxService
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
-
-# Chrome specific
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.chrome.options import Options as ChromeOptions
-from webdriver_manager.chrome import ChromeDriverManager
+# --- Selenium (imported on first use, see _import_selenium; HTTP-only runs never load it) ---
+webdriver = By = WebDriverWait = EC = None
+TimeoutException = NoSuchElementException = None
 
 
 # --- Constants and Mappings ---
+# Status callbacks take (message, level=logging.INFO). Per-item lines (found, queued, saved, skipped...) are sent at
+# DETAIL so a log view can hide them; failures at logging.WARNING
+DETAIL = logging.DEBUG
 BASE_URL = "https://blackboard.kfupm.edu.sa/"
+# Per-user settings and local state (saved settings, download manifest) live here
+CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".kfupm_bb_downloader")
+MANIFEST_PATH = os.path.join(CONFIG_DIR, "manifest.sqlite3")
+DEFAULT_DOWNLOAD_DIR = os.path.join(os.path.expanduser("~"), "Desktop", "KFUPM_Blackboard_Downloads")
+# Login cookies are cached here and reused until they expire (or fail the check against SESSION_CHECK_URL)
+SESSION_CACHE_PATH = os.path.join(CONFIG_DIR, "session.json")
+SESSION_CHECK_URL = BASE_URL + "webapps/portal/execute/defaultTab"
+SAVED_SESSION_MAX_AGE = 3 * 60 * 60 # For cookies without their own expiry (Blackboard's session cookies)
+# The last scanned course list per account; shown instantly on launch, rescanned in the background after the TTL
+CATALOG_CACHE_PATH = os.path.join(CONFIG_DIR, "catalog.json")
+DEFAULT_CATALOG_TTL_HOURS = 24
+# Batch jobs (see SQLiteWorkQueue): the default work queue, how long a task stays leased to a worker without a
+# heartbeat, how often a task is tried, and how often idle workers look for new tasks (seconds)
+JOBS_QUEUE_PATH = os.path.join(CONFIG_DIR, "jobs.sqlite3")
+JOB_LEASE_SECONDS = 300
+JOB_MAX_ATTEMPTS = 3
+JOB_POLL_INTERVAL = 5
 MIME_TYPE_MAP = {
     'application/pdf': '.pdf', 'application/vnd.ms-powerpoint': '.ppt',
     'application/vnd.openxmlformats-officedocument.presentationml.presentation': '.pptx',
@@ -44,16 +66,430 @@ MIME_TYPE_MAP = {
     'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif', 'text/plain': '.txt',
     'application/x-ipynb+json': '.ipynb', 'application/octet-stream': ''
 }
+# Download concurrency: worker threads per run and simultaneous transfers allowed against one host
+DEFAULT_DOWNLOAD_WORKERS = 4
+# Courses processed at the same time, each in its own worker process
+DEFAULT_COURSE_WORKERS = 1
+MAX_CONNECTIONS_PER_HOST = 8
+# Pacing (see RateLimits): a 429/503 answer pauses its server for the Retry-After it gives (capped at MAX_RETRY_AFTER
+# seconds), and RetryPolicy waits at least that long before trying again; the per-host concurrency is halved at most
+# once per BACKOFF_COOLDOWN seconds
+MAX_RETRY_AFTER = 300
+BACKOFF_COOLDOWN = 2.0
+# Retries (see RetryPolicy): transient failures are retried up to RETRY_ATTEMPTS times in all, with exponential backoff
+# and full jitter; a server failing BREAKER_THRESHOLD times in a row is left alone for BREAKER_COOLDOWN seconds
+RETRY_ATTEMPTS = 4
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 60.0
+# In-progress downloads are written to '<name>.part' until complete, with a '.resume-<URL hash>.part.json' record of
+# the URL and validator beside it
+PART_SUFFIX = ".part"
+# Response bodies are read and written in chunks of about 1/64 of the file, between these bounds, so small files
+# stay responsive and a 2 GB recording takes a few thousand Python-level iterations instead of a quarter million
+WRITE_CHUNK_MIN = 64 * 1024
+WRITE_CHUNK_MAX = 4 * 1024 * 1024
+# Content-addressed copies of downloaded files (see BlobStore), kept in this folder inside the download folder
+BLOB_STORE_DIRNAME = ".kfupm_blobs"
+# Archive output (see ArchiveEngine): file bodies are held in memory up to this size (beyond it in a temporary file
+# next to the archive) until the archive's writer thread compresses them; at most ARCHIVE_QUEUE_SIZE wait
+ARCHIVE_SPOOL_BYTES = 16 * 1024 * 1024
+ARCHIVE_QUEUE_SIZE = 8
+ARCHIVE_ZSTD_LEVEL = 3
+# Stored in zip archives as they are: these formats are compressed already
+ARCHIVE_STORED_EXTENSIONS = {'.zip', '.rar', '.7z', '.gz', '.mp4', '.mov', '.avi', '.mkv', '.webm', '.jpg', '.png', '.gif',
+                             '.docx', '.pptx', '.xlsx'}
+# Timeout (seconds) for fetching a single Blackboard page over HTTP
+PAGE_FETCH_TIMEOUT = 60
+# Folder pages fetched concurrently while crawling a section over HTTP
+DEFAULT_CRAWL_WORKERS = 4
+# Folders nested deeper than this below a section are not crawled (a guard against endless link chains)
+MAX_FOLDER_DEPTH = 32
+# A folder listing the same items as on the last run can have its sub-folders taken from the manifest instead of
+# crawled again (see FolderListings), as long as they were all crawled within this many hours. Opt-in (the GUI's quick
+# re-sync, --folder-reuse-hours): a file added deep inside an unchanged folder is only found once that time is up
+DEFAULT_FOLDER_REUSE_HOURS = 0
+# Discovered-but-not-yet-downloaded items buffered between the crawler and the download workers
+DOWNLOAD_QUEUE_SIZE = 64
 # Define the sections to scrape within each course
 TARGET_COURSE_SECTIONS = ["Course Content", "Course Syllabus", "Assignments", "Assessments / Tests"]
 
+def set_base_url(url):
+    """Points the downloader at another Blackboard instance (or a local test server)."""
+    global BASE_URL, SESSION_CHECK_URL
+    BASE_URL = url if url.endswith("/") else url + "/"
+    SESSION_CHECK_URL = BASE_URL + "webapps/portal/execute/defaultTab"
+
+
+def read_settings(path=None):
+    """Returns the saved name=value settings from CONFIG_DIR/config.ini as a dict of strings ({} if there are none)."""
+    settings = {}
+    try:
+        with open(path or os.path.join(CONFIG_DIR, "config.ini"), "r") as f:
+            for line in f:
+                if "=" in line:
+                    name, value = line.strip().split("=", 1)
+                    settings[name] = value
+    except FileNotFoundError:
+        pass
+    return settings
+
+
 # --- Backend Web Scraping Logic ---
 
+# --- Run metrics ---
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms describing a run (the module-wide METRICS). Thread-safe. A series is
+    a metric name plus labels; histograms keep cumulative bucket counts, their sum and count. snapshot()
+    returns a JSON-serialisable copy that merge() adds into another registry - how course worker processes
+    report back to the parent - and write_json()/write_prometheus() export the registry for monitoring.
+    """
+    def __init__(self, prefix="kfupm_bb_"):
+        self.prefix = prefix
+        self._definitions = {} # name -> (kind, help text, histogram buckets)
+        self._series = {}      # name -> {sorted label pairs: number, or histogram dict}
+        self._lock = threading.Lock()
+
+    def define(self, name, kind, help_text, buckets=None):
+        self._definitions[name] = (kind, help_text, tuple(buckets) if buckets else ())
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._series.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        buckets = self._definitions[name][2]
+        with self._lock:
+            series = self._series.setdefault(name, {})
+            histogram = series.setdefault(key, {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observes the seconds spent in the with-block (also when it raises) in histogram name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+    def snapshot(self):
+        with self._lock:
+            return {name: [{"labels": dict(key), "value": value if not isinstance(value, dict) else
+                            {"buckets": list(value["buckets"]), "sum": value["sum"], "count": value["count"]}}
+                           for key, value in series.items()]
+                    for name, series in self._series.items()}
+
+    def merge(self, snapshot):
+        """Adds a snapshot() from elsewhere: counters and histograms are summed, gauges take the new value."""
+        for name, entries in snapshot.items():
+            kind = self._definitions.get(name, ("counter",))[0]
+            with self._lock:
+                series = self._series.setdefault(name, {})
+                for entry in entries:
+                    key, value = tuple(sorted(entry["labels"].items())), entry["value"]
+                    if kind == "gauge" or key not in series:
+                        series[key] = value if not isinstance(value, dict) else {**value, "buckets": list(value["buckets"])}
+                    elif kind == "histogram":
+                        current = series[key]
+                        current["buckets"] = [a + b for a, b in zip(current["buckets"], value["buckets"])]
+                        current["sum"] += value["sum"]
+                        current["count"] += value["count"]
+                    else:
+                        series[key] += value
+
+    def write_json(self, path, summary=None):
+        """Writes {"summary": ..., "metrics": snapshot()} to path (atomically)."""
+        _write_text_atomically(path, json.dumps({"summary": summary or {}, "metrics": self.snapshot()}, indent=2))
+
+    def write_prometheus(self, path):
+        """Writes the registry in Prometheus text format, e.g. for node_exporter's textfile collector (a *.prom file)."""
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+            return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+        lines = []
+        snapshot = {name: [(tuple(sorted(e["labels"].items())), e["value"]) for e in entries] for name, entries in self.snapshot().items()}
+        for name, (kind, help_text, buckets) in self._definitions.items():
+            if name not in snapshot:
+                continue
+            full_name = self.prefix + name
+            lines += [f"# HELP {full_name} {help_text}", f"# TYPE {full_name} {kind}"]
+            for labels, value in snapshot[name]:
+                if kind == "histogram":
+                    for bound, count in zip(buckets, value["buckets"]):
+                        lines.append(f"{full_name}_bucket{label_text(labels, [('le', f'{bound:g}')])} {count}")
+                    lines.append(f"{full_name}_bucket{label_text(labels, [('le', '+Inf')])} {value['count']}")
+                    lines.append(f"{full_name}_sum{label_text(labels)} {value['sum']}")
+                    lines.append(f"{full_name}_count{label_text(labels)} {value['count']}")
+                else:
+                    lines.append(f"{full_name}{label_text(labels)} {value}")
+        _write_text_atomically(path, "\n".join(lines) + "\n")
+
+
+def _write_text_atomically(path, text):
+    # Readers (node_exporter, dashboards) must never see a half-written file
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+THROUGHPUT_BUCKETS = (1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+
+METRICS = MetricsRegistry()
+METRICS.define("phase_seconds", "histogram", "Time spent per phase (driver_setup, login, term_scan, section_discovery, section_crawl, download_batch, download_wait).", SECONDS_BUCKETS)
+METRICS.define("page_fetch_seconds", "histogram", "Time to load one Blackboard page while crawling, by how it was loaded.", SECONDS_BUCKETS)
+METRICS.define("file_ttfb_seconds", "histogram", "Time from sending a file request to receiving its response headers.", SECONDS_BUCKETS)
+METRICS.define("file_transfer_seconds", "histogram", "Time spent receiving one file body.", SECONDS_BUCKETS)
+METRICS.define("file_throughput_bytes_per_second", "histogram", "Transfer rate of each downloaded file body.", THROUGHPUT_BUCKETS)
+METRICS.define("bytes_downloaded_total", "counter", "Body bytes written to disk.")
+METRICS.define("items_total", "counter", "Processed items by outcome (saved, skipped, failed, linked; new, changed... when planning).")
+METRICS.define("items_deduplicated_total", "counter", "Saved items served from content already on disk.")
+METRICS.define("folders_total", "counter", "Folders while crawling: walked (listed and descended into), unchanged (listed, subtree reused) or reused (not fetched).")
+METRICS.define("http_requests_total", "counter", "HTTP requests sent, by method and status code (or 'error').")
+METRICS.define("retries_total", "counter", "Retries after transient failures.")
+METRICS.define("circuit_breaker_trips_total", "counter", "Times a host's circuit breaker opened.")
+METRICS.define("run_started_timestamp_seconds", "gauge", "Start of the last run (Unix time).")
+METRICS.define("run_duration_seconds", "gauge", "Duration of the last run.")
+METRICS.define("run_success", "gauge", "1 if the last run finished without errors or failed items, else 0.")
+
+
+def timed_phase(phase):
+    """Decorator recording each call of the function in the phase_seconds histogram under phase (and as a trace span)."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with TRACER.span(phase, "phase"), METRICS.timer("phase_seconds", phase=phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def export_run_metrics(json_path=None, textfile_path=None, job="download", started_at=None, succeeded=True):
+    """Stamps the run gauges into METRICS and writes the JSON summary and/or the Prometheus textfile."""
+    finished_at = time.time()
+    started_at = started_at or finished_at
+    METRICS.set("run_started_timestamp_seconds", started_at, job=job)
+    METRICS.set("run_duration_seconds", finished_at - started_at, job=job)
+    METRICS.set("run_success", 1 if succeeded else 0, job=job)
+    if json_path:
+        METRICS.write_json(json_path, {"job": job, "started_at": started_at, "duration_seconds": finished_at - started_at, "succeeded": succeeded})
+    if textfile_path:
+        METRICS.write_prometheus(textfile_path)
+
+
+# --- Tracing ---
+
+class _Span:
+    """A span being recorded; see Tracer.span. The with-block gets the span's attribute dict to add to."""
+    __slots__ = ("tracer", "name", "category", "attrs", "start")
+
+    def __init__(self, tracer, name, category, attrs):
+        self.tracer, self.name, self.category, self.attrs = tracer, name, category, attrs
+
+    def __enter__(self):
+        self.tracer._enter_thread()
+        self.start = self.tracer._now_us()
+        return self.attrs
+
+    def __exit__(self, exc_type, exc, tb):
+        end = self.tracer._now_us()
+        if exc_type is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer._record(self.name, self.category, self.start, end - self.start, self.attrs)
+        self.tracer._exit_thread()
+        return False
+
+
+class _NullSpan:
+    """What Tracer.span returns while tracing is off: no timing, and attributes go to a throwaway dict."""
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Opt-in span recorder (the module-wide TRACER); does nothing until start(). span() marks a timed,
+    nested piece of work on the current thread - phase, course, section, folder page, WebDriver wait, file -
+    with attributes such as URL, bytes and status. write() saves the spans in Chrome trace format
+    (chrome://tracing, ui.perfetto.dev), one timeline row per process and thread, so serialised work
+    and idle gaps show directly. Worker processes send their events() back to be add_events()ed.
+    With a profile_dir, every thread also runs under cProfile while inside a span; write_profiles() saves
+    one '<pid>-<thread name>.prof' per thread there (on Python 3.12+, where a profiler always sees all
+    threads, one '<pid>-all-threads.prof' per process).
+    """
+    def __init__(self):
+        self.enabled = False
+        self.profile_dir = None
+        self._events = []
+        self._thread_names = {} # (pid, tid) -> thread name, for the trace's metadata
+        self._profilers = [] # (thread name, cProfile.Profile)
+        self._process_profiler = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._epoch_us = 0.0
+
+    def start(self, profile_dir=None):
+        """Starts recording (again, from scratch). Timestamps are wall-clock microseconds, comparable across processes."""
+        with self._lock:
+            self._events = []
+            self._thread_names = {}
+            self._profilers = []
+        self._local = threading.local()
+        self._epoch_us = time.time() * 1e6 - time.perf_counter() * 1e6
+        self.profile_dir = profile_dir
+        if profile_dir and sys.version_info >= (3, 12):
+            self._process_profiler = cProfile.Profile()
+            self._process_profiler.enable()
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+        if self._process_profiler:
+            self._process_profiler.disable()
+
+    def span(self, name, category="run", /, **attrs):
+        """Context manager timing its with-block as a span; `as` gives the attribute dict, to add results to."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, category, attrs)
+
+    def _now_us(self):
+        return self._epoch_us + time.perf_counter() * 1e6
+
+    def _enter_thread(self):
+        local = self._local
+        depth = getattr(local, "depth", 0)
+        local.depth = depth + 1
+        if depth == 0 and self.profile_dir and not self._process_profiler:
+            # The outermost span of this thread: profile everything it does until that span ends
+            profiler = getattr(local, "profiler", None)
+            if profiler is None:
+                profiler = local.profiler = cProfile.Profile()
+                with self._lock:
+                    self._profilers.append((threading.current_thread().name, profiler))
+            profiler.enable()
+
+    def _exit_thread(self):
+        local = self._local
+        local.depth -= 1
+        if local.depth == 0 and getattr(local, "profiler", None) is not None:
+            local.profiler.disable()
+
+    def _record(self, name, category, start, duration, attrs):
+        pid, tid = os.getpid(), threading.get_ident()
+        event = {"name": name, "cat": category, "ph": "X", "ts": start, "dur": duration, "pid": pid, "tid": tid, "args": attrs}
+        with self._lock:
+            self._events.append(event)
+            if (pid, tid) not in self._thread_names:
+                self._thread_names[(pid, tid)] = threading.current_thread().name
+
+    def events(self):
+        """The recorded spans plus the thread-name metadata, as Chrome trace events (JSON-serialisable)."""
+        with self._lock:
+            metadata = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                        for (pid, tid), name in self._thread_names.items()]
+            return metadata + [{**event, "args": {k: v if isinstance(v, (int, float, bool, type(None))) else str(v)
+                                                   for k, v in event["args"].items()}} for event in self._events]
+
+    def add_events(self, events):
+        with self._lock:
+            self._events.extend(e for e in events if e.get("ph") != "M")
+            self._thread_names.update(((e["pid"], e["tid"]), e["args"]["name"]) for e in events if e.get("ph") == "M")
+
+    def write(self, path):
+        """Writes the trace as Chrome trace JSON (atomically), and the thread profiles if profiling."""
+        events = self.events()
+        processes = sorted({event["pid"] for event in events})
+        events += [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "downloader" if pid == os.getpid() else f"course worker {pid}"}}
+                   for pid in processes]
+        _write_text_atomically(path, json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+        self.write_profiles()
+
+    def write_profiles(self):
+        if not self.profile_dir:
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        by_thread = {}
+        if self._process_profiler:
+            self._process_profiler.disable()
+            by_thread["all-threads"] = [self._process_profiler]
+        with self._lock:
+            for thread_name, profiler in self._profilers:
+                by_thread.setdefault(thread_name, []).append(profiler)
+        for thread_name, profilers in by_thread.items():
+            # Pool threads come and go under the same names, and a worker process may run several courses:
+            # one file per process and thread name sums them all up
+            path = os.path.join(self.profile_dir, f"{os.getpid()}-{re.sub(r'[^A-Za-z0-9_.-]', '_', thread_name)}.prof")
+            stats = pstats.Stats(*profilers)
+            if os.path.exists(path):
+                stats.add(path)
+            stats.dump_stats(path)
+
+
+TRACER = Tracer()
+
+
+def _import_selenium():
+    """Loads Selenium into this module's globals the first time a browser is actually needed."""
+    global webdriver, By, WebDriverWait, EC, TimeoutException, NoSuchElementException
+    if webdriver is not None:
+        return
+    from selenium import webdriver as _webdriver
+    from selenium.webdriver.common.by import By as _By
+    from selenium.webdriver.support.ui import WebDriverWait as _WebDriverWait
+    from selenium.webdriver.support import expected_conditions as _EC
+    from selenium.common.exceptions import TimeoutException as _TimeoutException, NoSuchElementException as _NoSuchElementException
+    By, WebDriverWait, EC = _By, _WebDriverWait, _EC
+    TimeoutException, NoSuchElementException = _TimeoutException, _NoSuchElementException
+    webdriver = _webdriver
+
+
+def _wait_until(wait, condition, target):
+    """wait.until(condition), traced as a 'webdriver_wait' span for target (what is waited for)."""
+    with TRACER.span("webdriver_wait", "browser", target=target):
+        return wait.until(condition)
+
+
+@timed_phase("driver_setup")
 def setup_driver(browser_choice, status_callback, headless=True):
     """
     Sets up a Selenium WebDriver based on the user's explicit choice.
     """
+    _import_selenium()
     if browser_choice == "firefox":
+        from selenium.webdriver.firefox.service import Service as FirefoxService
+        from selenium.webdriver.firefox.options import Options as FirefoxOptions
         status_callback("Initializing Firefox driver...")
         options = FirefoxOptions()
         if headless:
@@ -72,6 +508,9 @@ def setup_driver(browser_choice, status_callback, headless=True):
             raise RuntimeError(f"Failed to initialize Firefox. Is it installed and geckodriver in PATH? Error: {e}")
 
     elif browser_choice == "chrome":
+        from selenium.webdriver.chrome.service import Service as ChromeService
+        from selenium.webdriver.chrome.options import Options as ChromeOptions
+        from webdriver_manager.chrome import ChromeDriverManager
         status_callback("Initializing Chrome driver...")
         options = ChromeOptions()
         if headless:
@@ -92,28 +531,146 @@ def setup_driver(browser_choice, status_callback, headless=True):
         raise ValueError("Invalid browser choice specified.")
 
 
+@timed_phase("login")
 def login(driver, username, password):
+    _import_selenium()
     driver.get(BASE_URL)
     wait = WebDriverWait(driver, 20)
-    user_field = wait.until(EC.presence_of_element_located((By.ID, "user_id")))
+    user_field = _wait_until(wait, EC.presence_of_element_located((By.ID, "user_id")), "login form")
     pass_field = driver.find_element(By.ID, "password")
     login_button = driver.find_element(By.ID, "entry-login")
     user_field.send_keys(username)
     pass_field.send_keys(password)
     login_button.click()
-    wait.until(EC.presence_of_element_located((By.ID, "module:_4_1"))) # Courses module
+    _wait_until(wait, EC.presence_of_element_located((By.ID, "module:_4_1")), "courses module")
     return driver.get_cookies()
 
 
+def _is_login_page(html):
+    return 'id="user_id"' in html and 'id="entry-login"' in html
+
+
+def _write_private_json(path, data):
+    """Atomically writes data as JSON to a file only the current user can read."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # A temporary file of its own (mkstemp creates it 0600), so processes saving the same file at once never write into each other's
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+    except BaseException:
+        try: os.remove(temp_path)
+        except OSError: pass
+        raise
+
+
+def save_session_cookies(username, login_cookies, user_agent=None, path=SESSION_CACHE_PATH):
+    """
+    Stores the cookies returned by login() for username, with the time they expire, so later
+    scans/downloads (and later app launches) can skip the browser login. The file is created
+    readable by the current user only.
+    """
+    cookie_expiries = [c['expiry'] for c in login_cookies if c.get('expiry')]
+    saved_at = time.time()
+    expires_at = min(cookie_expiries + [saved_at + SAVED_SESSION_MAX_AGE])
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            sessions = json.load(f)
+    except (OSError, ValueError):
+        sessions = {}
+    sessions = {user: entry for user, entry in sessions.items() if entry.get('expires_at', 0) > saved_at} # Drop stale accounts
+    sessions[username] = {"cookies": login_cookies, "user_agent": user_agent, "saved_at": saved_at, "expires_at": expires_at}
+    _write_private_json(path, sessions)
+
+
+def load_session_cookies(username, path=SESSION_CACHE_PATH):
+    """Returns (cookies, user_agent) saved for username, or None if there are none or they have expired."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f).get(username)
+    except (OSError, ValueError):
+        return None
+    if not entry or entry.get('expires_at', 0) <= time.time():
+        return None
+    return entry['cookies'], entry.get('user_agent')
+
+
+def forget_session_cookies(username, path=SESSION_CACHE_PATH):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            sessions = json.load(f)
+        if sessions.pop(username, None) is not None:
+            _write_private_json(path, sessions)
+    except (OSError, ValueError):
+        pass
+
+
+def session_is_authenticated(session):
+    """One cheap request to a page that needs a login; False if Blackboard answers with the login form."""
+    try:
+        r = session.get(SESSION_CHECK_URL, timeout=30, allow_redirects=True)
+        return r.ok and not _is_login_page(r.text)
+    except requests.exceptions.RequestException:
+        return False
+
+
+def attach_cookies_to_driver(driver, login_cookies):
+    """Puts saved login cookies into a fresh driver so it is logged in without submitting the form."""
+    driver.get(BASE_URL)
+    for cookie in login_cookies:
+        driver.add_cookie({k: v for k, v in cookie.items() if k in ("name", "value", "domain", "path", "secure", "httpOnly", "expiry")})
+
+
+def get_authenticated_session(username, password, browser_choice, headless, status_callback, keep_driver=False):
+    """
+    Returns (session, driver, login_cookies) for a logged-in Blackboard account.
+    Saved cookies are reused when a cheap check shows they are still valid; only otherwise is a
+    browser started to log in (and the fresh cookies saved). driver is the logged-in browser when
+    keep_driver is set and a login was needed, else None (the caller can attach_cookies_to_driver()).
+    """
+    saved = load_session_cookies(username)
+    if saved:
+        login_cookies, user_agent = saved
+        session = build_session(login_cookies, user_agent)
+        if session_is_authenticated(session):
+            status_callback("Reusing saved Blackboard session (no browser login needed).")
+            return session, None, login_cookies
+        status_callback("Saved Blackboard session is no longer valid; logging in again.")
+        forget_session_cookies(username)
+
+    driver = setup_driver(browser_choice, status_callback, headless)
+    try:
+        status_callback("Logging in to Blackboard...")
+        login_cookies = login(driver, username, password)
+        user_agent = driver.execute_script("return navigator.userAgent;")
+        status_callback("Login successful.")
+        try:
+            save_session_cookies(username, login_cookies, user_agent)
+        except OSError as e_save:
+            status_callback(f"Note: Could not save the login session for reuse: {e_save}")
+    except Exception:
+        driver.quit()
+        raise
+    if not keep_driver:
+        try: driver.quit()
+        except Exception as e_quit: status_callback(f"Note: Error quitting driver after login: {e_quit}")
+        driver = None
+    return build_session(login_cookies, user_agent), driver, login_cookies
+
+
 # --- Reverted to user's original get_all_terms_and_courses logic ---
 # Minimal changes: added sanitization for term_name in the dict for consistency.
+@timed_phase("term_scan")
 def get_all_terms_and_courses(driver, status_callback):
+    _import_selenium()
     status_callback("Scanning for all available terms and courses...")
     all_courses = []
     try:
         wait = WebDriverWait(driver, 20)
         # Using the XPath from your original code
-        term_headers = wait.until(EC.presence_of_all_elements_located((By.XPATH, "//h3[contains(@class, 'termHeading-coursefakeclass')]")))
+        term_headers = _wait_until(wait, EC.presence_of_all_elements_located((By.XPATH, "//h3[contains(@class, 'termHeading-coursefakeclass')]")), "term headings")
         
         if not term_headers:
             status_callback("No term headers found with class 'termHeading-coursefakeclass'. Page structure might have changed or no courses available.")
@@ -141,7 +698,7 @@ def get_all_terms_and_courses(driver, status_callback):
                     # Using the click logic from your original code
                     header_link = term_header.find_element(By.TAG_NAME, "a") # Assumes H3 has an A for expansion
                     driver.execute_script("arguments[0].click();", header_link)
-                    wait.until(EC.visibility_of(course_container))
+                    _wait_until(wait, EC.visibility_of(course_container), f"courses of {term_name_clean}")
                     status_callback(f"  - Expanded term: {term_name_clean}")
                 except Exception as e_click:
                     status_callback(f"  - Could not expand term {term_name_clean}: {e_click}. Courses might be hidden.")
@@ -179,901 +736,3612 @@ def get_all_terms_and_courses(driver, status_callback):
     return all_courses
 
 
-def scrape_page_for_content(driver, content_map, status_callback, current_relative_path=""):
+# --- Page item extraction ---
+# Both crawlers (the Selenium one and the browser-free HTTP one) reduce every 'li.liItem' of a
+# listContent.jsp page to the same plain dict, so the folder/attachment/link classification below
+# is shared and produces identical content_map entries:
+#   {"title": <h3 text, or None if the item has no title h3>, "fallback_title": <text of the first link, None if it has none>,
+#    "folder_url": <listContent.jsp link inside the title, or None>,
+#    "attachments": [{"text", "url"}, ...] from 'div.details ul.attachments',
+#    "links": [{"tag": "a"|"video"|"img", "text", "url"}, ...] candidate files/web links/media}
+
+# XPath selectors shared by the per-element extractor and the single-call JavaScript extractor
+_FOLDER_LINK_XPATH = ".//div[contains(@class,'item')]//h3//a[contains(@href, '/listContent.jsp?')]"
+_ATTACHMENTS_UL_XPATH = ".//div[contains(@class, 'details')]//ul[contains(@class, 'attachments')]"
+_GENERAL_CONTENT_XPATH = (
+    ".//a[@href[ (contains(.,'/bbcswebdav/')) or " +
+    "(starts-with(.,'http') and not(starts-with(.,'javascript:')) and .!='#') ] and not(contains(@href, '/listContent.jsp?')) ] | " +
+    ".//video[@src[starts-with(.,'http') or contains(.,'/bbcswebdav/')]] | " +
+    ".//img[@src[starts-with(.,'http') or contains(.,'/bbcswebdav/')]]"
+)
+
+# Builds the whole item list in the browser and returns it as JSON in a single WebDriver call.
+# Arguments: the three XPath selectors above. Mirrors _extract_list_items_from_driver_elements exactly.
+_EXTRACT_ITEMS_JS = """
+var folderXPath = arguments[0], attachmentsXPath = arguments[1], generalXPath = arguments[2];
+var container = document.getElementById('content_listContainer');
+if (!container) { return null; }
+function text(el) { return (el.innerText || el.textContent || '').trim(); }
+function first(xpath, context) {
+    return document.evaluate(xpath, context, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+}
+function all(xpath, context) {
+    var result = document.evaluate(xpath, context, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null), nodes = [];
+    for (var i = 0; i < result.snapshotLength; i++) { nodes.push(result.snapshotItem(i)); }
+    return nodes;
+}
+var items = [];
+var lis = container.querySelectorAll("li.liItem[id^='contentListItem:']");
+for (var i = 0; i < lis.length; i++) {
+    var li = lis[i];
+    var item = {title: null, fallback_title: null, folder_url: null, attachments: [], links: []};
+    var h3 = li.querySelector("div.item > h3, div.item > div.itemHead > h3");
+    if (h3) { item.title = text(h3); }
+    else { var anyLink = li.querySelector("a"); if (anyLink) { item.fallback_title = text(anyLink); } }
+    var folderLink = first(folderXPath, li);
+    if (folderLink && folderLink.href) { item.folder_url = folderLink.href; items.push(item); continue; }
+    var attachmentsUl = first(attachmentsXPath, li);
+    if (attachmentsUl) {
+        all(".//a[@href]", attachmentsUl).forEach(function (a) { item.attachments.push({text: text(a), url: a.href}); });
+    }
+    all(generalXPath, li).forEach(function (el) {
+        var tag = el.tagName.toLowerCase();
+        item.links.push({tag: tag, text: tag === 'a' ? text(el) : '', url: el.href || el.src || null});
+    });
+    items.push(item);
+}
+return items;
+"""
+
+
+def _extract_list_items_from_driver(driver, status_callback=None):
+    """
+    Reads the items of the page currently loaded in the driver. Returns None if the page has no content list.
+    Everything is collected by one execute_script call; the per-element WebDriver queries are only a fallback.
+    """
+    _import_selenium()
     wait = WebDriverWait(driver, 10)
     try:
-        content_list_container = wait.until(EC.presence_of_element_located((By.ID, "content_listContainer")))
-        # Find all top-level list items on the current page
-        content_list_items = content_list_container.find_elements(By.CSS_SELECTOR, "li.liItem[id^='contentListItem:']")
+        content_list_container = _wait_until(wait, EC.presence_of_element_located((By.ID, "content_listContainer")), "content list")
     except TimeoutException:
-        status_callback(f"  - No 'content_listContainer' or 'liItem' found on current page ({driver.current_url}). Might be empty or structured differently in '{current_relative_path}'.")
-        return
+        return None
+    try:
+        items = driver.execute_script(_EXTRACT_ITEMS_JS, _FOLDER_LINK_XPATH, _ATTACHMENTS_UL_XPATH, _GENERAL_CONTENT_XPATH)
+        if items is not None:
+            return items
+    except Exception as e_script:
+        if status_callback: status_callback(f"    - Script extraction failed ({type(e_script).__name__}); reading items element by element.")
+    return _extract_list_items_from_driver_elements(content_list_container)
 
-    folders_to_visit_recursively = [] # Stores info about BB Folders to scan after processing current page items
 
-    for item_idx, li_element in enumerate(content_list_items):
-        item_title_str = f"Untitled Item {item_idx+1}"
+def _extract_list_items_from_driver_elements(content_list_container):
+    """One WebDriver round-trip per query - slow on big pages, kept as the fallback for _extract_list_items_from_driver."""
+    # Find all top-level list items on the current page
+    content_list_items = content_list_container.find_elements(By.CSS_SELECTOR, "li.liItem[id^='contentListItem:']")
+
+    items = []
+    for li_element in content_list_items:
+        item = {"title": None, "fallback_title": None, "folder_url": None, "attachments": [], "links": []}
         try:
             # Prefer title from H3 inside div.item or div.itemHead
-            title_h3_element = li_element.find_element(By.CSS_SELECTOR, "div.item > h3, div.item > div.itemHead > h3")
-            item_title_str = title_h3_element.text.strip()
+            item["title"] = li_element.find_element(By.CSS_SELECTOR, "div.item > h3, div.item > div.itemHead > h3").text.strip()
         except NoSuchElementException:
             try: # Fallback: try any link text within the item if h3 not found or empty
-                any_link_in_item = li_element.find_element(By.CSS_SELECTOR, "a")
-                if any_link_in_item.text.strip():
-                    item_title_str = any_link_in_item.text.strip()
+                item["fallback_title"] = li_element.find_element(By.CSS_SELECTOR, "a").text.strip()
             except NoSuchElementException:
-                status_callback(f"    - Could not determine title for an item in '{current_relative_path}'. Using default name.")
-
-        # Sanitize title for use as a folder or file name component
-        clean_item_title_as_path_segment = re.sub(r'[\\/*?:"<>|]', "_", item_title_str) if item_title_str else f"untitled_item_{item_idx}"
+                pass
 
-        # --- Stage 1: Check if the li_element represents a Blackboard Folder ---
-        # These folders navigate to another listContent.jsp page.
         try:
             # Look for a folder link specifically within the item's main title area (e.g., inside H3's <a>)
-            folder_link_tag = li_element.find_element(By.XPATH, ".//div[contains(@class,'item')]//h3//a[contains(@href, '/listContent.jsp?')]")
-            folder_url_value = folder_link_tag.get_attribute("href")
-            if folder_url_value:
-                folders_to_visit_recursively.append({
-                    "name": clean_item_title_as_path_segment, # This will be the subfolder name for recursion
-                    "url": folder_url_value
-                })
-                status_callback(f"    Identified BB Folder: '{item_title_str}'. Will be scanned recursively into subfolder '{clean_item_title_as_path_segment}'.")
-                continue # This li_element is a folder; move to the next li_element in content_list_items
+            folder_link_tag = li_element.find_element(By.XPATH, _FOLDER_LINK_XPATH)
+            item["folder_url"] = folder_link_tag.get_attribute("href")
+            if item["folder_url"]:
+                items.append(item)
+                continue # Folders are not inspected any further
         except NoSuchElementException:
-            # This li_element is not a standard Blackboard Folder based on its main H3 link.
             pass
 
-        # --- Stage 2: Check if the li_element has an "Attached Files" section ---
-        # (e.g., an Assignment item with multiple attached PDFs like your "Assignment 3" example)
-        # These attachments should go into a subfolder named after the li_element's title.
-        attachments_were_processed_for_this_item = False
         try:
             # Standard Blackboard structure for attachments (based on your HTML example)
-            attachments_ul_container = li_element.find_element(By.XPATH, ".//div[contains(@class, 'details')]//ul[contains(@class, 'attachments')]")
-            attachment_links_in_ul = attachments_ul_container.find_elements(By.XPATH, ".//a[@href]")
-
-            if attachment_links_in_ul:
-                attachments_were_processed_for_this_item = True
-                # Create a subfolder path using the item's title for its attachments
-                path_for_these_item_attachments = os.path.join(current_relative_path, clean_item_title_as_path_segment)
-                status_callback(f"    Item '{item_title_str}' has an 'Attachments' section. Files will be saved in subfolder: '{path_for_these_item_attachments}'")
-
-                for attachment_link_tag in attachment_links_in_ul:
-                    attachment_url = attachment_link_tag.get_attribute("href")
-                    if not attachment_url or "javascript:void(0)" in attachment_url or attachment_url.strip() == "#":
-                        continue
-
-                    # Use the attachment's own link text as its name
-                    attachment_name_raw = attachment_link_tag.text.strip()
-                    # Sanitize attachment filename (though process_content_list does more thorough cleaning later)
-                    attachment_filename_candidate = attachment_name_raw if attachment_name_raw else os.path.basename(attachment_url.split('?')[0])
-                    clean_attachment_filename = re.sub(r'[\\/*?:"<>|]', "_", attachment_filename_candidate)
-
-                    if "/bbcswebdav/" in attachment_url:
-                        content_map.append({
-                            "type": "File", "url": attachment_url,
-                            "name": clean_attachment_filename, "path": path_for_these_item_attachments
-                        })
-                        status_callback(f"      Found Attached File: '{clean_attachment_filename}' for item '{item_title_str}'.")
-                    elif attachment_url.startswith("http") and BASE_URL.split('/')[2] not in attachment_url: # External web link
-                        content_map.append({
-                            "type": "WebLink", "url": attachment_url,
-                            "name": clean_attachment_filename, "path": path_for_these_item_attachments
-                        })
-                        status_callback(f"      Found Attached WebLink: '{clean_attachment_filename}' for item '{item_title_str}'.")
-
-                # If an item has an "Attachments" section, assume its main link (e.g., to uploadAssignment page) is not a downloadable file itself.
-                continue # Move to the next li_element in content_list_items
+            attachments_ul_container = li_element.find_element(By.XPATH, _ATTACHMENTS_UL_XPATH)
+            for attachment_link_tag in attachments_ul_container.find_elements(By.XPATH, ".//a[@href]"):
+                item["attachments"].append({"text": attachment_link_tag.text.strip(), "url": attachment_link_tag.get_attribute("href")})
         except NoSuchElementException:
-            # No "div.details ul.attachments" structure found, or no links within it.
-            pass # Proceed to check for general/direct links if this item wasn't an attachment container
+            pass
 
-        # --- Stage 3: If not a BB Folder and no "Attached Files" section processed, handle as a general content item ---
-        # (e.g., a direct link to a single PDF, a Web Link item, embedded media not in an attachments section)
-        # These items are placed directly in the current_relative_path (i.e., not in a new subfolder named after themselves).
-        try:
-            # Find all relevant links/media sources directly under the li_element's scope.
-            # Exclude javascript links, empty hrefs, and already identified folder links.
-            general_content_elements = li_element.find_elements(By.XPATH,
-                ".//a[@href[ (contains(.,'/bbcswebdav/')) or " +
-                "(starts-with(.,'http') and not(starts-with(.,'javascript:')) and .!='#') ] and not(contains(@href, '/listContent.jsp?')) ] | " +
-                ".//video[@src[starts-with(.,'http') or contains(.,'/bbcswebdav/')]] | " +
-                ".//img[@src[starts-with(.,'http') or contains(.,'/bbcswebdav/')]]"
-            )
+        # Find all relevant links/media sources directly under the li_element's scope.
+        # Exclude javascript links, empty hrefs, and already identified folder links.
+        general_content_elements = li_element.find_elements(By.XPATH, _GENERAL_CONTENT_XPATH)
+        for content_element_tag in general_content_elements:
+            tag_name = content_element_tag.tag_name
+            item["links"].append({
+                "tag": tag_name,
+                "text": content_element_tag.text.strip() if tag_name == 'a' else "",
+                "url": content_element_tag.get_attribute("href") or content_element_tag.get_attribute("src"),
+            })
+        items.append(item)
+    return items
 
-            if not general_content_elements and not attachments_were_processed_for_this_item: # and not a folder (already continued)
-                 status_callback(f"    - Item '{item_title_str}' is not a folder, has no 'Attachments' section, and no direct file/web/media links found by general XPath. Skipping this item's direct content.")
 
-            for content_element_tag in general_content_elements:
-                url_value = content_element_tag.get_attribute("href") or content_element_tag.get_attribute("src")
-                if not url_value: continue
+class _HtmlNode:
+    """A minimal element tree node; just enough DOM for the listContent.jsp selectors used here."""
+    __slots__ = ("tag", "attrs", "parent", "children")
 
-                name_candidate = clean_item_title_as_path_segment # Default to item's title
-                if content_element_tag.tag_name == 'a':
-                    link_text_raw = content_element_tag.text.strip()
-                    # Use specific link text if it's not generic and better than the item title
-                    if link_text_raw and link_text_raw.lower() not in ["view", "open", "download", "link", "attachment", item_title_str.lower()]:
-                        name_candidate = re.sub(r'[\\/*?:"<>|]', "_", link_text_raw) # Clean link text
-                
-                # If multiple general links under one li_element default to item title, try to use basename for uniqueness
-                if general_content_elements.index(content_element_tag) > 0 and name_candidate == clean_item_title_as_path_segment:
-                     basename_from_url = os.path.basename(url_value.split('?')[0])
-                     if basename_from_url : name_candidate = re.sub(r'[\\/*?:"<>|]', "_", basename_from_url)
+    def __init__(self, tag, attrs, parent):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.children = [] # _HtmlNode or str
 
+    def get(self, name, default=None):
+        return self.attrs.get(name, default)
 
-                if "/bbcswebdav/" in url_value or content_element_tag.tag_name in ['video', 'img']:
-                    content_map.append({
-                        "type": "File", "url": url_value,
-                        "name": name_candidate, "path": current_relative_path # Saved directly in current_relative_path
-                    })
-                    status_callback(f"      Found General File/Media: '{name_candidate}' (from item '{item_title_str}') in '{current_relative_path or 'section root'}'")
-                elif url_value.startswith("http"): # External web link
-                    content_map.append({
-                        "type": "WebLink", "url": url_value,
-                        "name": name_candidate, "path": current_relative_path # Saved directly in current_relative_path
-                    })
-                    status_callback(f"      Found General WebLink: '{name_candidate}' (from item '{item_title_str}') in '{current_relative_path or 'section root'}'")
-        except NoSuchElementException:
-            pass # No general content elements found for this item.
-        # End of processing one li_element from content_list_items
-    
-    # --- After iterating all li_elements on the current page, recursively visit collected BB Folders ---
-    for folder_to_scan_info in folders_to_visit_recursively:
-        folder_name_as_path_segment = folder_to_scan_info['name'] # This is the cleaned title of the folder item
-        folder_target_url = folder_to_scan_info['url']
-        
-        # The new relative path for content inside this folder will be current_relative_path joined with folder_name_as_path_segment
-        new_recursive_path_for_folder_content = os.path.join(current_relative_path, folder_name_as_path_segment)
-        
-        status_callback(f"    > Navigating into Sub-Folder: '{folder_name_as_path_segment}' (URL: {folder_target_url})")
-        status_callback(f"      Content from this folder will be saved under relative path: '{new_recursive_path_for_folder_content}'")
-        
-        try:
-            driver.get(folder_target_url)
-            # Recursive call to scrape the content of this sub-folder
-            scrape_page_for_content(driver, content_map, status_callback, new_recursive_path_for_folder_content)
-            
-            status_callback(f"    < Navigating back from sub-folder: '{folder_name_as_path_segment}'")
-            driver.back() # Go back to the page that listed this folder
-            # Wait for the parent page's content list to be present again before proceeding with other folders on this level
-            WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.ID, "content_listContainer")))
-            time.sleep(0.5) # Small pause for stability and to ensure page state is updated
-        except Exception as e_folder_navigation:
-            status_callback(f"      ! ERROR during navigation or scraping of folder '{folder_name_as_path_segment}': {e_folder_navigation}")
-            status_callback(f"      ! Current URL: {driver.current_url}. Attempting to recover by navigating back if possible.")
-            try:
-                # If the error occurred before driver.back(), or if driver.back() itself failed,
-                # and we are still on the folder's page, try to go back.
-                if driver.current_url == folder_target_url or driver.current_url.startswith(folder_target_url.split('?')[0]):
-                    driver.back()
-                    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "content_listContainer")))
-                status_callback(f"      ! Recovery: Navigated back to {driver.current_url}")
-            except Exception as e_recovery:
-                status_callback(f"      ! Recovery attempt (driver.back) also failed for folder '{folder_name_as_path_segment}': {e_recovery}. May miss subsequent items on this level.")
-            # Continue with the next folder on the current level if any.
-
-
-def process_content_list(session, base_course_dir, content_list, progress_callback, status_callback):
-    if not content_list:
-        status_callback("      - No new downloadable files or links found in this section/folder.")
-        return
-        
-    unique_content_by_url = {}
-    for item in content_list:
-        if item['url'] not in unique_content_by_url:
-            unique_content_by_url[item['url']] = item
-    unique_content = list(unique_content_by_url.values())
+    def class_contains(self, fragment):
+        # Same semantics as XPath contains(@class, '...') - a substring test, not a class-token test
+        return fragment in self.attrs.get("class", "")
 
-    status_callback(f"\n      [Processing {len(unique_content)} unique items for download/linking from this section/folder]")
-    
-    for i, item_info in enumerate(unique_content):
-        if progress_callback: 
-            progress_callback((i + 1) / len(unique_content) * 100)
-        
-        item_type = item_info.get('type', 'Unknown')
-        original_name = item_info.get('name', 'untitled')
-        relative_path_within_section = item_info.get('path', '') 
-        url = item_info.get('url')
+    def has_class(self, name):
+        return name in self.attrs.get("class", "").split()
 
-        if not url:
-            status_callback(f"      ({i+1}) Skipping item with no URL: {original_name}")
-            continue
+    def iter(self, tag=None):
+        """Yields descendant elements in document order."""
+        stack = [c for c in reversed(self.children) if isinstance(c, _HtmlNode)]
+        while stack:
+            node = stack.pop()
+            if tag is None or node.tag == tag:
+                yield node
+            stack.extend(c for c in reversed(node.children) if isinstance(c, _HtmlNode))
 
-        final_folder_path = os.path.join(base_course_dir, relative_path_within_section)
-        os.makedirs(final_folder_path, exist_ok=True)
-        
-        # --- MODIFICATION FOR FILENAME AND EXTENSION ---
-        base_name_candidate = original_name
-        ext_candidate = ""
+    def find(self, predicate):
+        return next((node for node in self.iter() if predicate(node)), None)
 
-        # If it's a file, try to split extension more traditionally
-        if item_type == "File":
-            potential_base, potential_ext = os.path.splitext(original_name)
-            # Check if the potential_ext is a known or common-looking extension
-            if potential_ext and len(potential_ext) > 1 and len(potential_ext) <= 5 and potential_ext[1:].isalnum():
-                base_name_candidate = potential_base
-                ext_candidate = potential_ext
-            # else, keep original_name as base_name_candidate, ext_candidate remains ""
-        # For WebLinks, or files where splitext gave an unusual "extension", 
-        # treat the whole original_name as the base for cleaning.
-        # The .url extension will be added specifically for WebLinks later.
-
-        # Clean the base name candidate (this will be used for both File base and WebLink base)
-        # Allow dots within the name initially, they will be handled during final filename construction.
-        clean_base_name = re.sub(r'[^\w\s\-\.]', '_', base_name_candidate).strip()
-        clean_base_name = re.sub(r'\s+', ' ', clean_base_name) # Consolidate multiple spaces
-        if not clean_base_name: 
-            clean_base_name = "untitled_item" 
-        # --- END OF MODIFICATION ---
+    def text(self):
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                parts.append(node)
+            elif node.tag not in ("script", "style"):
+                stack.extend(reversed(node.children))
+        return re.sub(r'\s+', ' ', "".join(parts)).strip()
 
 
-        if item_type == "File":
-            status_callback(f"        ({i+1}/{len(unique_content)}) Downloading File: {os.path.join(relative_path_within_section, original_name)}")
-            try:
-                with session.get(url, stream=True, timeout=300, allow_redirects=True) as r: 
-                    r.raise_for_status() 
-                    server_fname_raw = ""
-                    if "content-disposition" in r.headers:
-                        fname_match = re.findall(r'filename\*?=(?:UTF-\d{1,2}\'\')?([^";\n]+)', r.headers['content-disposition'], re.IGNORECASE)
-                        if fname_match: server_fname_raw = requests.utils.unquote(fname_match[0].strip('"\' '))
-                    if not server_fname_raw: server_fname_raw = os.path.basename(url.split('?')[0])
-
-                    # Get extension from server filename if possible, or from original 'ext_candidate'
-                    _, ext_from_server = os.path.splitext(server_fname_raw)
-                    
-                    # Prioritize: 1. ext_candidate (if item_type was File and splitext was good)
-                    #             2. ext_from_server
-                    #             3. MIME type map
-                    final_ext = ext_candidate or ext_from_server or MIME_TYPE_MAP.get(r.headers.get('content-type', '').split(';')[0].lower(), "")
-                    
-                    if final_ext and not final_ext.startswith('.'): 
-                        final_ext = '.' + final_ext
-                    
-                    # Now, clean_base_name should not have the extension part if final_ext is determined
-                    # If clean_base_name ends with what we think is the final_ext, remove it to avoid duplication.
-                    temp_clean_base = clean_base_name
-                    if final_ext and temp_clean_base.lower().endswith(final_ext.lower()):
-                        temp_clean_base = temp_clean_base[:-len(final_ext)]
-                    
-                    # Final sanitization for filesystem (remove any remaining problematic chars from base)
-                    # and ensure no dots are left in this base part that could be misinterpreted as extension sep.
-                    final_base_for_file = re.sub(r'[\\/*?:"<>|.]', "_", temp_clean_base) # Replace dots in base with underscore
-                    final_base_for_file = re.sub(r'_+', '_', final_base_for_file).strip('_') # Consolidate underscores
-
-                    final_filename_to_save = final_base_for_file + final_ext
-                    final_filename_to_save = final_filename_to_save[:200] # Limit overall length
-                    
-                    if not final_base_for_file: # if base became empty after stripping underscores
-                        final_filename_to_save = "downloaded_file" + final_ext
-
-
-                    final_filepath = os.path.join(final_folder_path, final_filename_to_save)
-                    
-                    # Check if file already exists
-                    if os.path.exists(final_filepath):
-                        try:
-                            content_length = int(r.headers.get('content-length', 0))
-                            existing_size = os.path.getsize(final_filepath)
-                            
-                            if content_length > 0:
-                                # Server provided size - compare it
-                                if existing_size == content_length:
-                                    status_callback(f"          - SKIPPED (already exists with same size): {final_filename_to_save}")
-                                    continue
-                                # Sizes differ - will re-download
-                            else:
-                                # No Content-Length header - assume existing file is correct
-                                status_callback(f"          - SKIPPED (already exists): {final_filename_to_save}")
-                                continue
-                        except Exception:
-                            # If any error checking, skip the file (assume it's good)
-                            status_callback(f"          - SKIPPED (already exists): {final_filename_to_save}")
-                            continue
-
-                    # Download the file
-                    with open(final_filepath, 'wb') as f:
-                        for chunk in r.iter_content(chunk_size=8192):
-                            if chunk:  # filter out keep-alive new chunks
-                                f.write(chunk)
-                    status_callback(f"          - SAVED: {final_filename_to_save}")
-
-            except requests.exceptions.RequestException as e_req: status_callback(f"          - FAILED (Request Error): {original_name} - {e_req}")
-            except IOError as e_io: status_callback(f"          - FAILED (File IO Error): {original_name} - {e_io}")
-            except Exception as e: status_callback(f"          - FAILED (General Error): {original_name} - {e}")
-        
-        elif item_type == "WebLink":
-            status_callback(f"        ({i+1}/{len(unique_content)}) Creating Link: {os.path.join(relative_path_within_section, original_name)}")
-            
-            # For WebLinks, 'clean_base_name' (derived from original_name) is what we want.
-            # Remove any characters that are invalid for filenames, including dots that aren't part of the final .url extension.
-            base_for_weblink = re.sub(r'[\\/*?:"<>|.]', "_", clean_base_name) # Replace dots with underscore
-            base_for_weblink = re.sub(r'_+', '_', base_for_weblink).strip('_') # Consolidate underscores
-            
-            if not base_for_weblink: base_for_weblink = "weblink_shortcut"
+class _HtmlTreeBuilder(HTMLParser):
+    VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
 
-            clean_link_filename = base_for_weblink[:195] + ".url" 
-            final_filepath = os.path.join(final_folder_path, clean_link_filename)
-            try:
-                with open(final_filepath, 'w', encoding='utf-8') as f: f.write(f"[InternetShortcut]\nURL={url}\n")
-                status_callback(f"          - LINK CREATED: {clean_link_filename}")
-            except Exception as e: status_callback(f"          - FAILED creating link: {clean_link_filename} - {e}")
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = _HtmlNode("#document", {}, None)
+        self._current = self.root
+
+    def handle_starttag(self, tag, attrs):
+        node = _HtmlNode(tag, {k: (v if v is not None else "") for k, v in attrs}, self._current)
+        self._current.children.append(node)
+        if tag not in self.VOID_TAGS:
+            self._current = node
+
+    def handle_startendtag(self, tag, attrs):
+        node = _HtmlNode(tag, {k: (v if v is not None else "") for k, v in attrs}, self._current)
+        self._current.children.append(node)
+
+    def handle_endtag(self, tag):
+        # Close the nearest open element with this tag; stray end tags are ignored like a browser would
+        node = self._current
+        while node is not self.root and node.tag != tag:
+            node = node.parent
+        if node is not self.root:
+            self._current = node.parent
+
+    def handle_data(self, data):
+        self._current.children.append(data)
+
+
+def parse_html(html):
+    builder = _HtmlTreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+def _is_general_content_link(node):
+    """Mirror of the XPath used by the Selenium extractor for candidate files, web links and media."""
+    if node.tag == "a":
+        href = node.get("href")
+        if href is None or '/listContent.jsp?' in href:
+            return False
+        return '/bbcswebdav/' in href or (href.startswith('http') and not href.startswith('javascript:') and href != '#')
+    if node.tag in ("video", "img"):
+        src = node.get("src")
+        return src is not None and (src.startswith('http') or '/bbcswebdav/' in src)
+    return False
+
+
+def _extract_list_items_from_html(html, page_url):
+    """Reads the items of a listContent.jsp page from its raw HTML. Returns None if the page has no content list."""
+    root = parse_html(html) if isinstance(html, str) else html
+    container = root.find(lambda n: n.get("id") == "content_listContainer")
+    if container is None:
+        return None
+
+    items = []
+    for li_element in container.iter("li"):
+        if not (li_element.has_class("liItem") and li_element.get("id", "").startswith("contentListItem:")):
+            continue
+        item = {"title": None, "fallback_title": None, "folder_url": None, "attachments": [], "links": []}
+        title_h3 = li_element.find(lambda n: n.tag == "h3" and n.parent is not None and (
+            (n.parent.tag == "div" and n.parent.has_class("item")) or
+            (n.parent.tag == "div" and n.parent.has_class("itemHead") and n.parent.parent is not None
+             and n.parent.parent.tag == "div" and n.parent.parent.has_class("item"))))
+        if title_h3 is not None:
+            item["title"] = title_h3.text()
         else:
-            status_callback(f"        ({i+1}/{len(unique_content)}) Skipping item of type '{item_type}': {original_name}")
+            first_link = next(li_element.iter("a"), None)
+            if first_link is not None:
+                item["fallback_title"] = first_link.text()
 
+        folder_link = None
+        for item_div in (n for n in li_element.iter("div") if n.class_contains("item")):
+            for h3 in item_div.iter("h3"):
+                folder_link = h3.find(lambda n: n.tag == "a" and '/listContent.jsp?' in n.get("href", ""))
+                if folder_link is not None: break
+            if folder_link is not None: break
+        if folder_link is not None and folder_link.get("href"):
+            item["folder_url"] = urljoin(page_url, folder_link.get("href"))
+            items.append(item)
+            continue
 
-# --- GUI Application Class (largely unchanged from your previous version with my UI tweaks) ---
-class App(ctk.CTk):
-    def __init__(self):
-        super().__init__()
-        self.title("Blackboard Course Downloader")
-        self.geometry("700x1000")
-        self.all_course_data = []
-        self.resizable(0,0)
-
-        # Configure grid layout (1x1)
-        self.grid_columnconfigure(0, weight=1)
-        self.grid_rowconfigure(0, weight=1)
-
-        main_frame = ctk.CTkFrame(self)
-        main_frame.grid(row=0, column=0, sticky="nsew", padx=10, pady=10)
-
-        # --- UI Widgets setup ---
-        self.main_font = ctk.CTkFont(family="Roboto Medium", size=12)
-        self.header_font = ctk.CTkFont(family="Roboto Medium", size=13, weight="bold")
-        self.button_font = ctk.CTkFont(family="Roboto Medium", size=14, weight="bold") # New font for buttons
-        
-        row_idx = 0 # Keeps track of the current grid row
-
-        # Configure columns for the main frame to ensure alignment
-        # Column 0: Labels (Fixed width/content)
-        # Column 1: Entries (Expands)
-        # Column 2: Browse Button (Fixed width)
-        main_frame.grid_columnconfigure(0, weight=0) # Labels don't expand
-        main_frame.grid_columnconfigure(1, weight=1) # Entries expand
-        main_frame.grid_columnconfigure(2, weight=0) # Button doesn't expand
-
-        # Username
-        ctk.CTkLabel(main_frame, text="Username", font=self.header_font, text_color=("gray10", "gray90")).grid(row=row_idx, column=0, sticky="w", pady=(0, 5))
-        self.username_entry = ctk.CTkEntry(main_frame, width=200, font=self.main_font)
-        self.username_entry.grid(row=row_idx, column=1, columnspan=2, sticky="ew", pady=(0, 5), padx=(5, 0))
-        row_idx += 1
-
-        # Password
-        ctk.CTkLabel(main_frame, text="Password", font=self.header_font, text_color=("gray10", "gray90")).grid(row=row_idx, column=0, sticky="w", pady=(0, 5))
-        self.password_entry = ctk.CTkEntry(main_frame, width=200, show="*", font=self.main_font)
-        self.password_entry.grid(row=row_idx, column=1, columnspan=2, sticky="ew", pady=(0, 5), padx=(5, 0))
-        row_idx += 1
-
-        # Download Path (Isolated Frame for Robustness)
-        # We use a separate frame spanning all columns to ensure the button layout is isolated from the main grid's resizing logic.
-        path_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
-        path_frame.grid(row=row_idx, column=0, columnspan=3, sticky="ew", pady=(0, 5))
-        
-        # Configure grid within path_frame
-        path_frame.grid_columnconfigure(0, weight=0) # Label
-        path_frame.grid_columnconfigure(1, weight=1) # Entry
-        path_frame.grid_columnconfigure(2, weight=0) # Button
+        attachments_ul = None
+        for details_div in (n for n in li_element.iter("div") if n.class_contains("details")):
+            attachments_ul = details_div.find(lambda n: n.tag == "ul" and n.class_contains("attachments"))
+            if attachments_ul is not None: break
+        if attachments_ul is not None:
+            for link in attachments_ul.iter("a"):
+                if "href" in link.attrs:
+                    item["attachments"].append({"text": link.text(), "url": urljoin(page_url, link.get("href"))})
 
-        # Label (Col 0) - Matches main grid Col 0 alignment
-        ctk.CTkLabel(path_frame, text="Download To", font=self.header_font, text_color=("gray10", "gray90")).grid(row=0, column=0, sticky="w", padx=(0, 5))
-        
-        # Entry (Col 1)
-        self.path_var = tk.StringVar(value=os.path.join(os.path.expanduser("~"), "Desktop", "KFUPM_Blackboard_Downloads"))
-        self.path_entry = ctk.CTkEntry(path_frame, textvariable=self.path_var, font=self.main_font)
-        self.path_entry.grid(row=0, column=1, sticky="ew", padx=(5, 5)) # Right padding to separate from button
-
-        # Browse Button (Col 2)
-        self.browse_button = ctk.CTkButton(path_frame, text="Browse", width=80, command=self.browse_directory, font=self.button_font)
-        self.browse_button.grid(row=0, column=2, sticky="ew", padx=(0, 0))
-        
-        # Force button to top layer to prevent any clipping issues
-        self.browse_button.lift()
-        
-        row_idx += 1
-
-        # Browser Selection Frame
-        browser_frame = ctk.CTkFrame(main_frame)
-        browser_frame.grid(row=row_idx, column=0, columnspan=3, sticky="ew", pady=10, padx=2)
-        # Explicitly set text_color to ensure visibility in dark mode
-        # Left aligned
-        ctk.CTkLabel(browser_frame, text="Browser for Automation (must be installed)", font=self.header_font, text_color=("gray10", "gray90")).pack(side="top", anchor="w", pady=5, padx=5)
-        
-        # Container for radio buttons (Left aligned)
-        rb_frame = ctk.CTkFrame(browser_frame, fg_color="transparent")
-        rb_frame.pack(side="top", anchor="w", pady=5, padx=5)
+        for node in li_element.iter():
+            if _is_general_content_link(node):
+                raw_url = node.get("href") if node.tag == "a" else node.get("src")
+                item["links"].append({"tag": node.tag, "text": node.text() if node.tag == "a" else "", "url": urljoin(page_url, raw_url)})
+        items.append(item)
+    return items
 
-        self.browser_var = tk.StringVar(value="firefox") 
-        self.firefox_rb = ctk.CTkRadioButton(rb_frame, text="Use Firefox", variable=self.browser_var, value="firefox", font=self.header_font, text_color=("gray10", "gray90"))
-        self.firefox_rb.pack(side="left", padx=(0, 20))
-        
-        self.chrome_rb = ctk.CTkRadioButton(rb_frame, text="Use Chrome", variable=self.browser_var, value="chrome", font=self.header_font, text_color=("gray10", "gray90"))
-        self.chrome_rb.pack(side="left", padx=0)
-        
-        row_idx += 1
-
-        # Headless Checkbox
-        self.headless_var = tk.BooleanVar(value=True)
-        self.headless_check = ctk.CTkCheckBox(main_frame, text="Run in Headless Mode (no browser window visible - recommended)", variable=self.headless_var, font=self.header_font, text_color=("gray10", "gray90"))
-        self.headless_check.grid(row=row_idx, column=0, columnspan=3, sticky="w", pady=5)
-        row_idx += 1
-
-        # Scan Button
-        self.scan_button = ctk.CTkButton(main_frame, text="1. Scan Courses", command=self.start_scan_thread, font=self.button_font, height=40)
-        self.scan_button.grid(row=row_idx, column=0, columnspan=3, sticky="ew", pady=10)
-        row_idx += 1
-
-        # Select Courses Label (Left aligned)
-        ctk.CTkLabel(main_frame, text="Select Course(s) to Download", font=self.header_font, text_color=("gray10", "gray90")).grid(row=row_idx, column=0, columnspan=3, sticky="w", pady=(10, 0))
-        row_idx += 1
-        
-        # Course List (Scrollable Frame with Checkboxes)
-        # Ensure the frame has a fixed height or expands properly. 
-        # We set height to something reasonable so it scrolls if content exceeds it.
-        self.course_scroll_frame = ctk.CTkScrollableFrame(main_frame, label_text="Available Courses", label_font=self.header_font, height=200)
-        self.course_scroll_frame.grid(row=row_idx, column=0, columnspan=3, sticky="nsew", pady=5)
-        
-        # Explicitly bind scroll events for Linux (Button-4/5) and Windows (MouseWheel) to the canvas
-        # This helps if the default binding isn't catching focus properly
-        try:
-            canvas = self.course_scroll_frame._parent_canvas
-            canvas.bind_all("<Button-4>", lambda e: canvas.yview_scroll(-1, "units"))
-            canvas.bind_all("<Button-5>", lambda e: canvas.yview_scroll(1, "units"))
-            canvas.bind_all("<MouseWheel>", lambda e: canvas.yview_scroll(-1 * (e.delta // 120), "units"))
-        except Exception: pass
 
-        self.course_checkboxes = [] # To store checkbox widgets
-        row_idx += 1
+def _classify_list_items(items, content_map, status_callback, current_relative_path):
+    """
+    Turns extracted page items into content_map entries (File/WebLink with name and path).
+    Returns the Blackboard sub-folders found on the page as [{"name", "url"}] for the caller to descend into.
+    """
+    folders_to_visit_recursively = [] # Stores info about BB Folders to scan after processing current page items
 
-        # Download Button
-        self.download_button = ctk.CTkButton(main_frame, text="2. Download Selected Course(s)", command=self.start_download_thread, state="disabled", height=40, font=self.button_font)
-        self.download_button.grid(row=row_idx, column=0, columnspan=3, pady=15, sticky="ew")
-        row_idx += 1
+    for item_idx, item in enumerate(items):
+        item_title_str = f"Untitled Item {item_idx+1}"
+        if item["title"] is not None:
+            item_title_str = item["title"]
+        elif item["fallback_title"]:
+            item_title_str = item["fallback_title"]
+        elif item["fallback_title"] is None:
+            status_callback(f"    - Could not determine title for an item in '{current_relative_path}'. Using default name.")
 
-        # Status & Logs Frame
-        status_frame = ctk.CTkFrame(main_frame)
-        status_frame.grid(row=row_idx, column=0, columnspan=3, sticky="nsew", pady=(10,0))
-        status_frame.columnconfigure(0, weight=1)
-        status_frame.rowconfigure(0, weight=1)
+        # Sanitize title for use as a folder or file name component
+        clean_item_title_as_path_segment = re.sub(r'[\\/*?:"<>|]', "_", item_title_str) if item_title_str else f"untitled_item_{item_idx}"
 
-        self.status_text = ctk.CTkTextbox(status_frame, height=150, state="disabled", wrap="word", font=("Consolas", 11))
-        self.status_text.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
-        row_idx +=1 
+        # --- Stage 1: Check if the item represents a Blackboard Folder ---
+        # These folders navigate to another listContent.jsp page.
+        if item["folder_url"]:
+            folders_to_visit_recursively.append({
+                "name": clean_item_title_as_path_segment, # This will be the subfolder name for recursion
+                "url": item["folder_url"]
+            })
+            status_callback(f"    Identified BB Folder: '{item_title_str}'. Will be scanned recursively into subfolder '{clean_item_title_as_path_segment}'.", DETAIL)
+            continue # This item is a folder; move to the next item
 
-        # Progress Bar
-        self.progress_bar = ctk.CTkProgressBar(main_frame, orientation="horizontal", mode="determinate")
-        self.progress_bar.grid(row=row_idx, column=0, columnspan=3, sticky="ew", pady=(5,10))
-        self.progress_bar.set(0)
-        row_idx += 1
+        # --- Stage 2: Check if the item has an "Attached Files" section ---
+        # (e.g., an Assignment item with multiple attached PDFs like your "Assignment 3" example)
+        # These attachments should go into a subfolder named after the item's title.
+        if item["attachments"]:
+            # Create a subfolder path using the item's title for its attachments
+            path_for_these_item_attachments = os.path.join(current_relative_path, clean_item_title_as_path_segment)
+            status_callback(f"    Item '{item_title_str}' has an 'Attachments' section. Files will be saved in subfolder: '{path_for_these_item_attachments}'", DETAIL)
 
-        # --- Column and Row Configurations for main_frame ---
-        main_frame.rowconfigure(9, weight=1)
-        
-        # Make the course list row expandable
-        # The course list is at a specific row index. Let's find it dynamically or hardcode if we know.
-        # Based on the code above:
-        # 0: Username, 1: Password, 2: Path, 3: Browser, 4: Headless, 5: Scan Button, 6: Label, 7: Course List
-        main_frame.rowconfigure(7, weight=1) 
-        main_frame.columnconfigure(1, weight=1)
-        
-        # Load saved settings (credentials, path, etc.)
-        self.load_credentials()
-        self.username_entry.bind("<KeyRelease>", lambda e: self.save_credentials_throttled())
-        self.password_entry.bind("<KeyRelease>", lambda e: self.save_credentials_throttled())
-        self.path_entry.bind("<KeyRelease>", lambda e: self.save_credentials_throttled())
-        self._save_timer = None
-
-    def save_credentials_throttled(self):
-        if self._save_timer: self.after_cancel(self._save_timer)
-        self._save_timer = self.after(1000, self.save_credentials) 
-
-    def save_credentials(self):
-        try:
-            config_dir = os.path.join(os.path.expanduser("~"), ".kfupm_bb_downloader")
-            os.makedirs(config_dir, exist_ok=True)
-            config_file = os.path.join(config_dir, "config.ini")
-            with open(config_file, "w") as f:
-                f.write(f"username={self.username_entry.get()}\n")
-                # Storing password in plain text - UNSAFE, for local convenience only.
-                # Consider using 'keyring' for more secure storage.
-                f.write(f"password={self.password_entry.get()}\n") 
-                f.write(f"download_path={self.path_var.get()}\n")
-                f.write(f"browser_choice={self.browser_var.get()}\n")
-                f.write(f"headless_mode={self.headless_var.get()}\n")
-        except Exception as e:
-            self.update_status(f"Warning: Could not save settings: {e}")
+            for attachment in item["attachments"]:
+                attachment_url = attachment["url"]
+                if not attachment_url or "javascript:void(0)" in attachment_url or attachment_url.strip() == "#":
+                    continue
 
-    def load_credentials(self):
-        try:
-            config_file = os.path.join(os.path.expanduser("~"), ".kfupm_bb_downloader", "config.ini")
-            if os.path.exists(config_file):
-                with open(config_file, "r") as f:
-                    for line in f:
-                        name, value = line.strip().split("=", 1)
-                        if name == "username": self.username_entry.insert(0, value)
-                        elif name == "password": self.password_entry.insert(0, value)
-                        elif name == "download_path": self.path_var.set(value)
-                        elif name == "browser_choice": self.browser_var.set(value)
-                        elif name == "headless_mode": self.headless_var.set(value.lower() == 'true')
-        except Exception as e:
-            self.update_status(f"Warning: Could not load saved settings: {e}")
+                # Use the attachment's own link text as its name
+                attachment_name_raw = attachment["text"]
+                # Sanitize attachment filename (though process_content_list does more thorough cleaning later)
+                attachment_filename_candidate = attachment_name_raw if attachment_name_raw else os.path.basename(attachment_url.split('?')[0])
+                clean_attachment_filename = re.sub(r'[\\/*?:"<>|]', "_", attachment_filename_candidate)
 
-    def browse_directory(self):
-        directory = filedialog.askdirectory(initialdir=self.path_var.get())
-        if directory: 
-            self.path_var.set(directory)
-            self.save_credentials() 
+                if "/bbcswebdav/" in attachment_url:
+                    content_map.append({
+                        "type": "File", "url": attachment_url,
+                        "name": clean_attachment_filename, "path": path_for_these_item_attachments
+                    })
+                    status_callback(f"      Found Attached File: '{clean_attachment_filename}' for item '{item_title_str}'.", DETAIL)
+                elif attachment_url.startswith("http") and BASE_URL.split('/')[2] not in attachment_url: # External web link
+                    content_map.append({
+                        "type": "WebLink", "url": attachment_url,
+                        "name": clean_attachment_filename, "path": path_for_these_item_attachments
+                    })
+                    status_callback(f"      Found Attached WebLink: '{clean_attachment_filename}' for item '{item_title_str}'.", DETAIL)
 
-    def update_status(self, message):
-        if self and self.status_text: 
-            self.after(0, self._update_status_thread_safe, message)
-    
-    def _update_status_thread_safe(self, message):
-        try:
-            self.status_text.configure(state="normal")
-            self.status_text.insert(tk.END, message + "\n")
-            self.status_text.see(tk.END)
-            self.status_text.configure(state="disabled")
-        except tk.TclError: pass # Handle if widget is destroyed
+            # If an item has an "Attachments" section, assume its main link (e.g., to uploadAssignment page) is not a downloadable file itself.
+            continue # Move to the next item
 
-    def update_progress(self, value):
-        if self and self.progress_bar:
-             self.after(0, self._update_progress_thread_safe, value)
+        # --- Stage 3: If not a BB Folder and no "Attached Files" section processed, handle as a general content item ---
+        # (e.g., a direct link to a single PDF, a Web Link item, embedded media not in an attachments section)
+        # These items are placed directly in the current_relative_path (i.e., not in a new subfolder named after themselves).
+        if not item["links"]:
+            status_callback(f"    - Item '{item_title_str}' is not a folder, has no 'Attachments' section, and no direct file/web/media links found by general XPath. Skipping this item's direct content.", DETAIL)
 
-    def _update_progress_thread_safe(self, value):
-        try:
-            self.progress_bar.set(value / 100)
-        except tk.TclError: pass
-
-    def set_ui_state(self, enabled):
-        state = "normal" if enabled else "disabled"
-        widgets_to_toggle = [
-            self.username_entry, self.password_entry, self.path_entry,
-            self.browse_button, self.scan_button, self.headless_check,
-            self.firefox_rb, self.chrome_rb
-        ]
-        for widget in widgets_to_toggle:
-            if widget: widget.configure(state=state)
-        
-        # Download button depends on courses being scanned
-        if enabled and self.all_course_data:
-            self.download_button.configure(state="normal")
-        else:
-            self.download_button.configure(state="disabled")
-
-    def start_scan_thread(self):
-        self.set_ui_state(False)
-        # Clear previous checkboxes
-        for cb in self.course_checkboxes:
-            cb.destroy()
-        self.course_checkboxes = []
-        
-        self.all_course_data = [] # Clear previous scan results
-        # Clear status text on new scan
-        self.status_text.configure(state="normal"); self.status_text.delete(1.0, tk.END); self.status_text.configure(state="disabled")
-        self.update_status("Scan initiated...")
-        threading.Thread(target=self.scan_courses_task, daemon=True).start()
-
-    def scan_courses_task(self):
-        username = self.username_entry.get(); password = self.password_entry.get()
-        if not username or not password:
-            messagebox.showerror("Input Error", "Username and Password are required.")
-            self.after(0, self.set_ui_state, True); return
-        
-        self.save_credentials() 
-        driver = None
-        try:
-            browser_choice = self.browser_var.get()
-            driver = setup_driver(browser_choice, self.update_status, self.headless_var.get())
-            
-            self.update_status("Logging in to Blackboard...")
-            login(driver, username, password) # Assuming login confirms success by not raising error
-            self.update_status("Login successful. Fetching course list...")
-            
-            # This is the call to the reverted function
-            self.all_course_data = get_all_terms_and_courses(driver, self.update_status) 
-            
-            if self.all_course_data:
-                self.update_status(f"Scan complete. Found {len(self.all_course_data)} courses across terms.")
-                # Sort by term (desc) then course name (asc)
-                self.all_course_data.sort(key=lambda x: (x.get('term', 'Unknown Term'), x.get('name', '')), reverse=False) # Term ascending might be more natural
-                self.all_course_data.sort(key=lambda x: x.get('term', 'Unknown Term'), reverse=True) # Then reverse by term for newest first
-
-                def update_listbox_ui():
-                    # Clear again just in case
-                    for cb in self.course_checkboxes:
-                        if isinstance(cb, dict): cb['checkbox'].destroy()
-                        elif isinstance(cb, ctk.CTkCheckBox): cb.destroy()
-                        else: cb.destroy()
-                    self.course_checkboxes = []
-                    
-                    # Clear all children of scroll frame to be safe
-                    for child in self.course_scroll_frame.winfo_children():
-                        child.destroy()
-
-                    current_term_header = None 
-                    
-                    # Helper to toggle all checkboxes for a term
-                    def toggle_term(term_val, state_var):
-                        new_state = state_var.get()
-                        for item in self.course_checkboxes:
-                            if item['course_data'].get('term') == term_val:
-                                if new_state: item['checkbox'].select()
-                                else: item['checkbox'].deselect()
-
-                    for course in self.all_course_data:
-                        term = course.get('term', 'Unknown Term')
-                        if term != current_term_header:
-                            current_term_header = term
-                            # Term Header with Select All Checkbox
-                            term_var = tk.BooleanVar(value=False)
-                            term_cb = ctk.CTkCheckBox(self.course_scroll_frame, text=f"--- {current_term_header} ---", 
-                                                      variable=term_var, font=self.header_font, text_color=("gray10", "gray90"),
-                                                      command=lambda t=current_term_header, v=term_var: toggle_term(t, v))
-                            term_cb.pack(side="top", fill="x", padx=5, pady=(10, 2)) # Changed to pack top for vertical list
-                            
-                            # Container for courses in this term (Vertical Layout - Single Column)
-                            self.current_term_course_frame = ctk.CTkFrame(self.course_scroll_frame, fg_color="transparent")
-                            self.current_term_course_frame.pack(fill="x", padx=15, pady=2)
-                            # No column config needed for pack
-                            self.term_course_idx = 0
-
-                        # Add checkbox for the course
-                        course_name = course['name']
-                        cb = ctk.CTkCheckBox(self.current_term_course_frame, text=course_name, font=self.header_font, text_color=("gray10", "gray90"))
-                        # Revert to pack for single column vertical list
-                        cb.pack(fill="x", anchor="w", pady=2)
-                        
-                        self.course_checkboxes.append({"checkbox": cb, "course_data": course})
-                        self.term_course_idx += 1
-                        
-                    self.download_button.configure(state="normal") # Enable download if courses found
-                self.after(0, update_listbox_ui)
-            else:
-                self.update_status("Scan complete: No terms or courses found. Please check your Blackboard or the selectors in the script if the page structure has changed.")
-                # Ensure download button is disabled if no courses
-                self.after(0, lambda: self.download_button.configure(state="disabled"))
+        for link_idx, link in enumerate(item["links"]):
+            url_value = link["url"]
+            if not url_value: continue
 
-        except RuntimeError as e: 
-            self.update_status(f"Driver Error: {e}")
-            messagebox.showerror("Driver Setup Error", str(e))
-        except Exception as e:
-            self.update_status(f"An error occurred during scan: {e}")
-            import traceback; self.update_status(traceback.format_exc())
-            messagebox.showerror("Scan Error", f"An unexpected error occurred during scan: {e}")
-        finally:
-            if driver: 
-                try: driver.quit()
-                except Exception as e_quit: self.update_status(f"Note: Error quitting driver: {e_quit}")
-            self.after(0, self.set_ui_state, True)
+            name_candidate = clean_item_title_as_path_segment # Default to item's title
+            if link["tag"] == 'a':
+                link_text_raw = link["text"]
+                # Use specific link text if it's not generic and better than the item title
+                if link_text_raw and link_text_raw.lower() not in ["view", "open", "download", "link", "attachment", item_title_str.lower()]:
+                    name_candidate = re.sub(r'[\\/*?:"<>|]', "_", link_text_raw) # Clean link text
             
-    def start_download_thread(self):
-        selected_courses = []
-        for item in self.course_checkboxes:
-            if item["checkbox"].get() == 1:
-                selected_courses.append(item["course_data"])
-
-        if not selected_courses:
-            messagebox.showwarning("No Selection", "Please select at least one course to download.")
-            return
+            # If multiple general links under one item default to item title, try to use basename for uniqueness
+            if link_idx > 0 and name_candidate == clean_item_title_as_path_segment:
+                 basename_from_url = os.path.basename(url_value.split('?')[0])
+                 if basename_from_url : name_candidate = re.sub(r'[\\/*?:"<>|]', "_", basename_from_url)
 
-        self.set_ui_state(False)
-        self.update_status("Download initiated...")
-        # Pass selected courses directly
-        threading.Thread(target=self.download_courses_task, args=(selected_courses,), daemon=True).start()
 
-    def download_courses_task(self, courses_to_process):
-        username = self.username_entry.get(); password = self.password_entry.get()
-        
-        self.update_status(f"Starting download for {len(courses_to_process)} selected course(s)...")
-        driver = None
-        try:
-            browser_choice = self.browser_var.get()
-            driver = setup_driver(browser_choice, self.update_status, self.headless_var.get())
-            self.update_status("Logging in for download session...")
-            login_cookies = login(driver, username, password)
-            self.update_status("Login successful for download.")
-            
-            session = requests.Session()
-            for cookie in login_cookies: 
-                session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path'))
-
-            total_courses = len(courses_to_process)
-            for course_idx, course in enumerate(courses_to_process):
-                self.after(0, self.update_progress, 0) 
-                
-                term_name_cleaned = course.get('term', 'Unknown_Term') 
-                course_name_cleaned = course['name'] 
-                
-                base_course_download_dir = os.path.join(self.path_var.get(), term_name_cleaned, course_name_cleaned)
-                os.makedirs(base_course_download_dir, exist_ok=True)
-                
-                self.update_status(f"\n--- ({course_idx+1}/{total_courses}) Processing course: {course['name']} (Term: {term_name_cleaned}) ---")
-                course_main_url = course['url']
-                
-                # --- OPTIMIZATION START ---
-                self.update_status(f"  Navigating to course home: {course_main_url}")
-                driver.get(course_main_url)
-                course_page_wait = WebDriverWait(driver, 15) # Slightly shorter wait for main page elements
-                try:
-                    course_page_wait.until(EC.presence_of_element_located((By.ID, "courseMenuPalette_contents")))
-                    self.update_status("    Course home page loaded.")
-                except TimeoutException:
-                    self.update_status(f"    Timeout waiting for course menu on main page for course '{course_name_cleaned}'. Skipping this course's sections.")
-                    continue # To next course if course home doesn't load its menu
-
-                # --- IDENTIFY AVAILABLE SECTIONS FIRST ---
-                self.update_status("    Identifying available sections...")
-                available_sections_to_scrape = []
-                for section_name_candidate in TARGET_COURSE_SECTIONS:
-                    try:
-                        # Use a very short timeout for checking existence of each link
-                        # driver.find_element is immediate, WebDriverWait allows a small grace period
-                        temp_wait = WebDriverWait(driver, 2) # Short wait: 2 seconds to find link
-                        section_link_xpath = f"//ul[@id='courseMenuPalette_contents']//a[.//span[normalize-space(.)=\"{section_name_candidate}\"]]"
-                        link_element = temp_wait.until(EC.presence_of_element_located((By.XPATH, section_link_xpath)))
-                        link_url = link_element.get_attribute('href')
-                        
-                        if link_url and ("listContent.jsp" in link_url or "launchLink.jsp" in link_url):
-                             available_sections_to_scrape.append({"name": section_name_candidate, "url": link_url})
-                             self.update_status(f"    + Section '{section_name_candidate}' is available (URL: {link_url})")
-                        else:
-                            self.update_status(f"    - Section '{section_name_candidate}' found, but URL is not a content page type ({link_url}). Skipping.")
-                    except TimeoutException:
-                        self.update_status(f"    - Section '{section_name_candidate}' link not found quickly. Skipping this section.")
-                    except NoSuchElementException: # Should be caught by TimeoutException with WebDriverWait
-                        self.update_status(f"    - Section '{section_name_candidate}' link (NoSuchElement). Skipping this section.")
-
-                # --- SCRAPE COURSE HOMEPAGE ---
-                # Check if homepage has content_listContainer, and get actual URL after any redirects
-                homepage_has_content = False
-                homepage_actual_url = None
-                
-                try:
-                    # Try to find content_listContainer on homepage (short timeout)
-                    WebDriverWait(driver, 3).until(EC.presence_of_element_located((By.ID, "content_listContainer")))
-                    homepage_has_content = True
-                    # NOW get the URL after redirect
-                    homepage_actual_url = driver.current_url
-                    self.update_status(f"    Homepage has content (URL after redirect: {homepage_actual_url})")
-                except TimeoutException:
-                    self.update_status("    Homepage has no content_listContainer - will not scrape homepage.")
-                
-                # Only scrape homepage if it has content
-                if homepage_has_content:
-                    # Helper function to extract content_id from Blackboard URLs for comparison
-                    def get_content_id(url):
-                        """Extract content_id parameter from Blackboard URL"""
-                        if not url or 'content_id=' not in url:
-                            return None
-                        try:
-                            from urllib.parse import urlparse, parse_qs
-                            parsed = urlparse(url)
-                            query_params = parse_qs(parsed.query)
-                            content_ids = query_params.get('content_id', [])
-                            return content_ids[0] if content_ids else None
-                        except:
-                            return None
-                    
-                    # Determine folder name: if homepage content_id matches any section content_id, use that section's name
-                    homepage_folder_name = "Course Home"
-                    homepage_content_id = get_content_id(homepage_actual_url)
-                    
-                    for section in available_sections_to_scrape:
-                        section_content_id = get_content_id(section["url"])
-                        if homepage_content_id and section_content_id and homepage_content_id == section_content_id:
-                            homepage_folder_name = section["name"]
-                            self.update_status(f"    Course homepage is the same as '{section['name']}' section (content_id: {homepage_content_id}).")
-                            break
-                    
-                    self.update_status(f"    Scraping course homepage to '{homepage_folder_name}' folder...")
-                    content_map_for_homepage = []
-                    
-                    try:
-                        scrape_page_for_content(driver, content_map_for_homepage, self.update_status, current_relative_path=homepage_folder_name)
-                        
-                        if content_map_for_homepage:
-                            self.update_status(f"      Found {len(content_map_for_homepage)} items on course homepage. Processing downloads...")
-                            process_content_list(session, base_course_download_dir, content_map_for_homepage,
-                                               lambda p_val: self.after(0, self.update_progress, p_val),
-                                               self.update_status)
-                        else:
-                            self.update_status("      No downloadable items found on course homepage.")
-                    except Exception as e_homepage:
-                        self.update_status(f"      Error scraping course homepage: {e_homepage}")
-                # --- END HOMEPAGE SCRAPING ---
-
-
-                if not available_sections_to_scrape:
-                    self.update_status(f"    No relevant sections found or accessible for course '{course_name_cleaned}'.")
-                    continue # To the next course
-
-                for section_info in available_sections_to_scrape:
-                    section_name_to_find = section_info["name"]
-                    section_target_url = section_info["url"]
-                    content_map_for_section = [] 
-                    
-                    
-                    
-                    
-                    self.update_status(f"  Processing available section: '{section_name_to_find}'")
-                    
-                    # Check if this section content_id matches the homepage content_id (skip if duplicate)
-                    if homepage_has_content and homepage_content_id:
-                        from urllib.parse import urlparse, parse_qs
-                        try:
-                            parsed = urlparse(section_target_url)
-                            query_params = parse_qs(parsed.query)
-                            section_content_ids = query_params.get('content_id', [])
-                            if section_content_ids and section_content_ids[0] == homepage_content_id:
-                                self.update_status(f"    SKIPPING '{section_name_to_find}' - already scraped as homepage")
-                                continue
-                        except:
-                            pass  # If URL parsing fails, don't skip
-                    
-                    try:
-                        self.update_status(f"    Navigating to section '{section_name_to_find}' via URL: {section_target_url}")
-                        driver.get(section_target_url)
+            if "/bbcswebdav/" in url_value or link["tag"] in ['video', 'img']:
+                content_map.append({
+                    "type": "File", "url": url_value,
+                    "name": name_candidate, "path": current_relative_path # Saved directly in current_relative_path
+                })
+                status_callback(f"      Found General File/Media: '{name_candidate}' (from item '{item_title_str}') in '{current_relative_path or 'section root'}'", DETAIL)
+            elif url_value.startswith("http"): # External web link
+                content_map.append({
+                    "type": "WebLink", "url": url_value,
+                    "name": name_candidate, "path": current_relative_path # Saved directly in current_relative_path
+                })
+                status_callback(f"      Found General WebLink: '{name_candidate}' (from item '{item_title_str}') in '{current_relative_path or 'section root'}'", DETAIL)
+        # End of processing one item
 
-                        try:
-                            # Wait for the content area of the section page to load
-                            # This wait is specific to the section page, so 10-15s is reasonable
-                            WebDriverWait(driver, 10).until( 
-                                EC.presence_of_element_located((By.ID, "content_listContainer"))
-                            )
-                            self.update_status(f"      Section '{section_name_to_find}' content area loaded.")
-                        except TimeoutException:
-                            self.update_status(f"      Timeout: Section '{section_name_to_find}' loaded, but 'content_listContainer' not found. Scraping might be limited or fail.")
-                        
-                        self.update_status(f"      Scanning '{section_name_to_find}' for files and folders...")
-                        clean_section_folder_name = re.sub(r'[\\/*?:"<>|]', "_", section_name_to_find)
-                        
-                        scrape_page_for_content(driver, content_map_for_section, self.update_status, current_relative_path=clean_section_folder_name)
-                        
-                        if content_map_for_section:
-                            self.update_status(f"      Found {len(content_map_for_section)} potential items in '{section_name_to_find}'. Processing downloads...")
-                            process_content_list(session, base_course_download_dir, content_map_for_section, 
-                                                 lambda p_val: self.after(0, self.update_progress, p_val),
-                                                 self.update_status)
-                        else:
-                            self.update_status(f"      No downloadable items or sub-folders found directly in '{section_name_to_find}'.")
-
-                    # Removed Timeout/NoSuchElement here as we pre-filtered available_sections_to_scrape
-                    # These exceptions would now relate to issues on the section page itself (e.g., content_listContainer not appearing)
-                    except Exception as e_section_processing:
-                        self.update_status(f"    - An unexpected error occurred while processing section '{section_name_to_find}': {type(e_section_processing).__name__} - {e_section_processing}")
-                    finally:
-                        # Optional: Navigate back to course main page if worried about state for next section,
-                        # but if sections are independent, this might not be needed and saves a page load.
-                        # For now, let's assume direct navigation to next section's URL is fine.
-                        # If issues arise, add:
-                        # if section_info != available_sections_to_scrape[-1]: # If not the last section
-                        #     self.update_status(f"    Returning to course home before next section...")
-                        #     driver.get(course_main_url)
-                        #     WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "courseMenuPalette_contents")))
-                        pass
+    return folders_to_visit_recursively
 
 
-                self.update_status(f"--- Finished processing course: {course['name']} ---")
+@timed_phase("term_scan")
+def get_all_terms_and_courses_http(session, status_callback, rate_limits=None, retry_policy=None):
+    """
+    Browser-free counterpart of get_all_terms_and_courses for an already logged-in session: reads the
+    same term headings and course links from the portal's Courses module HTML (collapsed terms are
+    present in the markup, so nothing needs expanding). rate_limits and retry_policy pace and retry
+    its requests as in fetch_page.
+    """
+    status_callback("Scanning for all available terms and courses...")
+    html, page_url = fetch_page(session, SESSION_CHECK_URL, rate_limits=rate_limits, retry_policy=retry_policy)
+    root = parse_html(html)
+    if root.find(_is_term_heading) is None:
+        # The Courses module is usually filled in by an AJAX call after the portal loads; ask for it directly
+        module_url = BASE_URL + "webapps/portal/execute/tabs/tabAction"
+        module_form = {"action": "refreshAjaxModule", "modId": "_4_1", "tabId": "_1_1", "tab_tab_group_id": "_1_1"}
+
+        def attempt():
+            if rate_limits:
+                with rate_limits.for_host(module_url):
+                    r = rate_limits.request(session, "POST", module_url, timeout=PAGE_FETCH_TIMEOUT, data=module_form)
+            else:
+                r = session.post(module_url, timeout=PAGE_FETCH_TIMEOUT, data=module_form)
+            r.raise_for_status()
+            return r
+
+        r = (retry_policy or RetryPolicy()).call(attempt)
+        root = parse_html(re.sub(r'<!\[CDATA\[|\]\]>', '', r.text))
+
+    all_courses = []
+    for term_header in (n for n in root.iter("h3") if _is_term_heading(n)):
+        term_name_raw = term_header.text()
+        if not term_name_raw:
+            continue
+        term_name_clean = re.sub(r'[\\/*?:"<>|]', "_", term_name_raw)
+        siblings = [c for c in term_header.parent.children if isinstance(c, _HtmlNode)]
+        course_container = next((c for c in siblings[siblings.index(term_header) + 1:] if c.tag == "div"), None)
+        if course_container is None:
+            status_callback(f"  - Could not find course container (div sibling) for term: {term_name_clean}. Skipping this term's courses.")
+            continue
+
+        courses_in_term = []
+        for course_list in (n for n in course_container.iter("ul") if n.has_class("courseListing")):
+            for li in course_list.iter("li"):
+                for el in (c for c in li.children if isinstance(c, _HtmlNode) and c.tag == "a"):
+                    if _has_ancestor_class(el, "courseDataBlock", course_container):
+                        continue
+                    el_text = el.text()
+                    if el_text and el.get("href"):
+                        courses_in_term.append({"name": re.sub(r'[\\/*?:"<>|]', "_", el_text), "url": urljoin(page_url, el.get("href")), "term": term_name_clean})
+        if courses_in_term:
+            all_courses.extend(courses_in_term)
+            status_callback(f"Found term: {term_name_clean} - {len(courses_in_term)} courses.")
+        else:
+            status_callback(f"  - No course links found within the container for term '{term_name_clean}'.")
+
+    if not all_courses:
+        status_callback("Scan finished. No courses were found across any terms based on the expected structure.")
+    return all_courses
+
+
+def _is_term_heading(node):
+    return node.tag == "h3" and node.class_contains("termHeading-coursefakeclass")
+
+
+def _has_ancestor_class(node, class_name, stop_at):
+    node = node.parent
+    while node is not None and node is not stop_at:
+        if node.has_class(class_name):
+            return True
+        node = node.parent
+    return False
+
+
+def save_course_catalog(username, courses, path=CATALOG_CACHE_PATH):
+    """Persists the scanned (term, name, url) course list for username."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            catalogs = json.load(f)
+    except (OSError, ValueError):
+        catalogs = {}
+    catalogs[username] = {"saved_at": time.time(),
+                          "courses": [{"term": c.get('term'), "name": c['name'], "url": c['url']} for c in courses]}
+    _write_private_json(path, catalogs)
+
+
+def load_course_catalog(username, path=CATALOG_CACHE_PATH):
+    """Returns (courses, saved_at) from the last scan for username, or None if it was never scanned."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f).get(username)
+    except (OSError, ValueError):
+        return None
+    if not entry or not entry.get('courses'):
+        return None
+    return entry['courses'], entry.get('saved_at', 0)
+
+
+def diff_course_catalogs(old_courses, new_courses):
+    """Returns (added, removed) courses between two scans, matched by course URL."""
+    old_urls = {c['url'] for c in old_courses}
+    new_urls = {c['url'] for c in new_courses}
+    return [c for c in new_courses if c['url'] not in old_urls], [c for c in old_courses if c['url'] not in new_urls]
+
+
+@timed_phase("section_crawl")
+def scrape_page_for_content(driver, content_map, status_callback, current_relative_path="", visited=None, folder_walk=None):
+    """
+    Scrapes the page currently loaded in the driver and then every Blackboard sub-folder below it,
+    breadth-first. Each folder is opened once, directly by its URL - there is no driver.back() to
+    restore the parent page, so no parent is ever reloaded. Folders already in visited (a VisitedIndex
+    shared with other crawls of the run) are not opened again. With a folder_walk (see FolderListings),
+    an unchanged folder's stored subtree is used instead of opening its sub-folders.
+    """
+    visited = visited if visited is not None else VisitedIndex()
+    start_url = driver.current_url
+    visited.claim(start_url)
+    frontier = deque([(None, current_relative_path, 0)]) # (folder URL or None for the already-loaded page, relative path, depth)
+    while frontier:
+        folder_target_url, relative_path, depth = frontier.popleft()
+        listed_url = folder_target_url or start_url
+        with TRACER.span("folder", "crawl", path=relative_path, url=listed_url):
+            if folder_target_url:
+                status_callback(f"    > Opening Sub-Folder: '{relative_path}' (URL: {folder_target_url})", DETAIL)
+                try:
+                    with TRACER.span("page", "crawl", url=folder_target_url, via="browser"), METRICS.timer("page_fetch_seconds", via="browser"):
+                        driver.get(folder_target_url)
+                except Exception as e_folder_navigation:
+                    status_callback(f"      ! ERROR during navigation to folder '{relative_path}': {e_folder_navigation}")
+                    if folder_walk: folder_walk.failed(listed_url, relative_path)
+                    continue
+
+            try:
+                items = _extract_list_items_from_driver(driver, status_callback)
+            except Exception as e_folder_scrape:
+                status_callback(f"      ! ERROR while scraping folder '{relative_path}': {e_folder_scrape}")
+                if folder_walk: folder_walk.failed(listed_url, relative_path)
+                continue
+            if items is None:
+                status_callback(f"  - No 'content_listContainer' or 'liItem' found on current page ({driver.current_url}). Might be empty or structured differently in '{relative_path}'.")
+                if folder_walk: folder_walk.failed(listed_url, relative_path)
+                continue
+
+            reused = folder_walk.reuse(listed_url, relative_path, items, visited) if folder_walk else None
+            if reused is not None:
+                status_callback(f"    = Unchanged since the last crawl, reusing its folder tree: '{relative_path}'", DETAIL)
+                content_map.extend(reused)
+                continue
+            found = []
+            sub_folders = _classify_list_items(items, found, status_callback, relative_path)
+            content_map.extend(found)
+            if folder_walk: folder_walk.listed(listed_url, relative_path, items, found)
+            for folder_to_scan_info in sub_folders:
+                # The new relative path for content inside this folder is relative_path joined with the folder's cleaned title
+                new_relative_path = os.path.join(relative_path, folder_to_scan_info['name'])
+                if _claim_sub_folder(visited, folder_to_scan_info['url'], new_relative_path, depth + 1, status_callback):
+                    frontier.append((folder_to_scan_info['url'], new_relative_path, depth + 1))
+                    if folder_walk: folder_walk.add_child(listed_url, relative_path, folder_to_scan_info['url'], new_relative_path)
+
+
+def _claim_sub_folder(visited, folder_url, relative_path, depth, status_callback):
+    """Whether a discovered sub-folder should be crawled: not seen before in this run and not nested too deep."""
+    if depth > MAX_FOLDER_DEPTH:
+        status_callback(f"    - Not opening '{relative_path}': nested more than {MAX_FOLDER_DEPTH} folders deep (possible link cycle).")
+        return False
+    if not visited.claim(folder_url):
+        status_callback(f"    - Already crawled in this run, not opening again: '{relative_path}' (URL: {folder_url})")
+        return False
+    return True
+
+def build_session(login_cookies, user_agent=None):
+    """Creates a requests.Session carrying the browser's login cookies (and optionally its User-Agent)."""
+    session = requests.Session()
+    if user_agent:
+        session.headers["User-Agent"] = user_agent
+    for cookie in login_cookies: 
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+    return session
+
+
+def fetch_page(session, url, timeout=PAGE_FETCH_TIMEOUT, rate_limits=None, retry_policy=None):
+    """
+    GETs a Blackboard page with the logged-in session. Returns (html, final_url) after any redirects.
+    With rate_limits (the run's RateLimits), the request is paced and counted like the downloads.
+    Transient failures are retried according to retry_policy (by default a RetryPolicy()).
+    """
+    def attempt():
+        if rate_limits:
+            with rate_limits.for_host(url):
+                r = rate_limits.request(session, "GET", url, timeout=timeout, allow_redirects=True)
+        else:
+            r = session.get(url, timeout=timeout, allow_redirects=True)
+        r.raise_for_status()
+        return r
+
+    with TRACER.span("page", "crawl", url=url, via="http") as span, METRICS.timer("page_fetch_seconds", via="http"):
+        r = (retry_policy or RetryPolicy()).call(attempt)
+        span.update(status=r.status_code, bytes=len(r.content))
+    if _is_login_page(r.text):
+        raise RuntimeError(f"Blackboard answered with the login page for {url}; the session is no longer authenticated.")
+    return r.text, r.url
+
+
+@timed_phase("section_crawl")
+def scrape_page_for_content_http(session, page_url, content_map, status_callback, current_relative_path="", html=None, max_workers=DEFAULT_CRAWL_WORKERS, visited=None,
+                                 rate_limits=None, retry_policy=None, folder_walk=None):
+    """
+    Browser-free counterpart of scrape_page_for_content: parses listContent.jsp pages fetched with the
+    logged-in requests.Session and produces the same content_map entries. The folder tree is walked
+    breadth-first; all folders of one depth are fetched concurrently by up to max_workers threads, and
+    their results are merged in page order so the content_map stays deterministic.
+    html may carry the already-fetched source (or parse_html tree) of page_url. Folders already in
+    visited (a VisitedIndex shared with other crawls of the run) are not fetched again. With a folder_walk
+    (see FolderListings), an unchanged folder's stored subtree is used instead of fetching its sub-folders.
+    """
+    def scrape_one(folder):
+        folder_url, relative_path, folder_html = folder
+        listed_url = folder_url # The URL the parent links to, before redirects
+        found = [] # Per-page list, merged into content_map in order below
+        with TRACER.span("folder", "crawl", path=relative_path, url=folder_url) as span:
+            try:
+                if folder_html is None:
+                    folder_html, folder_url = fetch_page(session, folder_url, rate_limits=rate_limits, retry_policy=retry_policy)
+                items = _extract_list_items_from_html(folder_html, folder_url)
+            except LeaseLostError:
+                raise
+            except Exception as e_folder:
+                status_callback(f"      ! ERROR while fetching or scraping folder '{relative_path}': {e_folder}")
+                if folder_walk: folder_walk.failed(listed_url, relative_path)
+                return found, []
+            if items is None:
+                status_callback(f"  - No 'content_listContainer' or 'liItem' found on page ({folder_url}). Might be empty or structured differently in '{relative_path}'.")
+                if folder_walk: folder_walk.failed(listed_url, relative_path)
+                return found, []
+            span["items"] = len(items)
+            reused = folder_walk.reuse(listed_url, relative_path, items, visited) if folder_walk else None
+            if reused is not None:
+                status_callback(f"    = Unchanged since the last crawl, reusing its folder tree: '{relative_path}'", DETAIL)
+                span["reused_entries"] = len(reused)
+                return reused, []
+            sub_folders = _classify_list_items(items, found, status_callback, relative_path)
+            if folder_walk: folder_walk.listed(listed_url, relative_path, items, found)
+            return found, sub_folders
+
+    visited = visited if visited is not None else VisitedIndex()
+    visited.claim(page_url)
+    level = [(page_url, current_relative_path, html)]
+    depth = 0
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="bb-crawl") as pool:
+        while level:
+            next_level = []
+            depth += 1
+            for (folder_url, relative_path, _), (found, sub_folders) in zip(level, pool.map(scrape_one, level)):
+                content_map.extend(found)
+                for folder_to_scan_info in sub_folders:
+                    new_relative_path = os.path.join(relative_path, folder_to_scan_info['name'])
+                    if not _claim_sub_folder(visited, folder_to_scan_info['url'], new_relative_path, depth, status_callback):
+                        continue
+                    if folder_walk: folder_walk.add_child(folder_url, relative_path, folder_to_scan_info['url'], new_relative_path)
+                    status_callback(f"    > Queued Sub-Folder: '{new_relative_path}' (URL: {folder_to_scan_info['url']})", DETAIL)
+                    next_level.append((folder_to_scan_info['url'], new_relative_path, None))
+            level = next_level
+
+def get_content_id(url):
+    """Extract content_id parameter from Blackboard URL"""
+    if not url or 'content_id=' not in url:
+        return None
+    try:
+        content_ids = parse_qs(urlparse(url).query).get('content_id', [])
+        return content_ids[0] if content_ids else None
+    except Exception:
+        return None
+
+
+class VisitedIndex:
+    """
+    Folders and files already handled in this run, keyed by Blackboard content_id for folders (so the same
+    folder reached through different links or URL parameters counts once) and by normalised URL otherwise.
+    One index is shared by the homepage and every section of a course - or by all courses of a run - so
+    each folder is crawled and each file queued at most once; it also stops crawls from following link cycles.
+    Safe to share between crawl and download threads.
+    """
+    def __init__(self):
+        self._keys = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(url, kind="folder"):
+        parsed = urlparse(url or "")
+        query = parse_qs(parsed.query)
+        content_id = query.get('content_id', [None])[0]
+        if content_id:
+            return (kind, "content", content_id.strip())
+        params = urlencode(sorted((name, value) for name, values in query.items() for value in values))
+        return (kind, "url", parsed.netloc.lower(), unquote(parsed.path), params)
+
+    def claim(self, url, kind="folder"):
+        """True the first time url (or an equivalent URL) is claimed as kind ("folder" or "file"), False on every later call."""
+        key = self.key_for(url, kind)
+        with self._lock:
+            if key in self._keys:
+                return False
+            self._keys.add(key)
+            return True
+
+    def __contains__(self, url):
+        key = self.key_for(url)
+        with self._lock:
+            return key in self._keys
+
+
+def _listing_fingerprint(items):
+    """SHA-256 of a folder's extracted items: their titles, folder and attachment URLs and link targets."""
+    return hashlib.sha256(json.dumps(items, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _subtree_hash(listing, entries, child_hashes):
+    """Merkle hash of a folder: its listing, the content entries found in it and its sub-folders' own hashes."""
+    return hashlib.sha256(json.dumps([listing, entries, child_hashes], sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class FolderListings:
+    """
+    Remembers, in the manifest database, what every crawled folder listed, so an unchanged folder tree
+    need not be crawled again. Each folder is stored with a fingerprint of its listing, the content_map
+    entries found in it, its sub-folders, a Merkle hash rolling all of that up over the subtree, and when
+    the subtree was last crawled completely (the oldest time of any folder in it).
+    A folder page is always fetched; when it lists exactly what it did last time, and its subtree was
+    crawled within max_age seconds, the stored entries of the whole subtree are used and none of its
+    sub-folders is fetched. The Merkle hashes make sure the stored subtree is complete and consistent.
+    Blackboard does not show a change inside a sub-folder in the listings above it, so such a change
+    is only found once the subtree is older than max_age; max_age=0 crawls every folder, still recording them.
+    One instance serves a whole run; walk() starts the bookkeeping of one crawl.
+    """
+    def __init__(self, manifest, max_age=DEFAULT_FOLDER_REUSE_HOURS * 3600):
+        self.manifest = manifest
+        self.max_age = max_age
+
+    def walk(self, scope):
+        """A FolderWalk for one crawl; scope (the course folder) keeps courses and download folders apart."""
+        return FolderWalk(self, scope)
+
+    def stored_subtree(self, key):
+        """The stored records of key's subtree, key's own first, or None when a record is missing or a hash does not match."""
+        records = []
+
+        def load(key, depth):
+            record = self.manifest.lookup_folder(key)
+            if record is None or depth > MAX_FOLDER_DEPTH:
+                return None
+            records.append(record)
+            child_hashes = []
+            for child_key in record["children"]:
+                child_hash = load(child_key, depth + 1)
+                if child_hash is None:
+                    return None
+                child_hashes.append(child_hash)
+            return record["subtree"] if _subtree_hash(record["listing"], record["entries"], child_hashes) == record["subtree"] else None
+
+        return records if load(key, 0) else None
+
+
+class FolderWalk:
+    """
+    The folders of one crawl (a course homepage or section), as the crawler reports them: listed() for
+    a folder it parsed, add_child() for each sub-folder it is going to crawl, failed() for one it could
+    not read, and reuse() to ask whether a folder's stored subtree can stand in for crawling it.
+    finish() rolls the hashes up and stores every folder whose subtree was read completely; the stored
+    records of failed folders and their ancestors are dropped, so the next run crawls them again.
+    Safe to use from several crawl threads.
+    """
+    def __init__(self, listings, scope):
+        self.listings = listings
+        self.scope = os.path.abspath(scope)
+        self.started_at = time.time()
+        self._nodes = {} # key -> {"state": "listed"/"reused"/"failed", ...}
+        self._lock = threading.Lock()
+
+    def key_for(self, url, relative_path):
+        return "\n".join([self.scope, relative_path, json.dumps(VisitedIndex.key_for(url))])
+
+    def reuse(self, url, relative_path, items, visited):
+        """
+        The content_map entries of the folder at url and all folders below it, from the last crawl, if its
+        listing (items) is unchanged and its subtree fresh; else None and the folder is to be crawled.
+        The reused sub-folders are claimed in visited as if they had been crawled.
+        """
+        key = self.key_for(url, relative_path)
+        stored = self.listings.manifest.lookup_folder(key)
+        if (stored is None or stored["listing"] != _listing_fingerprint(items)
+                or time.time() - stored["verified_at"] > self.listings.max_age):
+            return None
+        records = self.listings.stored_subtree(key)
+        if records is None:
+            return None
+        entries = []
+        for record in records:
+            if record is not records[0]:
+                visited.claim(record["url"])
+            entries.extend(record["entries"])
+        with self._lock:
+            self._nodes[key] = {"state": "reused", "subtree": stored["subtree"], "verified_at": stored["verified_at"]}
+        METRICS.inc("folders_total", outcome="unchanged")
+        METRICS.inc("folders_total", len(records) - 1, outcome="reused")
+        return entries
+
+    def listed(self, url, relative_path, items, entries):
+        """Records a crawled folder: its items as extracted from the page and the content_map entries found in it."""
+        with self._lock:
+            node = self._nodes.setdefault(self.key_for(url, relative_path), {"children": []})
+            node.update(state="listed", url=url, listing=_listing_fingerprint(items), entries=[dict(entry) for entry in entries])
+        METRICS.inc("folders_total", outcome="walked")
+
+    def add_child(self, url, relative_path, child_url, child_relative_path):
+        with self._lock:
+            node = self._nodes.setdefault(self.key_for(url, relative_path), {"children": []})
+            node["children"].append(self.key_for(child_url, child_relative_path))
+
+    def failed(self, url, relative_path):
+        with self._lock:
+            self._nodes.setdefault(self.key_for(url, relative_path), {"children": []})["state"] = "failed"
+
+    def finish(self):
+        """Computes the Merkle hashes bottom-up and stores the folders crawled completely in this walk."""
+        with self._lock:
+            nodes = dict(self._nodes)
+        settled, records, forget = {}, [], []
+
+        def settle(key, depth=0):
+            # (subtree hash, verified_at) of a completely read subtree, else None
+            if key in settled:
+                return settled[key]
+            node = nodes.get(key)
+            settled[key] = None # Also ends a cycle
+            if node is None or node.get("state") not in ("listed", "reused") or depth > MAX_FOLDER_DEPTH:
+                result = None
+            elif node["state"] == "reused":
+                result = (node["subtree"], node["verified_at"])
+            else:
+                children = [settle(child_key, depth + 1) for child_key in node["children"]]
+                if all(children):
+                    subtree = _subtree_hash(node["listing"], node["entries"], [child[0] for child in children])
+                    verified_at = min([self.started_at] + [child[1] for child in children])
+                    records.append({"key": key, "url": node["url"], "listing": node["listing"], "subtree": subtree,
+                                    "entries": node["entries"], "children": node["children"], "verified_at": verified_at})
+                    result = (subtree, verified_at)
+                else:
+                    result = None
+            if result is None:
+                forget.append(key)
+            settled[key] = result
+            return result
+
+        for key in nodes:
+            settle(key)
+        self.listings.manifest.record_folders(records, forget)
+
+
+@timed_phase("section_discovery")
+def _open_course_in_driver(driver, course_main_url, course_name_cleaned, status_callback):
+    """
+    Loads the course home in the browser and finds which TARGET_COURSE_SECTIONS it offers.
+    Returns (sections, homepage_url_if_it_has_content_or_None, None), or None if the course menu never appeared.
+    """
+    _import_selenium()
+    with TRACER.span("page", "crawl", url=course_main_url, via="browser"):
+        driver.get(course_main_url)
+    course_page_wait = WebDriverWait(driver, 15) # Slightly shorter wait for main page elements
+    try:
+        _wait_until(course_page_wait, EC.presence_of_element_located((By.ID, "courseMenuPalette_contents")), "course menu")
+        status_callback("    Course home page loaded.")
+    except TimeoutException:
+        status_callback(f"    Timeout waiting for course menu on main page for course '{course_name_cleaned}'. Skipping this course's sections.")
+        return None
+
+    # --- IDENTIFY AVAILABLE SECTIONS FIRST ---
+    status_callback("    Identifying available sections...")
+    available_sections_to_scrape = []
+    for section_name_candidate in TARGET_COURSE_SECTIONS:
+        try:
+            # Use a very short timeout for checking existence of each link
+            # driver.find_element is immediate, WebDriverWait allows a small grace period
+            temp_wait = WebDriverWait(driver, 2) # Short wait: 2 seconds to find link
+            section_link_xpath = f"//ul[@id='courseMenuPalette_contents']//a[.//span[normalize-space(.)=\"{section_name_candidate}\"]]"
+            link_element = _wait_until(temp_wait, EC.presence_of_element_located((By.XPATH, section_link_xpath)), f"{section_name_candidate} link")
+            _add_available_section(available_sections_to_scrape, section_name_candidate, link_element.get_attribute('href'), status_callback)
+        except TimeoutException:
+            status_callback(f"    - Section '{section_name_candidate}' link not found quickly. Skipping this section.")
+        except NoSuchElementException: # Should be caught by TimeoutException with WebDriverWait
+            status_callback(f"    - Section '{section_name_candidate}' link (NoSuchElement). Skipping this section.")
+
+    # Check if homepage has content_listContainer, and get actual URL after any redirects
+    homepage_actual_url = None
+    try:
+        # Try to find content_listContainer on homepage (short timeout)
+        _wait_until(WebDriverWait(driver, 3), EC.presence_of_element_located((By.ID, "content_listContainer")), "homepage content list")
+        # NOW get the URL after redirect
+        homepage_actual_url = driver.current_url
+        status_callback(f"    Homepage has content (URL after redirect: {homepage_actual_url})")
+    except TimeoutException:
+        status_callback("    Homepage has no content_listContainer - will not scrape homepage.")
+    return available_sections_to_scrape, homepage_actual_url, None
+
+
+@timed_phase("section_discovery")
+def _open_course_http(session, course_main_url, course_name_cleaned, status_callback, rate_limits=None, retry_policy=None):
+    """Same as _open_course_in_driver, from the course home's HTML. The third element is the parsed page, for reuse."""
+    html, final_url = fetch_page(session, course_main_url, rate_limits=rate_limits, retry_policy=retry_policy)
+    root = parse_html(html)
+    course_menu = root.find(lambda n: n.tag == "ul" and n.get("id") == "courseMenuPalette_contents")
+    if course_menu is None:
+        status_callback(f"    Course menu not found on main page for course '{course_name_cleaned}'. Skipping this course's sections.")
+        return None
+    status_callback("    Course home page loaded.")
+
+    status_callback("    Identifying available sections...")
+    available_sections_to_scrape = []
+    for section_name_candidate in TARGET_COURSE_SECTIONS:
+        link_element = course_menu.find(lambda n: n.tag == "a" and any(span.text() == section_name_candidate for span in n.iter("span")))
+        if link_element is None:
+            status_callback(f"    - Section '{section_name_candidate}' link not found. Skipping this section.")
+            continue
+        link_url = urljoin(final_url, link_element.get("href", "")) if link_element.get("href") else None
+        _add_available_section(available_sections_to_scrape, section_name_candidate, link_url, status_callback)
+
+    homepage_actual_url = None
+    if root.find(lambda n: n.get("id") == "content_listContainer") is not None:
+        homepage_actual_url = final_url
+        status_callback(f"    Homepage has content (URL after redirect: {homepage_actual_url})")
+    else:
+        status_callback("    Homepage has no content_listContainer - will not scrape homepage.")
+    return available_sections_to_scrape, homepage_actual_url, root
+
+
+def _add_available_section(available_sections_to_scrape, section_name_candidate, link_url, status_callback):
+    if link_url and ("listContent.jsp" in link_url or "launchLink.jsp" in link_url):
+         available_sections_to_scrape.append({"name": section_name_candidate, "url": link_url})
+         status_callback(f"    + Section '{section_name_candidate}' is available (URL: {link_url})")
+    else:
+        status_callback(f"    - Section '{section_name_candidate}' found, but URL is not a content page type ({link_url}). Skipping.")
+
+
+@timed_phase("download_wait")
+def _finish_pipeline(pipeline, label, status_callback):
+    """Waits for a crawl's pipeline to finish downloading and reports what happened."""
+    if not len(pipeline):
+        pipeline.close()
+        status_callback(f"      No downloadable items or sub-folders found in {label}.")
+        return
+    status_callback(f"      Crawl of {label} finished with {len(pipeline)} unique items; waiting for the remaining {pipeline.engine.work_noun}...")
+    status_callback(f"      {pipeline.engine.summarize(pipeline.close())}")
+
+
+def download_course(course, download_root, session, engine, status_callback, progress_callback=None, driver=None, crawl_workers=DEFAULT_CRAWL_WORKERS, visited=None,
+                    folder_listings=None):
+    """
+    Crawls one course (its homepage plus TARGET_COURSE_SECTIONS) and downloads everything found into
+    download_root/<term>/<course>. Pages are fetched over HTTP with the logged-in session; pass a
+    driver to crawl them in the browser instead. Every folder and file is handled once per course;
+    pass one VisitedIndex for several courses to extend that to the whole run. With folder_listings
+    (a FolderListings), folders unchanged since the last run are not crawled again.
+    """
+    with TRACER.span("course", "course", name=course['name'], term=course.get('term'), url=course['url']):
+        _download_course(course, download_root, session, engine, status_callback, progress_callback, driver, crawl_workers, visited, folder_listings)
+
+
+def _download_course(course, download_root, session, engine, status_callback, progress_callback, driver, crawl_workers, visited, folder_listings):
+    visited = visited if visited is not None else VisitedIndex()
+    term_name_cleaned = course.get('term', 'Unknown_Term') 
+    course_name_cleaned = course['name'] 
+    
+    base_course_download_dir = os.path.join(download_root, term_name_cleaned, course_name_cleaned)
+    if engine.writes_folders:
+        os.makedirs(base_course_download_dir, exist_ok=True)
+    course_main_url = course['url']
+    
+    status_callback(f"  Navigating to course home: {course_main_url}")
+    if driver:
+        opened_course = _open_course_in_driver(driver, course_main_url, course_name_cleaned, status_callback)
+    else:
+        opened_course = _open_course_http(session, course_main_url, course_name_cleaned, status_callback, engine.rate_limits, engine.retry_policy)
+    if opened_course is None:
+        return # Course home didn't load its menu
+    available_sections_to_scrape, homepage_actual_url, homepage_html = opened_course
+
+    def crawl(page_url, content_map, relative_path, html=None):
+        folder_walk = folder_listings.walk(base_course_download_dir) if folder_listings else None
+        try:
+            if driver:
+                scrape_page_for_content(driver, content_map, status_callback, current_relative_path=relative_path, visited=visited,
+                                        folder_walk=folder_walk)
+            else:
+                scrape_page_for_content_http(session, page_url, content_map, status_callback, current_relative_path=relative_path, html=html,
+                                             max_workers=crawl_workers, visited=visited, rate_limits=engine.rate_limits,
+                                             retry_policy=engine.retry_policy, folder_walk=folder_walk)
+        finally:
+            if folder_walk: folder_walk.finish()
+
+    # --- SCRAPE COURSE HOMEPAGE ---
+    # Only scrape homepage if it has content
+    if homepage_actual_url and not visited.claim(homepage_actual_url):
+        status_callback("    Course homepage was already crawled in this run.")
+    elif homepage_actual_url:
+        # Determine folder name: if homepage content_id matches any section content_id, use that section's name
+        homepage_folder_name = "Course Home"
+        homepage_content_id = get_content_id(homepage_actual_url)
+        
+        for section in available_sections_to_scrape:
+            section_content_id = get_content_id(section["url"])
+            if homepage_content_id and section_content_id and homepage_content_id == section_content_id:
+                homepage_folder_name = section["name"]
+                status_callback(f"    Course homepage is the same as '{section['name']}' section (content_id: {homepage_content_id}).")
+                break
+        
+        status_callback(f"    Scraping course homepage to '{homepage_folder_name}' folder (downloads start as items are found)...")
+        content_map_for_homepage = engine.open_pipeline(base_course_download_dir, progress_callback, visited=visited)
+        
+        with TRACER.span("section", "course", name=homepage_folder_name, url=homepage_actual_url):
+            try:
+                crawl(homepage_actual_url, content_map_for_homepage, homepage_folder_name, html=homepage_html)
+            except LeaseLostError:
+                raise
+            except Exception as e_homepage:
+                status_callback(f"      Error scraping course homepage: {e_homepage}")
+            finally:
+                _finish_pipeline(content_map_for_homepage, "course homepage", status_callback)
+    # --- END HOMEPAGE SCRAPING ---
+
+
+    if not available_sections_to_scrape:
+        status_callback(f"    No relevant sections found or accessible for course '{course_name_cleaned}'.")
+        return
+
+    for section_info in available_sections_to_scrape:
+        section_name_to_find = section_info["name"]
+        section_target_url = section_info["url"]
+        status_callback(f"  Processing available section: '{section_name_to_find}'")
+        
+        # The homepage, another section or a folder crawled earlier may be this same content page
+        if not visited.claim(section_target_url):
+            status_callback(f"    SKIPPING '{section_name_to_find}' - already crawled in this run (homepage, another section or a folder)")
+            continue
+        
+        content_map_for_section = engine.open_pipeline(base_course_download_dir, progress_callback, visited=visited)
+        with TRACER.span("section", "course", name=section_name_to_find, url=section_target_url):
+            try:
+                status_callback(f"    Navigating to section '{section_name_to_find}' via URL: {section_target_url}")
+                if driver:
+                    with TRACER.span("page", "crawl", url=section_target_url, via="browser"):
+                        driver.get(section_target_url)
+
+                    try:
+                        # Wait for the content area of the section page to load
+                        # This wait is specific to the section page, so 10-15s is reasonable
+                        _wait_until(WebDriverWait(driver, 10), EC.presence_of_element_located((By.ID, "content_listContainer")),
+                                    f"{section_name_to_find} content list")
+                        status_callback(f"      Section '{section_name_to_find}' content area loaded.")
+                    except TimeoutException:
+                        status_callback(f"      Timeout: Section '{section_name_to_find}' loaded, but 'content_listContainer' not found. Scraping might be limited or fail.")
+            
+                status_callback(f"      Scanning '{section_name_to_find}' for files and folders...")
+                clean_section_folder_name = re.sub(r'[\\/*?:"<>|]', "_", section_name_to_find)
+            
+                crawl(section_target_url, content_map_for_section, clean_section_folder_name)
+
+            except LeaseLostError:
+                raise
+            # These exceptions relate to issues on the section page itself (e.g., content_listContainer not appearing)
+            except Exception as e_section_processing:
+                status_callback(f"    - An unexpected error occurred while processing section '{section_name_to_find}': {type(e_section_processing).__name__} - {e_section_processing}")
+            finally:
+                _finish_pipeline(content_map_for_section, f"'{section_name_to_find}'", status_callback)
+
+
+def configure_session_pool(session, max_workers):
+    """
+    Mounts HTTP adapters whose connection pool is large enough for max_workers
+    threads, so concurrent downloads reuse keep-alive connections instead of
+    discarding them ("Connection pool is full").
+    """
+    pool_size = max(1, int(max_workers))
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class TokenBucket:
+    """
+    Classic token bucket: rate tokens per second, bursts of up to capacity. acquire(n) reserves n tokens and
+    sleeps until they are covered, so concurrent callers are served in turn. A rate of None/0 never blocks.
+    """
+    def __init__(self, rate=None, capacity=None):
+        self.rate = float(rate) if rate else None
+        self.capacity = float(capacity or self.rate or 0)
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate) - amount
+            self._stamp = now
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _retry_after_seconds(r):
+    """The Retry-After of a response in seconds (it may be a delay or an HTTP date), or None."""
+    value = (r.headers.get('retry-after') or '').strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostUnavailableError(requests.exceptions.ConnectionError):
+    """Raised instead of contacting a server whose circuit breaker is open."""
+
+
+class IncompleteTransferError(IOError):
+    """The connection ended before the announced Content-Length arrived (the .part file is kept for resuming)."""
+
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error):
+    """
+    True for failures worth trying again shortly: dropped connections, timeouts, truncated bodies and
+    408/425/429/5xx answers. Other HTTP errors (403, 404...), disk errors, an open circuit breaker and
+    lost logins are fatal for the attempt.
+    """
+    if isinstance(error, HostUnavailableError):
+        return False
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                              requests.exceptions.ChunkedEncodingError, IncompleteTransferError))
+
+
+class RetryPolicy:
+    """
+    Retries transient failures (see is_retryable) up to attempts times in all, sleeping a random
+    0..min(max_delay, base_delay * 2**n) seconds before retry n+1 ("full jitter", so workers that failed
+    together do not come back together), or longer if the failed answer had a Retry-After.
+    This is the only retry layer: RateLimits.request sends each request once.
+    """
+    def __init__(self, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        self.attempts = max(1, int(attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, retry_number):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry_number))
+
+    def call(self, func, *args, on_retry=None, **kwargs):
+        """func(*args, **kwargs), retried on transient errors; on_retry(error, attempt, delay) is called before each wait."""
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.attempts or not is_retryable(e):
+                    raise
+                delay = self.delay(attempt - 1)
+                response = getattr(e, 'response', None)
+                retry_after = _retry_after_seconds(response) if response is not None else None
+                if retry_after is not None:
+                    delay = max(delay, min(retry_after, MAX_RETRY_AFTER))
+                METRICS.inc("retries_total")
+                if on_retry: on_retry(e, attempt, delay)
+                with TRACER.span("retry_backoff", "pacing", attempt=attempt, delay=delay, cause=type(e).__name__):
+                    time.sleep(delay)
+
+
+class CircuitBreaker:
+    """
+    Per-server circuit breaker: after threshold consecutive failures (connection errors, timeouts, 5xx)
+    the circuit opens and requests fail immediately with HostUnavailableError for cooldown seconds.
+    Then a single trial request is let through; its success closes the circuit, its failure reopens it.
+    """
+    def __init__(self, host, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.host = host
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._open_until = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self._open_until is None:
+                return
+            if time.monotonic() < self._open_until or self._trial_running:
+                raise HostUnavailableError(f"{self.host} failed {self._failures} times in a row; not contacting it for now")
+            self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._open_until = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.threshold:
+                if self._open_until is None or self._trial_running: METRICS.inc("circuit_breaker_trips_total", host=self.host)
+                self._open_until = time.monotonic() + self.cooldown
+                self._trial_running = False
+
+    def reopens_in(self):
+        """Seconds until a trial request is allowed (0 when the circuit is closed)."""
+        with self._lock:
+            return max(0.0, self._open_until - time.monotonic()) if self._open_until is not None else 0.0
+
+
+class HostThrottle:
+    """
+    Pacing for one server. Used as a context manager it is a concurrency slot whose window adapts AIMD-style:
+    +1/window per successful request up to max_concurrency, halved when the server pushes back (429, 503,
+    connection reset). Requests additionally take a token from the host's requests-per-second bucket and wait
+    out any Retry-After pause the server asked for. breaker is the host's CircuitBreaker.
+    """
+    def __init__(self, max_concurrency=MAX_CONNECTIONS_PER_HOST, requests_per_second=None, host=""):
+        self.breaker = CircuitBreaker(host)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.window = float(self.max_concurrency)
+        self.requests = TokenBucket(requests_per_second, capacity=max(1.0, requests_per_second or 0))
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_backoff = 0.0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            if self._in_flight >= int(self.window):
+                with TRACER.span("host_slot_wait", "pacing", host=self.breaker.host):
+                    while self._in_flight >= int(self.window):
+                        self._cond.wait()
+            self._in_flight += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def wait_turn(self):
+        while True:
+            with self._cond:
+                delay = self._paused_until - time.monotonic()
+            if delay <= 0:
+                break
+            time.sleep(delay)
+        self.requests.acquire()
+
+    def on_success(self):
+        with self._cond:
+            if self.window < self.max_concurrency:
+                self.window = min(float(self.max_concurrency), self.window + 1.0 / self.window)
+                self._cond.notify_all()
+
+    def back_off(self, pause):
+        """Halves the window (once per BACKOFF_COOLDOWN, however many requests fail together) and pauses the host."""
+        now = time.monotonic()
+        with self._cond:
+            if now - self._last_backoff >= BACKOFF_COOLDOWN:
+                self.window = max(1.0, self.window / 2)
+                self._last_backoff = now
+            self._paused_until = max(self._paused_until, now + min(pause, MAX_RETRY_AFTER))
+
+
+class RateLimits:
+    """
+    Per-run pacing shared by the crawler and the download workers: a HostThrottle per server, an optional
+    requests-per-second limit per server and an optional bytes-per-second limit for all transfers together.
+    budget (a SharedBudget) adds the limits shared with other worker processes; its bandwidth replaces bytes_per_second.
+    """
+    def __init__(self, requests_per_second=None, bytes_per_second=None, max_concurrency=MAX_CONNECTIONS_PER_HOST, budget=None):
+        self.requests_per_second = requests_per_second
+        self.max_concurrency = max_concurrency
+        self.budget = budget
+        self.bandwidth = budget.bandwidth if budget and budget.bandwidth else TokenBucket(bytes_per_second, capacity=bytes_per_second)
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def for_host(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = HostThrottle(self.max_concurrency, self.requests_per_second, host)
+            return self._hosts[host]
+
+    def unavailable_for(self):
+        """Seconds until every server with an open circuit breaker may be tried again."""
+        with self._lock:
+            throttles = list(self._hosts.values())
+        return max([throttle.breaker.reopens_in() for throttle in throttles] or [0.0])
+
+    def request(self, session, method, url, **kwargs):
+        """
+        session.request() paced by url's HostThrottle, sent once; the response is returned whatever its status.
+        429/503 answers and connection resets shrink the host's window and pause it (for the Retry-After, if
+        given); retrying them is left to the caller's RetryPolicy. Does not take a concurrency slot itself.
+        Connection errors, timeouts and other 5xx answers count towards the host's circuit breaker; while it is
+        open, HostUnavailableError is raised without sending anything.
+        """
+        throttle = self.for_host(url)
+        if self.budget:
+            self.budget.check()
+        throttle.breaker.before_request()
+        throttle.wait_turn()
+        if self.budget and self.budget.requests:
+            self.budget.requests.acquire()
+        try:
+            r = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            METRICS.inc("http_requests_total", method=method, code="error")
+            throttle.breaker.record_failure()
+            throttle.back_off(RETRY_BASE_DELAY)
+            raise
+        METRICS.inc("http_requests_total", method=method, code=str(r.status_code))
+        if r.status_code in (429, 503):
+            # The server is pushing back, not failing: pace down without counting it towards the breaker
+            retry_after = _retry_after_seconds(r)
+            throttle.back_off(retry_after if retry_after is not None else RETRY_BASE_DELAY)
+            return r
+        if r.status_code >= 500:
+            throttle.breaker.record_failure()
+        else:
+            throttle.breaker.record_success()
+            throttle.on_success()
+        return r
+
+
+class DownloadManifest:
+    """
+    Persistent record of every file downloaded so far, keyed by its bbcswebdav URL.
+    Stores the server's ETag/Last-Modified, the size and SHA-256 of the saved bytes and
+    where they were saved, so later runs can send conditional GETs and skip on 304.
+    Safe to share between download threads.
+    """
+    def __init__(self, path=MANIFEST_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, size INTEGER,"
+                " path TEXT, sha256 TEXT, updated_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_etag_size ON files (etag, size)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS folders ("
+                " key TEXT PRIMARY KEY, url TEXT, listing TEXT, subtree TEXT, entries TEXT, children TEXT, verified_at REAL)"
+            )
+
+    def lookup(self, url):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM files WHERE url = ?", (url,)).fetchone()
+        return dict(row) if row else None
+
+    def find_content(self, sha256=None, etag=None, size=None):
+        """Entries with a known checksum that match sha256 or, without it, the given ETag and size."""
+        with self._lock:
+            if sha256:
+                rows = self._conn.execute("SELECT * FROM files WHERE sha256 = ?", (sha256,)).fetchall()
+            else:
+                rows = self._conn.execute("SELECT * FROM files WHERE etag = ? AND size = ? AND sha256 IS NOT NULL", (etag, size)).fetchall()
+        return [dict(row) for row in rows]
+
+    def record(self, url, etag, last_modified, size, path, sha256=None):
+        with self._lock, self._conn:
+            if sha256 is None:
+                # Keep a previously computed checksum as long as it still describes the same file
+                row = self._conn.execute("SELECT path, size, sha256 FROM files WHERE url = ?", (url,)).fetchone()
+                if row and row["path"] == path and row["size"] == size:
+                    sha256 = row["sha256"]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (url, etag, last_modified, size, path, sha256, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, etag or None, last_modified or None, size, path, sha256, time.time()),
+            )
+
+    def lookup_folder(self, key):
+        """The stored FolderListings record of a folder, with its entries and children decoded, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM folders WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record["entries"], record["children"] = json.loads(record["entries"]), json.loads(record["children"])
+        return record
+
+    def record_folders(self, records, forget=()):
+        """Stores FolderListings records and drops the ones keyed in forget, in one transaction."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO folders (key, url, listing, subtree, entries, children, verified_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(r["key"], r["url"], r["listing"], r["subtree"], json.dumps(r["entries"]), json.dumps(r["children"]), r["verified_at"])
+                 for r in records])
+            self._conn.executemany("DELETE FROM folders WHERE key = ?", [(key,) for key in forget])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BlobStore:
+    """
+    Content-addressed store of downloaded files under <download root>/BLOB_STORE_DIRNAME, one blob per
+    SHA-256. Saved files are hard links to their blob, so bytes that appear in several sections, courses
+    or terms use disk space once. On filesystems without hard links nothing is stored; reused content is
+    copied from an earlier download instead. Safe to share between download threads and course processes.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.can_link = True
+        self._lock = threading.Lock()
+
+    def path_for(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def source_for(self, sha256, size, other_paths=()):
+        """An existing file holding sha256's bytes (its blob, else one of other_paths), checked by size; None if there is none."""
+        for path in [self.path_for(sha256), *other_paths]:
+            if path and os.path.isfile(path) and os.path.getsize(path) == size:
+                return path
+        return None
+
+    def add(self, path, sha256):
+        """
+        Stores the freshly downloaded file at path under sha256. If those bytes were stored already, path is
+        replaced by a link to the stored copy and True is returned.
+        """
+        if not self.can_link:
+            return False
+        blob_path = self.path_for(sha256)
+        with self._lock:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            try:
+                os.link(path, blob_path)
+                return False
+            except FileExistsError:
+                pass # Stored earlier (possibly just now by another course worker)
+            except OSError:
+                self.can_link = False # FAT/exFAT drives and some network shares
+                return False
+            if os.path.samefile(path, blob_path):
+                return False
+            if os.path.getsize(blob_path) != os.path.getsize(path):
+                # The blob was modified through one of its links; the new download becomes the stored copy
+                self._link(path, blob_path)
+                return False
+            self._link(blob_path, path)
+            return True
+
+    def place(self, source, dest):
+        """Puts source's bytes at dest: a hard link where possible, else a copy. dest is replaced atomically."""
+        with self._lock:
+            self._link(source, dest)
+
+    def _link(self, source, dest):
+        temp_path = dest + ".dedup"
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+        try:
+            if not self.can_link:
+                raise OSError("hard links unavailable")
+            os.link(source, temp_path)
+        except OSError:
+            shutil.copyfile(source, temp_path)
+        os.replace(temp_path, dest)
+
+
+def _conditional_headers(entry, base_course_dir):
+    """
+    Builds If-None-Match/If-Modified-Since headers from a manifest entry, but only when the file
+    it describes is still on disk, inside this course's folder and of the recorded size.
+    """
+    if not entry or not entry.get('path'):
+        return {}
+    path = entry['path']
+    inside_course = os.path.normcase(os.path.abspath(path)).startswith(os.path.normcase(os.path.abspath(base_course_dir)) + os.sep)
+    if not inside_course or not os.path.isfile(path) or os.path.getsize(path) != entry.get('size'):
+        return {}
+    return _validator_headers(entry)
+
+
+def _validator_headers(entry):
+    headers = {}
+    if entry.get('etag'): headers["If-None-Match"] = entry['etag']
+    if entry.get('last_modified'): headers["If-Modified-Since"] = entry['last_modified']
+    return headers
+
+
+def _matches_manifest(entry, path, etag, last_modified, size):
+    if not entry or os.path.abspath(path) != entry.get('path') or size != entry.get('size'):
+        return False
+    if etag:
+        return etag == entry.get('etag')
+    return bool(last_modified) and last_modified == entry.get('last_modified')
+
+
+def _item_name_parts(item_type, original_name):
+    """Splits a content_map item's name into (cleaned base name, extension guessed from the name or "")."""
+    base_name_candidate = original_name
+    ext_candidate = ""
+
+    # If it's a file, try to split extension more traditionally
+    if item_type == "File":
+        potential_base, potential_ext = os.path.splitext(original_name)
+        # Check if the potential_ext is a known or common-looking extension
+        if potential_ext and len(potential_ext) > 1 and len(potential_ext) <= 5 and potential_ext[1:].isalnum():
+            base_name_candidate = potential_base
+            ext_candidate = potential_ext
+        # else, keep original_name as base_name_candidate, ext_candidate remains ""
+    # For WebLinks, or files where splitext gave an unusual "extension", 
+    # treat the whole original_name as the base for cleaning.
+    # The .url extension will be added specifically for WebLinks later.
+
+    # Clean the base name candidate (this will be used for both File base and WebLink base)
+    # Allow dots within the name initially, they will be handled during final filename construction.
+    clean_base_name = re.sub(r'[^\w\s\-\.]', '_', base_name_candidate).strip()
+    clean_base_name = re.sub(r'\s+', ' ', clean_base_name) # Consolidate multiple spaces
+    if not clean_base_name: 
+        clean_base_name = "untitled_item" 
+    return clean_base_name, ext_candidate
+
+
+def _weblink_filename(clean_base_name):
+    """The '.url' shortcut filename a WebLink item is saved under."""
+    # For WebLinks, 'clean_base_name' (derived from original_name) is what we want.
+    # Remove any characters that are invalid for filenames, including dots that aren't part of the final .url extension.
+    base_for_weblink = re.sub(r'[\\/*?:"<>|.]', "_", clean_base_name) # Replace dots with underscore
+    base_for_weblink = re.sub(r'_+', '_', base_for_weblink).strip('_') # Consolidate underscores
+
+    if not base_for_weblink: base_for_weblink = "weblink_shortcut"
+
+    clean_link_filename = base_for_weblink[:195] + ".url"
+    return clean_link_filename
+
+
+def _resolve_filename(clean_base_name, ext_candidate, url, headers, fallback_ext=""):
+    """
+    The filename a File item is saved under: its cleaned name plus an extension taken from the item name,
+    the server's filename (Content-Disposition, else the URL) or the Content-Type, in that order.
+    """
+    server_fname_raw = ""
+    if "content-disposition" in headers:
+        fname_match = re.findall(r'filename\*?=(?:UTF-\d{1,2}\'\')?([^";\n]+)', headers['content-disposition'], re.IGNORECASE)
+        if fname_match: server_fname_raw = requests.utils.unquote(fname_match[0].strip('"\' '))
+    if not server_fname_raw: server_fname_raw = os.path.basename(url.split('?')[0])
+
+    # Get extension from server filename if possible, or from original 'ext_candidate'
+    _, ext_from_server = os.path.splitext(server_fname_raw)
+
+    # Prioritize: 1. ext_candidate (if item_type was File and splitext was good)
+    #             2. ext_from_server
+    #             3. MIME type map
+    #             4. fallback_ext (e.g. the extension the file was saved with before)
+    final_ext = ext_candidate or ext_from_server or MIME_TYPE_MAP.get(headers.get('content-type', '').split(';')[0].lower(), "") or fallback_ext
+
+    if final_ext and not final_ext.startswith('.'): 
+        final_ext = '.' + final_ext
+
+    # Now, clean_base_name should not have the extension part if final_ext is determined
+    # If clean_base_name ends with what we think is the final_ext, remove it to avoid duplication.
+    temp_clean_base = clean_base_name
+    if final_ext and temp_clean_base.lower().endswith(final_ext.lower()):
+        temp_clean_base = temp_clean_base[:-len(final_ext)]
+
+    # Final sanitization for filesystem (remove any remaining problematic chars from base)
+    # and ensure no dots are left in this base part that could be misinterpreted as extension sep.
+    final_base_for_file = re.sub(r'[\\/*?:"<>|.]', "_", temp_clean_base) # Replace dots in base with underscore
+    final_base_for_file = re.sub(r'_+', '_', final_base_for_file).strip('_') # Consolidate underscores
+
+    final_filename_to_save = final_base_for_file + final_ext
+    final_filename_to_save = final_filename_to_save[:200] # Limit overall length
+
+    if not final_base_for_file: # if base became empty after stripping underscores
+        final_filename_to_save = "downloaded_file" + final_ext
+    return final_filename_to_save
+
+
+def _response_validator(r):
+    """Returns a validator usable in If-Range: a strong ETag if the server sent one, else Last-Modified."""
+    etag = r.headers.get('etag', '')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return r.headers.get('last-modified', '')
+
+
+def _content_range_start(r):
+    match = re.match(r'bytes\s+(\d+)-', r.headers.get('content-range', ''))
+    return int(match.group(1)) if match else -1
+
+
+def _entity_length(r):
+    """The size of the whole file r is (part of): the Content-Range total of a 206, else the Content-Length (0 if unknown)."""
+    if r.status_code == 206:
+        match = re.match(r'bytes\s+\d+-\d+/(\d+)', r.headers.get('content-range', ''))
+        return int(match.group(1)) if match else 0
+    return int(r.headers.get('content-length', 0) or 0)
+
+
+def _part_meta_path(folder, url):
+    """The resume record of url's in-progress download in folder. Keyed by the URL, so it is found before a response names the file."""
+    return os.path.join(folder, ".resume-" + hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + PART_SUFFIX + ".json")
+
+
+def _discard_part(meta_path, part_path):
+    for path in (part_path, meta_path):
+        try: os.remove(path)
+        except OSError: pass
+
+
+def _read_part_meta(meta_path):
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_part_meta(meta_path, url, validator, size, part_path):
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump({"url": url, "validator": validator, "size": size, "part": os.path.basename(part_path)}, f)
+
+
+def _write_chunk_size(expected_length, bandwidth=None):
+    size = min(WRITE_CHUNK_MAX, max(WRITE_CHUNK_MIN, (expected_length or 0) // 64))
+    if bandwidth and bandwidth.rate:
+        # Keep each bandwidth reservation to about a quarter second of transfer so the pacing stays smooth
+        size = min(size, max(8192, int(bandwidth.rate / 4)))
+    return size
+
+
+def _preallocate(f, length):
+    """Reserves length bytes after the current end of f where the OS supports it; the caller truncates back to the data."""
+    if length and hasattr(os, "posix_fallocate"):
+        try: os.posix_fallocate(f.fileno(), f.tell(), length)
+        except OSError: pass # Filesystem without fallocate support: it just grows as it is written
+
+
+def _expected_body_length(r):
+    """The body length r announces, or 0 when unknown (no Content-Length, or only the length before decoding)."""
+    encoded = r.headers.get('content-encoding', 'identity').lower() not in ('', 'identity')
+    return 0 if encoded else int(r.headers.get('content-length', 0) or 0)
+
+
+def _stream_body(r, f, expected_length=0, hasher=None, bandwidth=None):
+    """Copies the body of r into the file object f in large chunks, updating hasher and pacing by bandwidth. Returns the bytes written."""
+    written = 0
+    try:
+        for chunk in r.iter_content(chunk_size=_write_chunk_size(expected_length, bandwidth)):
+            if chunk:  # filter out keep-alive new chunks
+                if bandwidth: bandwidth.acquire(len(chunk))
+                f.write(chunk)
+                written += len(chunk)
+                if hasher: hasher.update(chunk)
+    finally:
+        METRICS.inc("bytes_downloaded_total", written)
+    return written
+
+
+def _write_body(r, path, mode, hasher=None, bandwidth=None):
+    """
+    Streams the body of r into path ('wb', or 'ab' to append to a partial file) in large chunks, after
+    reserving the announced Content-Length on disk. hasher, if given, is updated in the same pass, and
+    bandwidth (a TokenBucket) paces the transfer.
+    """
+    expected_length = _expected_body_length(r)
+    # Appending opens the file 'r+b' at its end rather than 'ab': with O_APPEND every write lands after the space
+    # _preallocate reserved, leaving a gap of zeros and cutting the data at the truncate below
+    with open(path, 'r+b' if mode == 'ab' else mode) as f:
+        f.seek(0, os.SEEK_END)
+        _preallocate(f, expected_length)
+        try:
+            _stream_body(r, f, expected_length, hasher, bandwidth)
+        finally:
+            # Drop whatever the preallocation reserved beyond the data received - all of it if the transfer broke off,
+            # so the size of a kept .part file is still the resume offset
+            f.truncate(f.tell())
+
+
+def _hash_existing(path, hasher):
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(block)
+
+
+class DownloadEngine:
+    """
+    Downloads content_map items concurrently over one shared requests.Session.
+    Work runs on a bounded thread pool; rate_limits (a RateLimits, by default one
+    capped at per_host_limit transfers per server) paces and adapts how many
+    transfers any single server sees at once, and SAVED/SKIPPED/FAILED/LINKED
+    outcomes are aggregated under a lock so the totals are safe to read from any thread.
+    With a blob_store (and manifest), content already downloaded for another URL or folder is
+    linked instead of fetched again; those saves are also counted as DEDUPED.
+    Transient failures are retried per retry_policy; files that still fail that way (or whose server's
+    circuit breaker is open) are kept and tried once more by retry_failed() at the end of the run.
+    """
+    dry_run = False # Set by SyncPlanner, which only inspects items
+    writes_folders = True # False for SyncPlanner (writes nothing) and ArchiveEngine (writes archives)
+    work_noun = "downloads"
+
+    def __init__(self, session, status_callback, max_workers=DEFAULT_DOWNLOAD_WORKERS, per_host_limit=MAX_CONNECTIONS_PER_HOST, manifest=None, blob_store=None,
+                 rate_limits=None, retry_policy=None):
+        self.session = session
+        self.status_callback = status_callback
+        self.manifest = manifest
+        self.blob_store = blob_store
+        self.max_workers = max(1, int(max_workers))
+        self.per_host_limit = max(1, int(per_host_limit))
+        self.rate_limits = rate_limits or RateLimits(max_concurrency=self.per_host_limit)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retry_queue = [] # (base_course_dir, item_info) of transient failures, for retry_failed()
+        self._final_pass = False
+        self.results = Counter()
+        self._results_lock = threading.Lock()
+        self._path_locks = {}
+        self._locks_guard = threading.Lock()
+        configure_session_pool(session, self.max_workers)
+
+    def _host_slot(self, url):
+        return self.rate_limits.for_host(url)
+
+    def _get(self, url, headers=None, timeout=300):
+        return self.rate_limits.request(self.session, "GET", url, stream=True, timeout=timeout, allow_redirects=True, headers=headers)
+
+    def _path_lock(self, path):
+        # Two different URLs can resolve to the same filename; never let them write it at once.
+        with self._locks_guard:
+            return self._path_locks.setdefault(os.path.normcase(os.path.abspath(path)), threading.Lock())
+
+    def _record(self, outcome, section_results):
+        with self._results_lock:
+            self.results[outcome] += 1
+            section_results[outcome] += 1
+        METRICS.inc("items_total", outcome=outcome.lower())
+
+    def summarize(self, results):
+        return (f"[Done: {results['SAVED']} saved, {results['SKIPPED']} skipped, "
+                f"{results['FAILED']} failed, {results['LINKED']} links]")
+
+    def close(self):
+        """Finishes the output of the run; nothing to do when files are saved into folders."""
+
+    def _count_deduplicated(self):
+        with self._results_lock:
+            self.results['DEDUPED'] += 1
+        METRICS.inc("items_deduplicated_total")
+
+    def download_items(self, base_course_dir, items, progress_callback=None):
+        """Downloads/links every item and returns a Counter of outcomes for this batch."""
+        pipeline = self.open_pipeline(base_course_dir, progress_callback, expected_total=len(items))
+        try:
+            pipeline.extend(items)
+        finally:
+            section_results = pipeline.close()
+        return section_results
+
+    def retry_failed(self, progress_callback=None):
+        """
+        Gives every queued transient failure one more round (with the usual retries), after waiting for
+        any open circuit breaker to allow a trial. Items failing again stay FAILED; recovered ones move
+        to their new outcome and are also counted as RECOVERED. Returns the Counter of this round.
+        """
+        with self._results_lock:
+            pending, self.retry_queue = self.retry_queue, []
+        round_results = Counter()
+        if not pending:
+            return round_results
+        wait = self.rate_limits.unavailable_for()
+        self.status_callback(f"\n--- Retrying {len(pending)} failed download(s)" + (f" in {wait:.0f}s" if wait else "") + " ---")
+        if wait: time.sleep(wait)
+        by_folder = {}
+        for base_course_dir, item_info in pending:
+            by_folder.setdefault(base_course_dir, []).append(item_info)
+        self._final_pass = True
+        try:
+            with self._results_lock:
+                self.results['FAILED'] -= len(pending) # Counted again below if they fail for good
+            METRICS.inc("items_total", -len(pending), outcome="failed") # Likewise, so each item is counted once per run
+            for base_course_dir, items in by_folder.items():
+                round_results.update(self.download_items(base_course_dir, items, progress_callback))
+        finally:
+            self._final_pass = False
+        with self._results_lock:
+            self.results['RECOVERED'] += len(pending) - round_results['FAILED']
+        self.status_callback(f"      {self.summarize(round_results)}")
+        return round_results
+
+    def _defer(self, base_course_dir, item_info, error):
+        """Queues a file that failed for a transient reason for retry_failed() (not during the final round)."""
+        if self._final_pass or not (is_retryable(error) or isinstance(error, HostUnavailableError)):
+            return
+        with self._results_lock:
+            self.retry_queue.append((base_course_dir, item_info))
+
+    def _log_retry(self, name):
+        def log(error, attempt, delay):
+            self.status_callback(f"          - RETRY {attempt}/{self.retry_policy.attempts - 1} in {delay:.1f}s: {name} - {error}", logging.WARNING)
+        return log
+
+    def open_pipeline(self, base_course_dir, progress_callback=None, expected_total=None, visited=None):
+        """
+        Starts download workers for base_course_dir and returns the DownloadPipeline feeding them.
+        The pipeline can be handed to a crawler as its content_map, so downloads begin while the crawl is still running.
+        With a shared VisitedIndex, files already queued by another pipeline of the run are left out.
+        """
+        return DownloadPipeline(self, base_course_dir, progress_callback, expected_total, visited=visited)
+
+    def _run_item(self, base_course_dir, item_info, position, total, section_results):
+        with TRACER.span("item", "download", name=item_info.get('name'), type=item_info.get('type'), url=item_info.get('url')) as span:
+            try:
+                outcome = self._process_item(base_course_dir, item_info, position, total)
+            except LeaseLostError:
+                raise
+            except Exception as e:
+                self.status_callback(f"          - FAILED (General Error): {item_info.get('name', 'untitled')} - {e}", logging.WARNING)
+                outcome = "FAILED"
+            span["outcome"] = outcome
+        self._record(outcome, section_results)
+        return outcome
+
+    def _resumable_part(self, final_folder_path, url):
+        """
+        (part path, bytes held, validator) of an interrupted download of url into final_folder_path that can be
+        resumed, or None. The .part must be shorter than the file it was recorded for and come with a validator.
+        """
+        meta_path = _part_meta_path(final_folder_path, url)
+        saved_meta = _read_part_meta(meta_path)
+        if saved_meta.get('url') != url or not saved_meta.get('validator') or not saved_meta.get('part'):
+            return None
+        part_path = os.path.join(final_folder_path, saved_meta['part'])
+        try: existing_size = os.path.getsize(part_path)
+        except OSError: return None
+        if not 0 < existing_size < (saved_meta.get('size') or float('inf')):
+            _discard_part(meta_path, part_path) # Nothing to resume from (or already complete and never renamed): start over
+            return None
+        return part_path, existing_size, saved_meta['validator']
+
+    def _download_to_part(self, r, url, final_filepath, hasher=None, resume_offset=0):
+        """
+        Streams the body of r into final_filepath + PART_SUFFIX and atomically renames it into place.
+        With a resume_offset, r is the 206 answer to a ranged request and its body is appended to the
+        .part an earlier, interrupted run left behind. hasher, if given, sees every byte of the file.
+        """
+        part_path = final_filepath + PART_SUFFIX
+        meta_path = _part_meta_path(os.path.dirname(final_filepath), url)
+        total_size = _entity_length(r)
+
+        if resume_offset:
+            if hasher: _hash_existing(part_path, hasher)
+            _write_body(r, part_path, 'ab', hasher, self.rate_limits.bandwidth)
+        else:
+            _write_part_meta(meta_path, url, _response_validator(r), total_size, part_path)
+            _write_body(r, part_path, 'wb', hasher, self.rate_limits.bandwidth)
+
+        received_size = os.path.getsize(part_path)
+        if total_size and received_size != total_size:
+            # Keep the .part and its metadata so the next run can pick up where this one stopped
+            raise IncompleteTransferError(f"Incomplete transfer ({received_size} of {total_size} bytes); partial data kept for resume")
+        os.replace(part_path, final_filepath)
+        try: os.remove(meta_path)
+        except OSError: pass
+
+    def _remember(self, url, etag, last_modified, size, path, sha256=None):
+        if self.manifest:
+            self.manifest.record(url, etag, last_modified, size, os.path.abspath(path), sha256)
+
+    def _stored_copy(self, sha256, size):
+        """A local file with sha256's bytes (blob or earlier download), or None."""
+        if not (self.blob_store and self.manifest and sha256 and size):
+            return None
+        return self.blob_store.source_for(sha256, size, [entry['path'] for entry in self.manifest.find_content(sha256=sha256)])
+
+    def _known_content(self, url, etag, size):
+        """(sha256, local copy) for bytes another URL served under the same strong ETag and size, or None."""
+        if not (self.blob_store and self.manifest and etag and not etag.startswith('W/') and size):
+            return None
+        for entry in self.manifest.find_content(etag=etag, size=size):
+            if entry['url'] != url:
+                source = self._stored_copy(entry['sha256'], size)
+                if source:
+                    return entry['sha256'], source
+        return None
+
+    def _reuse_stored_copy(self, url, source, sha256, etag, last_modified, size, final_filepath):
+        """Saves final_filepath from a local copy of its content instead of downloading it. False if it was already there."""
+        placed = not (os.path.exists(final_filepath) and os.path.getsize(final_filepath) == size)
+        if placed:
+            self.blob_store.place(source, final_filepath)
+            self._count_deduplicated()
+        self._remember(url, etag, last_modified, size, final_filepath, sha256)
+        return placed
+
+    def _download_file(self, base_course_dir, url, final_folder_path, clean_base_name, ext_candidate):
+        """One attempt at a File item: returns SAVED/SKIPPED, raises on failure (for the retry policy to judge)."""
+        manifest_entry = self.manifest.lookup(url) if self.manifest else None
+        request_headers = _conditional_headers(manifest_entry, base_course_dir)
+        stored_copy = None
+        if not request_headers and manifest_entry:
+            # Downloaded before, but for another folder (or deleted here since): if the server reports
+            # it unchanged, the bytes we already hold are reused and the body is never fetched
+            stored_copy = self._stored_copy(manifest_entry.get('sha256'), manifest_entry.get('size'))
+            if stored_copy: request_headers = _validator_headers(manifest_entry)
+        resume = None if stored_copy else self._resumable_part(final_folder_path, url)
+        if resume:
+            # An earlier run stopped part-way: ask for the missing bytes only. If-Range makes the server send
+            # the whole file instead if it changed since
+            request_headers = {"Range": f"bytes={resume[1]}-", "If-Range": resume[2]}
+        with TRACER.span("file", "download", url=url) as span, self._host_slot(url), self._get(url, headers=request_headers) as r:
+            METRICS.observe("file_ttfb_seconds", r.elapsed.total_seconds())
+            span["status"] = r.status_code
+            if r.status_code == 304 and stored_copy:
+                recorded_ext = os.path.splitext(manifest_entry['path'])[1]
+                final_filename_to_save = _resolve_filename(clean_base_name, ext_candidate, url, r.headers, recorded_ext)
+                final_filepath = os.path.join(final_folder_path, final_filename_to_save)
+                with self._path_lock(final_filepath):
+                    placed = self._reuse_stored_copy(url, stored_copy, manifest_entry['sha256'], manifest_entry.get('etag'),
+                                                     manifest_entry.get('last_modified'), manifest_entry['size'], final_filepath)
+                if not placed:
+                    self.status_callback(f"          - SKIPPED (not modified): {final_filename_to_save}", DETAIL)
+                    return "SKIPPED"
+                self.status_callback(f"          - SAVED (not modified; reused the copy downloaded earlier): {final_filename_to_save}", DETAIL)
+                return "SAVED"
+            if r.status_code == 304:
+                # Unchanged since the last run, and the manifest already confirmed the local copy
+                self.status_callback(f"          - SKIPPED (not modified): {os.path.basename(manifest_entry['path'])}", DETAIL)
+                return "SKIPPED"
+            if resume and r.status_code == 416:
+                # The server has fewer bytes than the .part holds under the same validator: it cannot be resumed
+                _discard_part(_part_meta_path(final_folder_path, url), resume[0])
+                raise IncompleteTransferError("The partial download no longer fits the file on the server; discarded to download it again")
+            r.raise_for_status() 
+            final_filename_to_save = _resolve_filename(clean_base_name, ext_candidate, url, r.headers)
+            final_filepath = os.path.join(final_folder_path, final_filename_to_save)
+            resumed_from = 0
+            if resume and r.status_code == 206:
+                if _content_range_start(r) != resume[1] or final_filepath + PART_SUFFIX != resume[0]:
+                    _discard_part(_part_meta_path(final_folder_path, url), resume[0])
+                    raise IncompleteTransferError("The server answered the resume request with another range; partial data discarded")
+                resumed_from = resume[1]
+            elif resume and final_filepath + PART_SUFFIX != resume[0]:
+                # Sent whole (changed since, or ranges unsupported) and now named differently: the old .part is of no use
+                _discard_part(_part_meta_path(final_folder_path, url), resume[0])
+
+            etag = r.headers.get('etag', '')
+            last_modified = r.headers.get('last-modified', '')
+            with self._path_lock(final_filepath):
+                # Check if file already exists
+                if os.path.exists(final_filepath):
+                    try:
+                        content_length = _entity_length(r)
+                        existing_size = os.path.getsize(final_filepath)
+
+                        if content_length > 0:
+                            # Server provided size - compare it
+                            if existing_size == content_length:
+                                self._remember(url, etag, last_modified, existing_size, final_filepath)
+                                self.status_callback(f"          - SKIPPED (already exists with same size): {final_filename_to_save}", DETAIL)
+                                return "SKIPPED"
+                            # Sizes differ - will re-download
+                        elif _matches_manifest(manifest_entry, final_filepath, etag, last_modified, existing_size):
+                            # No Content-Length header, but the server validator still matches what we saved last time
+                            self.status_callback(f"          - SKIPPED (unchanged since last download): {final_filename_to_save}", DETAIL)
+                            return "SKIPPED"
+                        elif manifest_entry is None:
+                            # No Content-Length and no history for this URL - assume the existing file is correct
+                            self._remember(url, etag, last_modified, existing_size, final_filepath)
+                            self.status_callback(f"          - SKIPPED (already exists): {final_filename_to_save}", DETAIL)
+                            return "SKIPPED"
+                        # Otherwise the validator changed since the recorded download - will re-download
+                    except Exception:
+                        # If any error checking, skip the file (assume it's good)
+                        self.status_callback(f"          - SKIPPED (already exists): {final_filename_to_save}", DETAIL)
+                        return "SKIPPED"
+
+                # Same content already downloaded under another URL? Link it instead of reading the body
+                known_content = self._known_content(url, etag, _entity_length(r))
+                if known_content:
+                    r.close()
+                    sha256, source = known_content
+                    self._reuse_stored_copy(url, source, sha256, etag, last_modified, os.path.getsize(source), final_filepath)
+                    self.status_callback(f"          - SAVED (same content as an earlier download, not fetched): {final_filename_to_save}", DETAIL)
+                    return "SAVED"
+
+                # Download into a .part file (resuming a previous partial transfer when possible), then rename into place
+                hasher = hashlib.sha256() if self.manifest or self.blob_store else None
+                transfer_started = time.perf_counter()
+                self._download_to_part(r, url, final_filepath, hasher, resumed_from)
+                transfer_seconds = time.perf_counter() - transfer_started
+                span["bytes"] = received = os.path.getsize(final_filepath) - resumed_from
+                METRICS.observe("file_transfer_seconds", transfer_seconds)
+                if transfer_seconds > 0:
+                    METRICS.observe("file_throughput_bytes_per_second", received / transfer_seconds)
+                sha256 = hasher.hexdigest() if hasher else None
+                deduplicated = self.blob_store.add(final_filepath, sha256) if self.blob_store else False
+                self._remember(url, etag, last_modified, os.path.getsize(final_filepath), final_filepath, sha256)
+            if deduplicated:
+                self._count_deduplicated()
+                self.status_callback(f"          - SAVED (identical to an earlier download, stored once): {final_filename_to_save}", DETAIL)
+            elif resumed_from:
+                self.status_callback(f"          - SAVED (resumed after {resumed_from} bytes): {final_filename_to_save}", DETAIL)
+            else:
+                self.status_callback(f"          - SAVED: {final_filename_to_save}", DETAIL)
+            return "SAVED"
+
+    def _process_item(self, base_course_dir, item_info, position, total):
+        item_type = item_info.get('type', 'Unknown')
+        original_name = item_info.get('name', 'untitled')
+        relative_path_within_section = item_info.get('path', '') 
+        url = item_info.get('url')
+
+        item_label = f"{position}/{total}" if total else f"{position}"
+        if not url:
+            self.status_callback(f"      ({position}) Skipping item with no URL: {original_name}", DETAIL)
+            return "SKIPPED"
+
+        final_folder_path = os.path.join(base_course_dir, relative_path_within_section)
+        os.makedirs(final_folder_path, exist_ok=True)
+        
+        clean_base_name, ext_candidate = _item_name_parts(item_type, original_name)
+
+
+        if item_type == "File":
+            self.status_callback(f"        ({item_label}) Downloading File: {os.path.join(relative_path_within_section, original_name)}", DETAIL)
+            try:
+                return self.retry_policy.call(self._download_file, base_course_dir, url, final_folder_path, clean_base_name, ext_candidate,
+                                              on_retry=self._log_retry(original_name))
+            except requests.exceptions.RequestException as e_req:
+                self.status_callback(f"          - FAILED (Request Error): {original_name} - {e_req}", logging.WARNING)
+                self._defer(base_course_dir, item_info, e_req)
+            except IOError as e_io:
+                self.status_callback(f"          - FAILED (File IO Error): {original_name} - {e_io}", logging.WARNING)
+                self._defer(base_course_dir, item_info, e_io)
+            except LeaseLostError:
+                raise
+            except Exception as e: self.status_callback(f"          - FAILED (General Error): {original_name} - {e}", logging.WARNING)
+            return "FAILED"
+        
+        elif item_type == "WebLink":
+            self.status_callback(f"        ({item_label}) Creating Link: {os.path.join(relative_path_within_section, original_name)}", DETAIL)
+            
+            clean_link_filename = _weblink_filename(clean_base_name)
+            final_filepath = os.path.join(final_folder_path, clean_link_filename)
+            try:
+                with self._path_lock(final_filepath), open(final_filepath, 'w', encoding='utf-8') as f: f.write(f"[InternetShortcut]\nURL={url}\n")
+                self.status_callback(f"          - LINK CREATED: {clean_link_filename}", DETAIL)
+                return "LINKED"
+            except Exception as e: self.status_callback(f"          - FAILED creating link: {clean_link_filename} - {e}", logging.WARNING)
+            return "FAILED"
+        else:
+            self.status_callback(f"        ({item_label}) Skipping item of type '{item_type}': {original_name}", DETAIL)
+            return "SKIPPED"
+
+
+class DownloadPipeline:
+    """
+    Bounded producer/consumer queue between a crawler and the DownloadEngine's workers.
+    The crawler append()s content_map entries as it discovers them (blocking when the queue is
+    full, which throttles the crawl to the download rate); worker threads download them straight
+    away. Entries whose URL was already queued - here, or in any pipeline sharing the same
+    VisitedIndex - are ignored; entries without a URL are queued, for the engine to report as skipped.
+    close() drains the queue, stops the workers and returns the Counter of outcomes.
+    A LeaseLostError from an item stops the remaining ones and is raised again by append() and close().
+    """
+    _STOP = object()
+
+    def __init__(self, engine, base_course_dir, progress_callback=None, expected_total=None, queue_size=None, visited=None):
+        self.engine = engine
+        self.base_course_dir = base_course_dir
+        self.progress_callback = progress_callback
+        self.expected_total = expected_total
+        self.results = Counter()
+        self._queue = queue.Queue(maxsize=queue_size or max(DOWNLOAD_QUEUE_SIZE, engine.max_workers * 4))
+        self._visited = visited if visited is not None else VisitedIndex()
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._completed = 0
+        self._closed = False
+        self._stopped = None
+        worker_count = engine.max_workers if expected_total is None else min(engine.max_workers, max(1, expected_total))
+        self._workers = [threading.Thread(target=self._worker, name=f"bb-download-{i+1}", daemon=True) for i in range(worker_count)]
+        for worker in self._workers:
+            worker.start()
+
+    def __len__(self):
+        return self._submitted
+
+    def append(self, item):
+        if self._closed:
+            raise RuntimeError("Cannot add items to a closed download pipeline.")
+        if self._stopped:
+            raise self._stopped
+        url = item.get('url')
+        if url and not self._visited.claim(url, kind="file"):
+            return
+        with self._lock:
+            self._submitted += 1
+            position = self._submitted
+        self._queue.put((position, item)) # Blocks while the workers are behind - this is the backpressure
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def close(self):
+        """Waits for every queued item to finish and returns the outcome Counter. Safe to call more than once."""
+        if not self._closed:
+            self._closed = True
+            for _ in self._workers:
+                self._queue.put(self._STOP)
+            for worker in self._workers:
+                worker.join()
+        if self._stopped:
+            raise self._stopped
+        return self.results
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is self._STOP:
+                return
+            position, item_info = job
+            if self._stopped:
+                continue # Drained without running, so append() and close() never wait on a full queue
+            try:
+                self.engine._run_item(self.base_course_dir, item_info, position, self.expected_total, self.results)
+            except LeaseLostError as e_lease:
+                self._stopped = e_lease
+                continue
+            with self._lock:
+                self._completed += 1
+                done, total = self._completed, self.expected_total or self._submitted
+            if self.progress_callback:
+                self.progress_callback(done / total * 100)
+
+
+@timed_phase("download_batch")
+def process_content_list(session, base_course_dir, content_list, progress_callback, status_callback, max_workers=DEFAULT_DOWNLOAD_WORKERS, engine=None):
+    if not content_list:
+        status_callback("      - No new downloadable files or links found in this section/folder.")
+        return Counter()
+        
+    unique_content_by_url = {}
+    for item in content_list:
+        if item['url'] not in unique_content_by_url:
+            unique_content_by_url[item['url']] = item
+    unique_content = list(unique_content_by_url.values())
+
+    status_callback(f"\n      [Processing {len(unique_content)} unique items for download/linking from this section/folder]")
+
+    # Callers that process several sections share one engine so the per-host caps and totals span the whole run.
+    if engine is None:
+        engine = DownloadEngine(session, status_callback, max_workers=max_workers)
+    section_results = engine.download_items(base_course_dir, unique_content, progress_callback)
+    status_callback(f"      [Done: {section_results['SAVED']} saved, {section_results['SKIPPED']} skipped, "
+                    f"{section_results['FAILED']} failed, {section_results['LINKED']} links]")
+    return section_results
+
+
+class SyncPlanner(DownloadEngine):
+    """
+    Dry-run stand-in for DownloadEngine: handed to download_course, it receives the crawled items through
+    the same pipelines but only asks the server for each file's headers (HEAD, or a conditional request
+    that is answered by 304) and decides what a download would do - no body is ever read and nothing is
+    written. The planned entries per course folder are collected in self.entries.
+    """
+    dry_run = True
+    writes_folders = False
+    work_noun = "checks"
+
+    def __init__(self, session, status_callback, max_workers=DEFAULT_DOWNLOAD_WORKERS, per_host_limit=MAX_CONNECTIONS_PER_HOST, manifest=None, blob_store=None,
+                 rate_limits=None, retry_policy=None):
+        super().__init__(session, status_callback, max_workers, per_host_limit, manifest, blob_store, rate_limits, retry_policy)
+        self.entries = {}
+
+    def summarize(self, results):
+        return (f"[Planned: {results['NEW']} new, {results['CHANGED']} changed, {results['UNCHANGED']} unchanged, "
+                f"{results['FAILED']} failed]")
+
+    def _process_item(self, base_course_dir, item_info, position, total):
+        entry = {"type": item_info.get('type', 'Unknown'), "url": item_info.get('url'), "name": item_info.get('name', 'untitled'),
+                 "path": item_info.get('path', ''), "status": "skipped", "target": None, "bytes": None, "reuse_local_copy": False}
+        try:
+            self._plan_entry(base_course_dir, entry)
+        except Exception as e:
+            entry.update(status="failed", error=f"{type(e).__name__}: {e}")
+            self.status_callback(f"          - CHECK FAILED: {entry['name']} - {e}", logging.WARNING)
+        with self._results_lock:
+            self.entries.setdefault(base_course_dir, []).append(entry)
+        return entry['status'].upper()
+
+    def _probe(self, url, request_headers):
+        """The response headers for url, without its body. Transient failures are retried per retry_policy."""
+        def attempt():
+            with self._host_slot(url):
+                r = self.rate_limits.request(self.session, "HEAD", url, timeout=PAGE_FETCH_TIMEOUT, allow_redirects=True, headers=request_headers)
+                if r.status_code in (405, 501):
+                    # No HEAD support: start a GET and drop the connection once the headers are in
+                    with self._get(url, headers=request_headers, timeout=PAGE_FETCH_TIMEOUT) as r:
+                        pass
+            if r.status_code in RETRYABLE_STATUS_CODES:
+                r.raise_for_status()
+            return r
+        return self.retry_policy.call(attempt, on_retry=self._log_retry(url))
+
+    def _plan_entry(self, base_course_dir, entry):
+        if not entry['url'] or entry['type'] not in ("File", "WebLink"):
+            return
+        final_folder_path = os.path.join(base_course_dir, entry['path'])
+        clean_base_name, ext_candidate = _item_name_parts(entry['type'], entry['name'])
+        if entry['type'] == "WebLink":
+            entry['target'] = os.path.join(final_folder_path, _weblink_filename(clean_base_name))
+            entry['status'] = "unchanged" if os.path.exists(entry['target']) else "new"
+            return
+
+        # Same decisions as DownloadEngine._process_item, taken from the headers alone
+        manifest_entry = self.manifest.lookup(entry['url']) if self.manifest else None
+        request_headers = _conditional_headers(manifest_entry, base_course_dir)
+        stored_copy = None
+        if not request_headers and manifest_entry:
+            stored_copy = self._stored_copy(manifest_entry.get('sha256'), manifest_entry.get('size'))
+            if stored_copy: request_headers = _validator_headers(manifest_entry)
+        r = self._probe(entry['url'], request_headers)
+        if r.status_code == 304:
+            entry['bytes'] = manifest_entry.get('size')
+            if stored_copy:
+                recorded_ext = os.path.splitext(manifest_entry['path'])[1]
+                entry['target'] = os.path.join(final_folder_path, _resolve_filename(clean_base_name, ext_candidate, entry['url'], r.headers, recorded_ext))
+                on_disk = os.path.exists(entry['target']) and os.path.getsize(entry['target']) == entry['bytes']
+                entry['status'], entry['reuse_local_copy'] = ("unchanged", False) if on_disk else ("new", True)
+            else:
+                entry['target'], entry['status'] = manifest_entry['path'], "unchanged"
+            return
+        r.raise_for_status()
+
+        entry['target'] = os.path.join(final_folder_path, _resolve_filename(clean_base_name, ext_candidate, entry['url'], r.headers))
+        content_length = int(r.headers.get('content-length', 0) or 0)
+        etag, last_modified = r.headers.get('etag', ''), r.headers.get('last-modified', '')
+        entry['bytes'] = content_length or None
+        if not os.path.exists(entry['target']):
+            entry['status'] = "new"
+        elif content_length > 0:
+            entry['status'] = "unchanged" if os.path.getsize(entry['target']) == content_length else "changed"
+        elif manifest_entry is None or _matches_manifest(manifest_entry, entry['target'], etag, last_modified, os.path.getsize(entry['target'])):
+            entry['status'] = "unchanged"
+        else:
+            entry['status'] = "changed"
+        if entry['status'] != "unchanged":
+            entry['reuse_local_copy'] = self._known_content(entry['url'], etag, content_length) is not None
+
+
+def _removed_files(base_course_dir, planned_targets):
+    """Files under a course folder that the crawl no longer lists (in-progress and temporary files aside)."""
+    planned = {os.path.normcase(os.path.abspath(target)) for target in planned_targets if target}
+    removed = []
+    for folder, _, filenames in os.walk(base_course_dir):
+        for filename in filenames:
+            path = os.path.join(folder, filename)
+            if filename.endswith((PART_SUFFIX, PART_SUFFIX + ".json", ".dedup")) or os.path.normcase(os.path.abspath(path)) in planned:
+                continue
+            removed.append({"status": "removed", "target": path, "bytes": os.path.getsize(path)})
+    return removed
+
+
+# --- Archive output ---
+
+def _import_zstandard():
+    """Loads the zstandard package, needed for .tar.zst archives only."""
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("Writing .tar.zst archives needs the zstandard package (pip install zstandard).") from None
+    return zstandard
+
+
+def _member_name(*parts):
+    """An archive member name: the non-empty path parts joined with '/', whatever separators they use."""
+    return "/".join(segment for part in parts for segment in re.split(r"[\\/]+", part or "") if segment)
+
+
+def _archive_mtime(last_modified):
+    """The Unix time to store for a member: the server's Last-Modified if readable, else now (never before 1980, for zip)."""
+    try:
+        mtime = email.utils.parsedate_to_datetime(last_modified).timestamp()
+    except (TypeError, ValueError):
+        mtime = time.time()
+    return max(mtime, 315532800)
+
+
+class ArchiveWriter:
+    """
+    One archive file, written by a background thread; see ARCHIVE_FORMATS for the formats. add() queues a
+    member - a file object holding its bytes - and returns at once (blocking only while ARCHIVE_QUEUE_SIZE
+    members wait); the writer thread compresses them one after the other while the next files download.
+    The member index (member name -> {url, size, sha256, etag, last_modified}) is read back when an existing
+    archive is opened and written at its end by close(), so later runs append new members and replace changed
+    ones without extracting anything. The run works on a copy, path + PART_SUFFIX, that close() renames over
+    path once it is complete: a run that dies, or that fails to write a member, leaves the previous archive
+    as it was (and needs room for the copy while it runs). Safe to share between download threads.
+    """
+    extension = ""
+
+    def __init__(self, path):
+        self.path = path
+        self.work_path = path + PART_SUFFIX
+        self.index = {}
+        self._by_url = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=ARCHIVE_QUEUE_SIZE)
+        self._error = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._open()
+        for name, entry in self.index.items():
+            self._by_url[entry['url']] = name
+        self._thread = threading.Thread(target=self._run, name="bb-archive", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def check_available(cls):
+        """Raises RuntimeError when a package the format needs is missing."""
+
+    def entry(self, member):
+        with self._lock:
+            return self.index.get(member)
+
+    def entry_for_url(self, url):
+        """(member name, index entry) of the member last written for url, or (None, None)."""
+        with self._lock:
+            member = self._by_url.get(url)
+            return member, self.index.get(member)
+
+    def add(self, member, fileobj, entry, mtime):
+        """Queues fileobj (read from its start, closed once written) as member, replacing any member of that name."""
+        if self._error:
+            fileobj.close()
+            raise IOError(f"Archive {self.path} could not be written: {self._error}")
+        with self._lock:
+            self.index[member] = entry
+            self._by_url[entry['url']] = member
+        self._queue.put((member, fileobj, entry, mtime)) # Blocks while the writer is behind
+
+    def spool(self):
+        """A file object for a member's bytes: in memory up to ARCHIVE_SPOOL_BYTES, then a temporary file beside the archive."""
+        return tempfile.SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_BYTES, dir=os.path.dirname(os.path.abspath(self.path)))
+
+    def add_bytes(self, member, data, entry, mtime):
+        fileobj = self.spool()
+        fileobj.write(data)
+        self.add(member, fileobj, entry, mtime)
+
+    def update_entry(self, member, entry):
+        """Records new validators for a member whose bytes did not change, without writing it again."""
+        with self._lock:
+            self.index[member] = entry
+            self._by_url[entry['url']] = member
+
+    def _discard(self):
+        """Closes the working copy without finishing it, so close() can delete it."""
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            member, fileobj, entry, mtime = job
+            try:
+                if self._error is None:
+                    with TRACER.span("archive_member", "archive", member=member, bytes=entry['size']):
+                        fileobj.seek(0)
+                        self._write_member(member, fileobj, entry['size'], mtime)
+            except Exception as e_write:
+                self._error = e_write
+            finally:
+                fileobj.close()
+            if self._error is not None:
+                with self._lock: # Keep a member that was never written out of the index
+                    if self.index.get(member) is entry:
+                        del self.index[member]
+
+    def close(self):
+        """Waits for the queued members, writes the index and closes the file. Raises IOError, leaving the previous archive, if a member failed."""
+        self._queue.put(None)
+        self._thread.join()
+        with self._lock:
+            members = dict(self.index)
+        try:
+            if self._error: # The working copy may hold half a member; the previous archive stays as it was
+                raise IOError(f"Archive {self.path} was not updated: a member could not be written: {self._error}")
+            self._finish({"version": 1, "updated_at": time.time(), "members": members})
+        except BaseException:
+            self._discard()
+            try: os.remove(self.work_path)
+            except OSError: pass
+            raise
+        os.replace(self.work_path, self.path)
+        return len(members)
+
+
+class ZipArchiveWriter(ArchiveWriter):
+    """
+    A .zip archive (deflated; members already compressed are stored). New members go where the old central
+    directory was (in the working copy); a replaced member is left out of the new central directory, so zip
+    tools only see the latest copy. The index is the member ZIP_INDEX_MEMBER, written last.
+    """
+    extension = ".zip"
+    ZIP_INDEX_MEMBER = ".kfupm_archive_index.json"
+
+    def _open(self):
+        exists = os.path.exists(self.path)
+        if exists:
+            shutil.copyfile(self.path, self.work_path)
+        self._zip = zipfile.ZipFile(self.work_path, 'a' if exists else 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+        if self.ZIP_INDEX_MEMBER in self._zip.NameToInfo:
+            self.index = json.loads(self._zip.read(self.ZIP_INDEX_MEMBER))["members"]
+
+    def _drop(self, member):
+        old = self._zip.NameToInfo.pop(member, None)
+        if old is not None:
+            self._zip.filelist.remove(old)
+
+    def _write_member(self, member, fileobj, size, mtime):
+        old = self._zip.NameToInfo.pop(member, None) # Stays in the central directory until the new copy is complete
+        info = zipfile.ZipInfo(member, date_time=time.localtime(mtime)[:6])
+        stored = os.path.splitext(member)[1].lower() in ARCHIVE_STORED_EXTENSIONS
+        info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+        info.file_size = size
+        with self._zip.open(info, 'w', force_zip64=size > zipfile.ZIP64_LIMIT) as dest:
+            shutil.copyfileobj(fileobj, dest, 1024 * 1024)
+        if old is not None:
+            self._zip.filelist.remove(old)
+
+    def _finish(self, index):
+        self._drop(self.ZIP_INDEX_MEMBER)
+        self._zip.writestr(zipfile.ZipInfo(self.ZIP_INDEX_MEMBER, date_time=time.localtime()[:6]),
+                           json.dumps(index), compress_type=zipfile.ZIP_DEFLATED)
+        self._zip.close()
+
+    def _discard(self):
+        try: self._zip.close()
+        except Exception: pass
+
+
+class TarZstdArchiveWriter(ArchiveWriter):
+    """
+    A .tar.zst archive (needs the zstandard package), laid out as zstd frames: the tar members of each run,
+    a frame holding the tar end-of-archive blocks, and a skippable frame with the index, which zstd and tar
+    ignore. A later run copies the archive up to where its members end and appends; a replaced member is
+    written again, and tar extracts the latest copy last.
+    """
+    extension = ".tar.zst"
+    SKIPPABLE_FRAME_MAGIC = 0x184D2A5B
+    INDEX_TRAILER_MAGIC = b"KBIX"
+
+    @classmethod
+    def check_available(cls):
+        _import_zstandard()
+
+    def _open(self):
+        zstandard = _import_zstandard()
+        index = None
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as existing:
+                index = self._read_index(existing)
+                existing.seek(0)
+                self._file = open(self.work_path, 'w+b')
+                remaining = index["members_end"]
+                while remaining:
+                    block = existing.read(min(remaining, 1024 * 1024))
+                    if not block:
+                        break
+                    self._file.write(block)
+                    remaining -= len(block)
+            self.index = index["members"]
+        else:
+            self._file = open(self.work_path, 'w+b')
+        self._flush_frame = zstandard.FLUSH_FRAME
+        self._writer = zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL).stream_writer(self._file, closefd=False)
+
+    def _read_index(self, f):
+        # The file ends with the index frame's payload: index JSON, its length and INDEX_TRAILER_MAGIC
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+        if file_size >= 16:
+            f.seek(file_size - 8)
+            length, magic = struct.unpack("<I4s", f.read(8))
+            frame_start = file_size - 8 - length - 8
+            if magic == self.INDEX_TRAILER_MAGIC and frame_start >= 0:
+                f.seek(frame_start)
+                frame_magic, _ = struct.unpack("<II", f.read(8))
+                if frame_magic == self.SKIPPABLE_FRAME_MAGIC:
+                    return json.loads(f.read(length))
+        raise IOError(f"{self.path} has no member index; it was not written by this program, or not finished. Move it aside to start a new one.")
+
+    def _write_member(self, member, fileobj, size, mtime):
+        info = tarfile.TarInfo(member)
+        info.size, info.mtime, info.mode = size, int(mtime), 0o644
+        self._writer.write(info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+        shutil.copyfileobj(fileobj, self._writer, 1024 * 1024)
+        if size % tarfile.BLOCKSIZE:
+            self._writer.write(tarfile.NUL * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE))
+
+    def _finish(self, index):
+        zstandard = _import_zstandard()
+        self._writer.flush(self._flush_frame)
+        index["members_end"] = self._file.tell()
+        self._file.write(zstandard.ZstdCompressor().compress(tarfile.NUL * (2 * tarfile.BLOCKSIZE)))
+        payload = json.dumps(index).encode("utf-8")
+        self._file.write(struct.pack("<II", self.SKIPPABLE_FRAME_MAGIC, len(payload) + 8) + payload
+                         + struct.pack("<I4s", len(payload), self.INDEX_TRAILER_MAGIC))
+        self._file.truncate()
+        self._file.close()
+
+    def _discard(self):
+        self._file.close()
+
+
+# Archive formats by name, for the --archive option
+ARCHIVE_FORMATS = {"zip": ZipArchiveWriter, "tar.zst": TarZstdArchiveWriter}
+
+
+class ArchiveEngine(DownloadEngine):
+    """
+    DownloadEngine that streams each course into an archive instead of a folder tree: <download root>/<term>/
+    <course>.zip (or .tar.zst), or with per="term" <download root>/<term>.zip holding a folder per course.
+    Bodies are read into a spool (see ARCHIVE_SPOOL_BYTES) and handed to the archive's ArchiveWriter, so the
+    downloads of one archive still run in parallel and a broken transfer never leaves half a member in it. A
+    later run sends conditional requests built from the archive's member index, so unchanged files are
+    skipped on 304 and only new or changed ones are appended. The manifest and BlobStore are not used
+    (hard links cannot point into an archive). close() writes the indexes and must end every run.
+    """
+    writes_folders = False
+
+    def __init__(self, session, status_callback, max_workers=DEFAULT_DOWNLOAD_WORKERS, per_host_limit=MAX_CONNECTIONS_PER_HOST,
+                 rate_limits=None, retry_policy=None, archive_format="zip", per="course"):
+        super().__init__(session, status_callback, max_workers, per_host_limit, rate_limits=rate_limits, retry_policy=retry_policy)
+        self.archive_class = ARCHIVE_FORMATS[archive_format]
+        self.archive_class.check_available()
+        self.per = per
+        self._archives = {}
+        self._archives_lock = threading.Lock()
+
+    def _archive_for(self, base_course_dir):
+        """(ArchiveWriter, member name prefix) for base_course_dir's items; the archive is opened on first use."""
+        if self.per == "term":
+            path, prefix = os.path.dirname(base_course_dir) + self.archive_class.extension, os.path.basename(base_course_dir)
+        else:
+            path, prefix = base_course_dir + self.archive_class.extension, ""
+        with self._archives_lock:
+            archive = self._archives.get(path)
+            if archive is None:
+                archive = self._archives[path] = self.archive_class(path)
+        return archive, prefix
+
+    def close(self):
+        with self._archives_lock:
+            archives, self._archives = list(self._archives.values()), {}
+        errors = []
+        for archive in archives:
+            try:
+                self.status_callback(f"Archive written: {archive.path} ({archive.close()} members)")
+            except Exception as e_archive:
+                errors.append(e_archive)
+        if errors:
+            raise errors[0]
+
+    def _archive_file(self, archive, member_folder, url, clean_base_name, ext_candidate):
+        """One attempt at a File item: returns SAVED/SKIPPED, raises on failure (for the retry policy to judge)."""
+        known_member, known_entry = archive.entry_for_url(url)
+        request_headers = _validator_headers(known_entry) if known_entry else {}
+        with TRACER.span("file", "download", url=url) as span, self._host_slot(url), self._get(url, headers=request_headers) as r:
+            METRICS.observe("file_ttfb_seconds", r.elapsed.total_seconds())
+            span["status"] = r.status_code
+            if r.status_code == 304:
+                self.status_callback(f"          - SKIPPED (not modified, in archive): {known_member}", DETAIL)
+                return "SKIPPED"
+            r.raise_for_status()
+            member = _member_name(member_folder, _resolve_filename(clean_base_name, ext_candidate, url, r.headers))
+            etag = r.headers.get('etag', '')
+            last_modified = r.headers.get('last-modified', '')
+            expected_length = _expected_body_length(r)
+            with self._path_lock(f"{archive.path}\n{member}"):
+                existing = archive.entry(member)
+                if existing and existing['url'] == url and expected_length == existing['size'] and (
+                        (etag and etag == existing.get('etag')) or (not etag and last_modified and last_modified == existing.get('last_modified'))):
+                    self.status_callback(f"          - SKIPPED (unchanged, in archive): {member}", DETAIL)
+                    return "SKIPPED"
+
+                spool = archive.spool()
+                try:
+                    hasher = hashlib.sha256()
+                    transfer_started = time.perf_counter()
+                    received = _stream_body(r, spool, expected_length, hasher, self.rate_limits.bandwidth)
+                    transfer_seconds = time.perf_counter() - transfer_started
+                    if expected_length and received != expected_length:
+                        raise IncompleteTransferError(f"Incomplete transfer ({received} of {expected_length} bytes)")
+                except BaseException:
+                    spool.close()
+                    raise
+                span["bytes"] = received
+                METRICS.observe("file_transfer_seconds", transfer_seconds)
+                if transfer_seconds > 0:
+                    METRICS.observe("file_throughput_bytes_per_second", received / transfer_seconds)
+                entry = {"url": url, "size": received, "sha256": hasher.hexdigest(), "etag": etag or None, "last_modified": last_modified or None}
+                if existing and existing.get('sha256') == entry['sha256']:
+                    spool.close()
+                    archive.update_entry(member, entry)
+                    self.status_callback(f"          - SKIPPED (same content, in archive): {member}", DETAIL)
+                    return "SKIPPED"
+                archive.add(member, spool, entry, _archive_mtime(last_modified))
+            self.status_callback(f"          - SAVED{' (replacing the older copy)' if existing else ''}: {member} -> {os.path.basename(archive.path)}", DETAIL)
+            return "SAVED"
+
+    def _process_item(self, base_course_dir, item_info, position, total):
+        item_type = item_info.get('type', 'Unknown')
+        original_name = item_info.get('name', 'untitled')
+        relative_path_within_section = item_info.get('path', '')
+        url = item_info.get('url')
+
+        item_label = f"{position}/{total}" if total else f"{position}"
+        if not url:
+            self.status_callback(f"      ({position}) Skipping item with no URL: {original_name}", DETAIL)
+            return "SKIPPED"
+        archive, prefix = self._archive_for(base_course_dir)
+        member_folder = _member_name(prefix, relative_path_within_section)
+        clean_base_name, ext_candidate = _item_name_parts(item_type, original_name)
+
+        if item_type == "File":
+            self.status_callback(f"        ({item_label}) Downloading File: {os.path.join(relative_path_within_section, original_name)}", DETAIL)
+            try:
+                return self.retry_policy.call(self._archive_file, archive, member_folder, url, clean_base_name, ext_candidate,
+                                              on_retry=self._log_retry(original_name))
+            except requests.exceptions.RequestException as e_req:
+                self.status_callback(f"          - FAILED (Request Error): {original_name} - {e_req}", logging.WARNING)
+                self._defer(base_course_dir, item_info, e_req)
+            except IOError as e_io:
+                self.status_callback(f"          - FAILED (File IO Error): {original_name} - {e_io}", logging.WARNING)
+                self._defer(base_course_dir, item_info, e_io)
+            except LeaseLostError:
+                raise
+            except Exception as e: self.status_callback(f"          - FAILED (General Error): {original_name} - {e}", logging.WARNING)
+            return "FAILED"
+
+        elif item_type == "WebLink":
+            self.status_callback(f"        ({item_label}) Creating Link: {os.path.join(relative_path_within_section, original_name)}", DETAIL)
+            member = _member_name(member_folder, _weblink_filename(clean_base_name))
+            data = f"[InternetShortcut]\nURL={url}\n".encode("utf-8")
+            entry = {"url": url, "size": len(data), "sha256": hashlib.sha256(data).hexdigest(), "etag": None, "last_modified": None}
+            try:
+                with self._path_lock(f"{archive.path}\n{member}"):
+                    existing = archive.entry(member)
+                    if not (existing and existing.get('sha256') == entry['sha256']):
+                        archive.add_bytes(member, data, entry, time.time())
+                self.status_callback(f"          - LINK CREATED: {member}", DETAIL)
+                return "LINKED"
+            except Exception as e: self.status_callback(f"          - FAILED creating link: {member} - {e}", logging.WARNING)
+            return "FAILED"
+        else:
+            self.status_callback(f"        ({item_label}) Skipping item of type '{item_type}': {original_name}", DETAIL)
+            return "SKIPPED"
+
+
+def _course_worker(course, download_root, options, message_queue):
+    """
+    Entry point of a course worker process: downloads one course with its own session (and browser,
+    when not crawling over HTTP) built from the parent's login cookies. Log lines and progress are
+    sent back over message_queue; returns the outcome totals, a METRICS snapshot and (when tracing) the
+    worker's trace events as a dict.
+    """
+    def status(message, level=logging.INFO):
+        message_queue.put(("status", os.getpid(), (message, level)))
+
+    def progress(value):
+        message_queue.put(("progress", course['url'], value))
+
+    if options.get('base_url'):
+        set_base_url(options['base_url'])
+    METRICS.reset() # A pool process may run several courses; each reports only its own numbers
+    if options.get('trace'):
+        TRACER.start(options.get('profile_dir'))
+    session = build_session(options['login_cookies'], options.get('user_agent'))
+    manifest = DownloadManifest()
+    driver = None
+    try:
+        if not options['http_crawl']:
+            driver = setup_driver(options['browser_choice'], status, options['headless'])
+            attach_cookies_to_driver(driver, options['login_cookies'])
+        rate_limits = RateLimits(options.get('requests_per_second'), options.get('bytes_per_second'))
+        if options.get('archive_format'):
+            engine = ArchiveEngine(session, status, max_workers=options['download_workers'], rate_limits=rate_limits,
+                                   archive_format=options['archive_format'])
+        else:
+            blob_store = BlobStore(os.path.join(download_root, BLOB_STORE_DIRNAME)) if options.get('dedupe', True) else None
+            engine = DownloadEngine(session, status, max_workers=options['download_workers'], manifest=manifest, blob_store=blob_store,
+                                    rate_limits=rate_limits)
+        folder_listings = FolderListings(manifest, options['folder_reuse_hours'] * 3600)
+        status(f"--- Processing course: {course['name']} (Term: {course.get('term', 'Unknown_Term')}) ---")
+        try:
+            download_course(course, download_root, session, engine, status, progress, driver=driver, crawl_workers=options['crawl_workers'],
+                            folder_listings=folder_listings)
+            engine.retry_failed(progress)
+        finally:
+            engine.close()
+        status(f"--- Finished processing course: {course['name']} ---")
+        return {"results": dict(engine.results), "metrics": METRICS.snapshot(), "trace": TRACER.events() if TRACER.enabled else []}
+    finally:
+        if driver:
+            try: driver.quit()
+            except Exception: pass
+        manifest.close()
+        if TRACER.enabled:
+            TRACER.stop()
+            TRACER.write_profiles()
+
+
+def console_status(min_level=DETAIL, file=None):
+    """A status_callback printing the lines at min_level or above (to stdout, or to file)."""
+    def status(message, level=logging.INFO):
+        if level >= min_level:
+            print(message, file=file or sys.stdout)
+    return status
+
+
+print_status = console_status()
+
+
+def download_courses_parallel(courses, download_root, login_cookies, status_callback, progress_callback=None,
+                              course_workers=DEFAULT_COURSE_WORKERS, user_agent=None, download_workers=DEFAULT_DOWNLOAD_WORKERS,
+                              crawl_workers=DEFAULT_CRAWL_WORKERS, http_crawl=True, browser_choice="firefox", headless=True, dedupe=True,
+                              requests_per_second=None, bytes_per_second=None, folder_reuse_hours=DEFAULT_FOLDER_REUSE_HOURS,
+                              archive_format=None):
+    """
+    Downloads several courses at once, each in its own worker process (up to course_workers), all sharing
+    one login. Worker log lines reach status_callback prefixed with the worker's label ("[W2] ..."), and
+    progress_callback gets the average completion across courses. Returns the merged outcome Counter.
+    The rate limits are for the whole run, so each worker gets an equal share of them.
+    """
+    course_workers = max(1, int(course_workers))
+    options = {"login_cookies": login_cookies, "user_agent": user_agent, "download_workers": download_workers,
+               "crawl_workers": crawl_workers, "http_crawl": http_crawl, "browser_choice": browser_choice, "headless": headless,
+               "base_url": BASE_URL, "dedupe": dedupe, "trace": TRACER.enabled, "profile_dir": TRACER.profile_dir,
+               "folder_reuse_hours": folder_reuse_hours, "archive_format": archive_format,
+               "requests_per_second": requests_per_second / course_workers if requests_per_second else None,
+               "bytes_per_second": bytes_per_second / course_workers if bytes_per_second else None}
+    # 'spawn' everywhere: it is what Windows does anyway, and forking a process that runs Tk and threads is unsafe
+    mp_context = multiprocessing.get_context("spawn")
+    run_totals = Counter()
+    course_progress = {}
+    worker_labels = {}
+
+    with mp_context.Manager() as manager:
+        message_queue = manager.Queue()
+
+        def relay_messages():
+            while True:
+                message = message_queue.get()
+                if message is None:
+                    return
+                kind, key, value = message
+                if kind == "status":
+                    label = worker_labels.setdefault(key, f"W{len(worker_labels) + 1}")
+                    message, level = value
+                    status_callback(f"[{label}] {message}", level)
+                elif kind == "progress" and progress_callback:
+                    course_progress[key] = value
+                    progress_callback(sum(course_progress.values()) / len(courses))
+
+        relay_thread = threading.Thread(target=relay_messages, name="bb-worker-relay", daemon=True)
+        relay_thread.start()
+        try:
+            with ProcessPoolExecutor(max_workers=course_workers, mp_context=mp_context) as pool:
+                futures = {pool.submit(_course_worker, course, download_root, options, message_queue): course for course in courses}
+                for future in as_completed(futures):
+                    course = futures[future]
+                    try:
+                        worker_result = future.result()
+                        run_totals.update(worker_result["results"])
+                        METRICS.merge(worker_result["metrics"])
+                        TRACER.add_events(worker_result.get("trace", []))
+                    except Exception as e_course:
+                        status_callback(f"    - Error while processing course '{course['name']}': {type(e_course).__name__} - {e_course}")
+                    message_queue.put(("progress", course['url'], 100))
+        finally:
+            message_queue.put(None)
+            relay_thread.join()
+    return run_totals
+
+
+def scan_courses(username, password, browser_choice="firefox", headless=True, status_callback=print_status, rate_limits=None, retry_policy=None):
+    """
+    Logs in (or reuses the saved session) and returns the account's course list. The list is read over
+    HTTP when possible; a browser is only started for the login or if the HTTP read finds nothing.
+    rate_limits and retry_policy pace and retry the HTTP read (see get_all_terms_and_courses_http).
+    """
+    driver = None
+    try:
+        session, driver, login_cookies = get_authenticated_session(username, password, browser_choice, headless,
+                                                                   status_callback, keep_driver=True)
+        status_callback("Fetching course list...")
+        scanned_courses = []
+        if driver is None:
+            scanned_courses = get_all_terms_and_courses_http(session, status_callback, rate_limits, retry_policy)
+            if not scanned_courses:
+                status_callback("Course list not readable over HTTP; opening the browser with the saved session...")
+                driver = setup_driver(browser_choice, status_callback, headless)
+                attach_cookies_to_driver(driver, login_cookies)
+                driver.get(BASE_URL)
+        if driver is not None:
+            scanned_courses = get_all_terms_and_courses(driver, status_callback)
+        return scanned_courses
+    finally:
+        if driver:
+            try: driver.quit()
+            except Exception as e_quit: status_callback(f"Note: Error quitting driver: {e_quit}")
+
+
+def download_selected_courses(courses, download_root, username, password, status_callback=print_status, progress_callback=None,
+                              browser_choice="firefox", headless=True, http_crawl=True, download_workers=DEFAULT_DOWNLOAD_WORKERS,
+                              course_workers=DEFAULT_COURSE_WORKERS, crawl_workers=DEFAULT_CRAWL_WORKERS, dedupe=True,
+                              visit_once_per_run=False, requests_per_second=None, bytes_per_second=None, budget=None,
+                              folder_reuse_hours=DEFAULT_FOLDER_REUSE_HOURS, archive_format=None, archive_per="course"):
+    """
+    Downloads courses into download_root with one login: in this process when course_workers is 1,
+    else through download_courses_parallel. Returns the run's outcome Counter (SAVED/SKIPPED/FAILED/LINKED,
+    plus DEDUPED for saves served from content already on disk). dedupe=False turns the BlobStore off.
+    visit_once_per_run shares one VisitedIndex across courses, so a folder or file cross-linked from an
+    earlier course is not visited again (only when courses run in this process, not with course_workers > 1).
+    requests_per_second (per server) and bytes_per_second (all transfers) cap the run's pace; None means unlimited.
+    budget (a SharedBudget) also paces the run within limits shared with other processes (not with course_workers > 1).
+    Folders listing the same items as last time keep their stored sub-folders for folder_reuse_hours (see FolderListings);
+    0 crawls everything.
+    archive_format (a key of ARCHIVE_FORMATS) writes an archive per course, or per term with archive_per="term",
+    instead of folders (see ArchiveEngine). Per-term archives are written by this process, one course at a time.
+    """
+    course_workers = max(1, min(int(course_workers), len(courses)))
+    if archive_format and archive_per == "term" and course_workers > 1:
+        status_callback("Per-term archives are written by one process: processing the courses one at a time.")
+        course_workers = 1
+    session, driver, login_cookies = get_authenticated_session(username, password, browser_choice, headless, status_callback,
+                                                               keep_driver=not http_crawl and course_workers == 1)
+    if http_crawl:
+        status_callback("Crawling course pages over HTTP (no browser).")
+
+    if course_workers > 1:
+        # Each worker process gets its own session (and browser, if crawling in one) built from this single login
+        status_callback(f"Processing {len(courses)} courses with {course_workers} parallel workers...")
+        return download_courses_parallel(courses, download_root, login_cookies, status_callback, progress_callback,
+                                         course_workers=course_workers, user_agent=session.headers.get("User-Agent"),
+                                         download_workers=download_workers, crawl_workers=crawl_workers,
+                                         http_crawl=http_crawl, browser_choice=browser_choice, headless=headless, dedupe=dedupe,
+                                         requests_per_second=requests_per_second, bytes_per_second=bytes_per_second,
+                                         folder_reuse_hours=folder_reuse_hours, archive_format=archive_format)
+
+    manifest = None
+    engine = None
+    try:
+        if not http_crawl and driver is None:
+            # Browser crawling with a reused session: start the browser already logged in
+            driver = setup_driver(browser_choice, status_callback, headless)
+            attach_cookies_to_driver(driver, login_cookies)
+        # One engine for the whole run so the per-host connection caps hold across sections and courses
+        manifest = DownloadManifest()
+        rate_limits = RateLimits(requests_per_second, bytes_per_second, budget=budget)
+        if archive_format:
+            engine = ArchiveEngine(session, status_callback, max_workers=download_workers, rate_limits=rate_limits,
+                                   archive_format=archive_format, per=archive_per)
+        else:
+            blob_store = BlobStore(os.path.join(download_root, BLOB_STORE_DIRNAME)) if dedupe else None
+            engine = DownloadEngine(session, status_callback, max_workers=download_workers, manifest=manifest, blob_store=blob_store,
+                                    rate_limits=rate_limits)
+        folder_listings = FolderListings(manifest, folder_reuse_hours * 3600)
+        run_visited = VisitedIndex() if visit_once_per_run else None
+        for course_idx, course in enumerate(courses):
+            if progress_callback: progress_callback(0)
+            status_callback(f"\n--- ({course_idx+1}/{len(courses)}) Processing course: {course['name']} (Term: {course.get('term', 'Unknown_Term')}) ---")
+            try:
+                download_course(course, download_root, session, engine, status_callback, progress_callback,
+                                driver=driver, crawl_workers=crawl_workers, visited=run_visited, folder_listings=folder_listings)
+            except LeaseLostError:
+                raise
+            except Exception as e_course:
+                engine.results['FAILED'] += 1
+                status_callback(f"    - Error while processing course '{course['name']}': {type(e_course).__name__} - {e_course}")
+            status_callback(f"--- Finished processing course: {course['name']} ---")
+        # Files that failed for a transient reason get another round now, without crawling anything again
+        engine.retry_failed(progress_callback)
+        return engine.results
+    finally:
+        if driver:
+            try: driver.quit()
+            except Exception as e_quit: status_callback(f"Note: Error quitting driver post-download: {e_quit}")
+        if manifest: manifest.close()
+        if engine: engine.close() # Finishes the archives in archive mode
+
+
+def plan_courses(courses, download_root, username, password, status_callback=print_status, progress_callback=None,
+                 browser_choice="firefox", headless=True, http_crawl=True, check_workers=DEFAULT_DOWNLOAD_WORKERS,
+                 crawl_workers=DEFAULT_CRAWL_WORKERS, dedupe=True, requests_per_second=None, folder_reuse_hours=DEFAULT_FOLDER_REUSE_HOURS):
+    """
+    Crawls courses the way download_selected_courses would and returns a sync plan without downloading:
+    a JSON-serialisable dict listing every file as new, changed, unchanged or removed (present on disk
+    but no longer listed), with expected bytes. execute_plan() carries it out without crawling again.
+    """
+    session, driver, login_cookies = get_authenticated_session(username, password, browser_choice, headless, status_callback,
+                                                               keep_driver=not http_crawl)
+    manifest = None
+    try:
+        if not http_crawl and driver is None:
+            driver = setup_driver(browser_choice, status_callback, headless)
+            attach_cookies_to_driver(driver, login_cookies)
+        manifest = DownloadManifest()
+        blob_store = BlobStore(os.path.join(download_root, BLOB_STORE_DIRNAME)) if dedupe else None
+        planner = SyncPlanner(session, status_callback, max_workers=check_workers, manifest=manifest, blob_store=blob_store,
+                              rate_limits=RateLimits(requests_per_second))
+        folder_listings = FolderListings(manifest, folder_reuse_hours * 3600)
+        planned_courses = []
+        for course_idx, course in enumerate(courses):
+            if progress_callback: progress_callback(0)
+            status_callback(f"\n--- ({course_idx+1}/{len(courses)}) Planning course: {course['name']} (Term: {course.get('term', 'Unknown_Term')}) ---")
+            base_course_dir = os.path.join(download_root, course.get('term', 'Unknown_Term'), course['name'])
+            try:
+                download_course(course, download_root, session, planner, status_callback, progress_callback,
+                                driver=driver, crawl_workers=crawl_workers, folder_listings=folder_listings)
+            except Exception as e_course:
+                status_callback(f"    - Error while planning course '{course['name']}': {type(e_course).__name__} - {e_course}")
+                continue # A partial crawl would report everything it missed as removed
+            entries = planner.entries.get(base_course_dir, [])
+            entries = sorted(entries, key=lambda e: (e['target'] or "", e['url'] or ""))
+            entries += _removed_files(base_course_dir, [e['target'] for e in entries])
+            planned_courses.append({"name": course['name'], "term": course.get('term'), "url": course['url'],
+                                    "base_dir": os.path.abspath(base_course_dir), "items": entries})
+    finally:
+        if driver:
+            try: driver.quit()
+            except Exception as e_quit: status_callback(f"Note: Error quitting driver: {e_quit}")
+        if manifest: manifest.close()
+
+    totals = {status: {"count": 0, "bytes": 0} for status in ("new", "changed", "unchanged", "removed", "failed", "skipped")}
+    download_bytes = 0
+    for course in planned_courses:
+        for entry in course['items']:
+            totals[entry['status']]["count"] += 1
+            totals[entry['status']]["bytes"] += entry.get('bytes') or 0
+            if entry['status'] in ("new", "changed") and not entry.get('reuse_local_copy'):
+                download_bytes += entry.get('bytes') or 0
+    return {"version": 1, "created_at": time.time(), "base_url": BASE_URL, "download_root": os.path.abspath(download_root),
+            "courses": planned_courses, "totals": totals, "download_bytes": download_bytes}
+
+
+def execute_plan(plan, username, password, status_callback=print_status, progress_callback=None, browser_choice="firefox",
+                 headless=True, download_workers=DEFAULT_DOWNLOAD_WORKERS, dedupe=True, requests_per_second=None, bytes_per_second=None):
+    """
+    Downloads the new and changed files (and links) of a plan from plan_courses(), without crawling again.
+    Removed files are only reported by the plan, never deleted. Returns the outcome Counter.
+    """
+    session, _, _ = get_authenticated_session(username, password, browser_choice, headless, status_callback)
+    manifest = DownloadManifest()
+    try:
+        blob_store = BlobStore(os.path.join(plan['download_root'], BLOB_STORE_DIRNAME)) if dedupe else None
+        engine = DownloadEngine(session, status_callback, max_workers=download_workers, manifest=manifest, blob_store=blob_store,
+                                rate_limits=RateLimits(requests_per_second, bytes_per_second))
+        for course in plan['courses']:
+            items = [{key: entry[key] for key in ("type", "url", "name", "path")}
+                     for entry in course['items'] if entry['status'] in ("new", "changed")]
+            if not items:
+                status_callback(f"--- {course['name']}: nothing to download ---")
+                continue
+            status_callback(f"\n--- {course['name']}: downloading {len(items)} planned item(s) ---")
+            if progress_callback: progress_callback(0)
+            status_callback(f"      {engine.summarize(engine.download_items(course['base_dir'], items, progress_callback))}")
+        engine.retry_failed(progress_callback)
+        return engine.results
+    finally:
+        manifest.close()
+
+
+def format_run_totals(run_totals):
+    recovered = f" {run_totals['RECOVERED']} item(s) only succeeded on the final retry." if run_totals['RECOVERED'] else ""
+    return (f"\nRun totals: {run_totals['SAVED']} saved ({run_totals['DEDUPED']} from content already on disk), "
+            f"{run_totals['SKIPPED']} skipped, {run_totals['FAILED']} failed, {run_totals['LINKED']} links.{recovered}")
+
+
+# --- Batch jobs ---
+# A jobs file lists accounts to archive: {"max_requests_per_second": N, "max_bandwidth_mb_per_s": N, "jobs": [
+#   {"account": "...", "password_env": "BB_PASSWORD_X", "courses": [...], "terms": [...], "all": false, "output": "...",
+#    "folder_reuse_hours": 0}, ...]}
+# 'jobs enqueue' turns each job into an 'account' task in a work queue; a worker taking it scans the account and
+# queues one 'course' task per selected course, which any worker (any process, any machine sharing the queue) can
+# then download. The rate limits of the jobs file are budgets shared by all workers together.
+
+class SQLiteWorkQueue:
+    """
+    Durable task queue in a SQLite file, shared by every worker process that opens it (on other machines too,
+    through a network share with working file locks). Workers lease() a task for lease_seconds and keep the
+    lease alive with heartbeat(); a task whose lease runs out - its worker crashed or hung - is handed to the
+    next worker asking, until it has been tried max_attempts times. Also holds the shared rate budgets
+    (see SharedTokenBucket). Safe to share between threads.
+    """
+    def __init__(self, path=JOBS_QUEUE_PATH, max_attempts=JOB_MAX_ATTEMPTS):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_attempts = max(1, int(max_attempts))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=60, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, key TEXT UNIQUE, payload TEXT,"
+                " state TEXT DEFAULT 'queued', attempts INTEGER DEFAULT 0, lease_owner TEXT, lease_expires REAL,"
+                " last_error TEXT, result TEXT, enqueued_at REAL, updated_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS budgets (name TEXT PRIMARY KEY, rate REAL, tokens REAL, stamp REAL)")
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can never lease the same task
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def put(self, kind, payload, key=None):
+        """
+        Adds a task. A task with the same key is left alone while it is queued or running; a finished or
+        failed one is queued again with the new payload. Returns whether anything was queued.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO tasks (kind, key, payload, enqueued_at, updated_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET kind=excluded.kind, payload=excluded.payload, state='queued', attempts=0,"
+                " lease_owner=NULL, lease_expires=NULL, last_error=NULL, result=NULL, updated_at=excluded.updated_at"
+                " WHERE tasks.state IN ('done', 'failed')",
+                (kind, key, json.dumps(payload), now, now))
+            return cursor.rowcount > 0
+
+    def lease(self, worker, lease_seconds=JOB_LEASE_SECONDS):
+        """The oldest available task as {"id", "kind", "payload", "attempt"}, now leased to worker; None if there is none."""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute("UPDATE tasks SET state='failed', lease_owner=NULL, last_error='lease expired on the last attempt',"
+                         " updated_at=? WHERE state='leased' AND lease_expires < ? AND attempts >= ?", (now, now, self.max_attempts))
+            row = conn.execute("SELECT id, kind, payload, attempts FROM tasks WHERE state='queued' OR (state='leased' AND lease_expires < ?)"
+                               " ORDER BY id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE tasks SET state='leased', lease_owner=?, lease_expires=?, attempts=attempts+1, updated_at=? WHERE id=?",
+                         (worker, now + lease_seconds, now, row['id']))
+        return {"id": row['id'], "kind": row['kind'], "payload": json.loads(row['payload']), "attempt": row['attempts'] + 1}
+
+    def heartbeat(self, task_id, worker, lease_seconds=JOB_LEASE_SECONDS):
+        """Extends worker's lease on the task. False if the lease is no longer worker's (it ran out and was taken over)."""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute("UPDATE tasks SET lease_expires=?, updated_at=? WHERE id=? AND lease_owner=? AND state='leased'",
+                                  (now + lease_seconds, now, task_id, worker))
+            return cursor.rowcount > 0
+
+    def complete(self, task_id, worker, result=None):
+        with self._transaction() as conn:
+            conn.execute("UPDATE tasks SET state='done', lease_owner=NULL, lease_expires=NULL, result=?, updated_at=?"
+                         " WHERE id=? AND lease_owner=?", (json.dumps(result), time.time(), task_id, worker))
+
+    def fail(self, task_id, worker, error, retry=True):
+        """Records a failed attempt: the task is queued again (while attempts remain and retry is set) or marked failed."""
+        with self._transaction() as conn:
+            conn.execute("UPDATE tasks SET state=CASE WHEN ? AND attempts < ? THEN 'queued' ELSE 'failed' END,"
+                         " lease_owner=NULL, lease_expires=NULL, last_error=?, updated_at=? WHERE id=? AND lease_owner=?",
+                         (bool(retry), self.max_attempts, str(error), time.time(), task_id, worker))
+
+    def counts(self):
+        """Counter of tasks by state (queued, leased, done, failed)."""
+        with self._lock:
+            return Counter({row['state']: row['n'] for row in self._conn.execute("SELECT state, COUNT(*) AS n FROM tasks GROUP BY state")})
+
+    def tasks(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT id, kind, key, state, attempts, lease_owner, lease_expires, last_error, result FROM tasks ORDER BY id").fetchall()
+        return [dict(row) for row in rows]
+
+    def set_budget(self, name, rate):
+        """Sets (or with rate None/0 removes) the shared budget name, in units per second."""
+        with self._transaction() as conn:
+            if rate:
+                conn.execute("INSERT INTO budgets (name, rate, tokens, stamp) VALUES (?, ?, ?, ?)"
+                             " ON CONFLICT(name) DO UPDATE SET rate=excluded.rate", (name, float(rate), float(rate), time.time()))
+            else:
+                conn.execute("DELETE FROM budgets WHERE name=?", (name,))
+
+    def budget_rate(self, name):
+        with self._lock:
+            row = self._conn.execute("SELECT rate FROM budgets WHERE name=?", (name,)).fetchone()
+        return row['rate'] if row else None
+
+    def take_tokens(self, name, amount):
+        """
+        Reserves amount from the shared budget name (a token bucket of one second's worth). Returns (seconds to
+        wait, the budget's current rate); the rate is 0 and nothing is reserved when the budget no longer exists.
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT rate, tokens, stamp FROM budgets WHERE name=?", (name,)).fetchone()
+            if row is None or not row['rate']:
+                return 0.0, 0.0
+            now = time.time()
+            tokens = min(row['rate'], row['tokens'] + max(0.0, now - row['stamp']) * row['rate']) - amount
+            conn.execute("UPDATE budgets SET tokens=?, stamp=? WHERE name=?", (tokens, now, name))
+        return (-tokens / row['rate'] if tokens < 0 else 0.0), row['rate']
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Work queue backends by URL scheme ('sqlite:///path/to/queue.sqlite3'; a plain path means SQLite). Another backend
+# (a database server, say, for workers without a shared disk) registers a class taking the rest of the URL and
+# providing SQLiteWorkQueue's methods
+WORK_QUEUE_BACKENDS = {"sqlite": SQLiteWorkQueue}
+
+
+def open_work_queue(location=None):
+    location = location or JOBS_QUEUE_PATH
+    scheme, separator, rest = location.partition("://")
+    if not separator or len(scheme) == 1: # A plain path (a Windows drive letter is no scheme)
+        return SQLiteWorkQueue(location)
+    if scheme not in WORK_QUEUE_BACKENDS:
+        raise ValueError(f"Unknown work queue backend '{scheme}' (known: {', '.join(sorted(WORK_QUEUE_BACKENDS))})")
+    return WORK_QUEUE_BACKENDS[scheme](rest)
+
+
+class LeaseLostError(RuntimeError):
+    """Raised inside a task whose lease ran out and may have been taken over by another worker."""
+
+
+class SharedTokenBucket:
+    """
+    TokenBucket drawing from a budget kept in the work queue, so all workers together stay within its rate.
+    Tokens are fetched about a quarter second's worth at a time and used up locally, which keeps the queue
+    traffic to a few transactions per second per worker. The rate is re-read with every fetch, so a budget
+    changed by a later 'jobs enqueue' applies at once. With lease_lost (a threading.Event), acquire() raises
+    LeaseLostError once it is set.
+    """
+    def __init__(self, work_queue, name, rate, lease_lost=None):
+        self.work_queue = work_queue
+        self.name = name
+        self.rate = float(rate)
+        self.batch = max(1.0, self.rate / 4)
+        self.lease_lost = lease_lost
+        self._local = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        if self.lease_lost is not None and self.lease_lost.is_set():
+            raise LeaseLostError("The task's lease was lost; stopping so it does not run twice")
+        with self._lock:
+            if self._local >= amount:
+                self._local -= amount
+                return
+            grant = max(amount - self._local, self.batch)
+            wait, rate = self.work_queue.take_tokens(self.name, grant)
+            self.rate = rate # 0 once the budget is removed: unlimited, as for a TokenBucket
+            self.batch = max(1.0, rate / 4)
+            self._local += grant - amount
+        if wait > 0:
+            time.sleep(wait)
+
+
+class SharedBudget:
+    """
+    The jobs' shared politeness budget for RateLimits(budget=...): requests and bandwidth SharedTokenBuckets, or None
+    where the queue holds no such budget. With lease_lost, check() (called before every request) and the buckets raise
+    LeaseLostError once it is set. Built per task, so budgets added or removed between tasks are picked up.
+    """
+    def __init__(self, work_queue, lease_lost=None):
+        self.lease_lost = lease_lost
+        requests_rate = work_queue.budget_rate("requests")
+        bandwidth_rate = work_queue.budget_rate("bandwidth")
+        self.requests = SharedTokenBucket(work_queue, "requests", requests_rate, lease_lost) if requests_rate else None
+        self.bandwidth = SharedTokenBucket(work_queue, "bandwidth", bandwidth_rate, lease_lost) if bandwidth_rate else None
+
+    def check(self):
+        if self.lease_lost is not None and self.lease_lost.is_set():
+            raise LeaseLostError("The task's lease was lost; stopping so it does not run twice")
+
+
+def read_jobs_file(path):
+    """Loads and checks a jobs file (see above); returns its dict."""
+    with open(path, 'r', encoding='utf-8') as f:
+        jobs_file = json.load(f)
+    for index, job in enumerate(jobs_file.get('jobs') or []):
+        if not job.get('account') or not job.get('output'):
+            raise ValueError(f"Job {index + 1} in {path} needs an 'account' and an 'output' folder.")
+        if not (job.get('all') or job.get('courses') or job.get('terms')):
+            raise ValueError(f"Job {index + 1} ({job['account']}) in {path} selects no courses: give 'courses', 'terms' or \"all\": true.")
+    if not jobs_file.get('jobs'):
+        raise ValueError(f"{path} lists no jobs.")
+    return jobs_file
+
+
+def enqueue_jobs(jobs_file, work_queue):
+    """Queues an 'account' task per job and stores the file's rate limits as the shared budgets. Returns the number queued."""
+    work_queue.set_budget("requests", jobs_file.get('max_requests_per_second'))
+    work_queue.set_budget("bandwidth", (jobs_file.get('max_bandwidth_mb_per_s') or 0) * 1e6)
+    queued = 0
+    for job in jobs_file['jobs']:
+        payload = {"account": job['account'], "password_env": job.get('password_env') or "BB_PASSWORD",
+                   "courses": job.get('courses') or [], "terms": job.get('terms') or [], "all": bool(job.get('all')),
+                   "output": os.path.abspath(job['output']), "http_crawl": job.get('http_crawl', True),
+                   "dedupe": job.get('dedupe', True), "base_url": job.get('base_url') or BASE_URL,
+                   "folder_reuse_hours": float(job.get('folder_reuse_hours') or DEFAULT_FOLDER_REUSE_HOURS)}
+        queued += work_queue.put("account", payload, key=f"account|{payload['account']}|{payload['output']}")
+    return queued
+
+
+@contextmanager
+def _lease_heartbeat(work_queue, task, worker, lease_seconds, status_callback):
+    """
+    Keeps worker's lease on task alive (renewing it every third of lease_seconds) for the with-block. Yields an
+    Event that is set if the lease is lost; the task's SharedBudget then stops it at its next request.
+    """
+    stop = threading.Event()
+    lease_lost = threading.Event()
+
+    def beat():
+        while not stop.wait(lease_seconds / 3):
+            try:
+                if not work_queue.heartbeat(task['id'], worker, lease_seconds):
+                    status_callback(f"Lost the lease on task {task['id']}; stopping it, another worker may have taken it over.", logging.WARNING)
+                    lease_lost.set()
+                    return
+            except sqlite3.Error as e_beat:
+                status_callback(f"Note: Could not renew the lease on task {task['id']}: {e_beat}", logging.WARNING)
+
+    heartbeat_thread = threading.Thread(target=beat, name="bb-lease-heartbeat", daemon=True)
+    heartbeat_thread.start()
+    try:
+        yield lease_lost
+    finally:
+        stop.set()
+        heartbeat_thread.join()
+
+
+def _run_job_task(task, work_queue, budget, options, status_callback):
+    """Runs one leased task; returns its result dict or raises (see run_job_worker)."""
+    payload = task['payload']
+    set_base_url(payload['base_url'])
+    username = payload['account']
+    password = os.environ.get(payload['password_env'], "")
+    browser_choice = options.get('browser_choice') or "firefox"
+    if task['kind'] == "account":
+        courses = scan_courses(username, password, browser_choice, True, status_callback, rate_limits=RateLimits(budget=budget))
+        if not courses:
+            raise RuntimeError(f"No courses found for {username}.")
+        try:
+            save_course_catalog(username, courses)
+        except OSError as e_save:
+            status_callback(f"Note: Could not save the course catalog: {e_save}", logging.WARNING)
+        budget.check() # Another worker holding the lease now queues the courses itself
+        selected = courses if payload['all'] else _select_courses(courses, payload['courses'], payload['terms'])
+        queued = sum(work_queue.put("course", {**payload, "course": course}, key=f"course|{username}|{course['url']}|{payload['output']}")
+                     for course in selected)
+        status_callback(f"{username}: {len(selected)} course(s) selected, {queued} queued.")
+        return {"courses": len(selected), "queued": queued}
+    if task['kind'] == "course":
+        os.makedirs(payload['output'], exist_ok=True)
+        run_totals = download_selected_courses([payload['course']], payload['output'], username, password, status_callback,
+                                               browser_choice=browser_choice, http_crawl=payload['http_crawl'],
+                                               download_workers=options.get('download_workers') or DEFAULT_DOWNLOAD_WORKERS,
+                                               dedupe=payload['dedupe'], budget=budget,
+                                               folder_reuse_hours=payload.get('folder_reuse_hours', DEFAULT_FOLDER_REUSE_HOURS))
+        if run_totals['FAILED']:
+            raise RuntimeError(f"{run_totals['FAILED']} item(s) failed")
+        return dict(run_totals)
+    raise ValueError(f"Unknown task kind '{task['kind']}'")
+
+
+def run_job_worker(queue_location=None, options=None, status_callback=print_status):
+    """
+    Takes tasks from the work queue and runs them until none are left - queued or still running anywhere,
+    since a running account task may add courses and a crashed worker's lease may run out. With
+    options['keep_running'] it waits for new tasks instead. Failed tasks are retried by whichever worker
+    takes them next (up to the queue's max_attempts). Returns a Counter of this worker's done/failed tasks.
+    """
+    options = options or {}
+    worker = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    lease_seconds = options.get('lease_seconds') or JOB_LEASE_SECONDS
+    work_queue = open_work_queue(queue_location)
+    outcomes = Counter()
+    try:
+        while True:
+            task = work_queue.lease(worker, lease_seconds)
+            if task is None:
+                pending = work_queue.counts()
+                if not options.get('keep_running') and not pending['queued'] and not pending['leased']:
+                    return outcomes
+                time.sleep(options.get('poll_interval') or JOB_POLL_INTERVAL)
+                continue
+            label = task['payload'].get('course', {}).get('name') or task['payload']['account']
+            status_callback(f"\n=== Task {task['id']} ({task['kind']}: {label}), attempt {task['attempt']} ===")
+            with _lease_heartbeat(work_queue, task, worker, lease_seconds, status_callback) as lease_lost:
+                try:
+                    result = _run_job_task(task, work_queue, SharedBudget(work_queue, lease_lost), options, status_callback)
+                    if lease_lost.is_set():
+                        raise LeaseLostError("The task's lease was lost before it finished")
+                except Exception as e_task:
+                    if lease_lost.is_set():
+                        # No longer ours to complete or fail: whoever holds the lease now records the outcome
+                        status_callback(f"Task {task['id']} stopped: its lease was lost.", logging.WARNING)
+                        outcomes['failed'] += 1
+                        continue
+                    status_callback(f"Task {task['id']} failed: {type(e_task).__name__} - {e_task}", logging.WARNING)
+                    work_queue.fail(task['id'], worker, f"{type(e_task).__name__}: {e_task}")
+                    outcomes['failed'] += 1
+                    continue
+            work_queue.complete(task['id'], worker, result)
+            outcomes['done'] += 1
+    finally:
+        work_queue.close()
+
+
+def _job_worker_process(queue_location, options):
+    """Entry point of a 'jobs work --processes N' worker process; returns its outcomes and METRICS snapshot."""
+    if options.get('trace'):
+        TRACER.start(options.get('profile_dir'))
+    status = console_status(options.get('log_level', DETAIL))
+
+    def labelled(message, level=logging.INFO):
+        status(f"[{os.getpid()}] {message}", level)
+
+    try:
+        outcomes = run_job_worker(queue_location, options, labelled)
+        return {"outcomes": dict(outcomes), "metrics": METRICS.snapshot(), "trace": TRACER.events() if TRACER.enabled else []}
+    finally:
+        if TRACER.enabled:
+            TRACER.stop()
+            TRACER.write_profiles()
+
+
+def run_job_workers(queue_location=None, processes=1, options=None, status_callback=print_status):
+    """run_job_worker in this process, or in processes worker processes whose results are merged. Returns the outcome Counter."""
+    options = options or {}
+    if processes <= 1:
+        return run_job_worker(queue_location, options, status_callback)
+    outcomes = Counter()
+    worker_options = {**options, "trace": TRACER.enabled, "profile_dir": TRACER.profile_dir}
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for future in as_completed([pool.submit(_job_worker_process, queue_location, worker_options) for _ in range(processes)]):
+            try:
+                worker_result = future.result()
+            except Exception as e_worker:
+                status_callback(f"A worker process failed: {type(e_worker).__name__} - {e_worker}", logging.WARNING)
+                continue
+            outcomes.update(worker_result['outcomes'])
+            METRICS.merge(worker_result['metrics'])
+            TRACER.add_events(worker_result['trace'])
+    return outcomes
+
+
+# --- Command-line interface ---
+
+def _select_courses(courses, course_patterns, term_patterns):
+    """Courses whose name matches any course pattern and whose term matches any term pattern (case-insensitive substrings)."""
+    def matches(value, patterns):
+        return not patterns or any(p.lower() in (value or "").lower() for p in patterns)
+    return [c for c in courses if matches(c['name'], course_patterns) and matches(c.get('term'), term_patterns)]
+
+
+def _cli_credentials(args, settings):
+    username = args.username or settings.get("username")
+    if not username:
+        raise SystemExit("No username given (use --username or save one from the GUI).")
+    password = os.environ.get("BB_PASSWORD") or (settings.get("password") if settings.get("username") == username else None)
+    if not password:
+        password = getpass.getpass(f"Blackboard password for {username}: ")
+    return username, password
+
+
+def _cli_courses(args, settings, username, password):
+    """The account's course list: the saved catalog unless --rescan is given or there is none yet."""
+    if not args.rescan:
+        cached = load_course_catalog(username)
+        if cached:
+            return cached[0]
+    # When stdout carries JSON (scan --json, or a plan without --plan-file) the scan's progress goes to stderr
+    log_file = sys.stderr if getattr(args, "json", False) or (args.command == "plan" and not args.plan_file) else None
+    courses = scan_courses(username, password, args.browser or settings.get("browser_choice", "firefox"),
+                           not args.show_browser, console_status(file=log_file))
+    if courses:
+        try:
+            save_course_catalog(username, courses)
+        except OSError as e_save:
+            print(f"Note: Could not save the course catalog: {e_save}", file=log_file)
+    return courses
+
+
+def main(argv=None):
+    """Command-line entry point; with no command (or 'gui') the desktop app is started."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="course_downloader", description="Download KFUPM Blackboard course files.")
+    parser.add_argument("--base-url", help="Blackboard address (default: %(default)s)", default=BASE_URL)
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("gui", help="start the desktop app (the default)")
+
+    login_options = argparse.ArgumentParser(add_help=False)
+    login_options.add_argument("--username", help="Blackboard user (default: the one saved by the GUI)")
+    login_options.add_argument("--browser", choices=["firefox", "chrome"], help="browser used for logging in")
+    login_options.add_argument("--show-browser", action="store_true", help="show the browser window instead of running it headless")
+    common = argparse.ArgumentParser(add_help=False, parents=[login_options])
+    common.add_argument("--rescan", action="store_true", help="rescan the course list instead of using the saved catalog")
+    selection = argparse.ArgumentParser(add_help=False, parents=[common])
+    selection.add_argument("--course", action="append", default=[], metavar="TEXT", help="course name contains TEXT (repeatable)")
+    selection.add_argument("--term", action="append", default=[], metavar="TEXT", help="term name contains TEXT (repeatable)")
+    selection.add_argument("--all", action="store_true", help="use every listed course")
+    selection.add_argument("--output", help="download folder (default: the one saved by the GUI)")
+    selection.add_argument("--workers", type=int, help="parallel file downloads (or header checks when planning)")
+    selection.add_argument("--crawl-workers", type=int, default=DEFAULT_CRAWL_WORKERS, help="folder pages fetched in parallel")
+    selection.add_argument("--browser-crawl", action="store_true", help="crawl course pages in the browser instead of over HTTP")
+    selection.add_argument("--folder-reuse-hours", type=float, metavar="HOURS",
+                           help="sub-folders of a folder listing the same items as last run are not crawled again for this long "
+                                "(default: the GUI's quick re-sync setting; 0, crawling every folder, if it is off)")
+    selection.add_argument("--full-crawl", action="store_true", help="crawl every folder, even the ones unchanged since the last run")
+    selection.add_argument("--no-dedupe", action="store_true", help="store every file separately instead of hard-linking identical content")
+    selection.add_argument("--quiet", action="store_true", help="leave out the per-file lines (found/saved/skipped...) of the log")
+    reporting = argparse.ArgumentParser(add_help=False)
+    reporting.add_argument("--metrics-json", metavar="PATH", help="write the run's timings and counters as JSON")
+    reporting.add_argument("--metrics-textfile", metavar="PATH",
+                           help="write them in Prometheus text format, e.g. into node_exporter's textfile directory (*.prom)")
+    reporting.add_argument("--trace", metavar="PATH",
+                           help="record course/section/page/file spans and write them as a Chrome trace (open in ui.perfetto.dev)")
+    reporting.add_argument("--profile-threads", metavar="DIR", help="with --trace: also cProfile each worker thread into DIR (*.prof)")
+    pacing = argparse.ArgumentParser(add_help=False)
+    pacing.add_argument("--max-requests-per-second", type=float, metavar="N", help="requests per second to each server (default: unlimited)")
+    pacing.add_argument("--max-bandwidth", type=float, metavar="MB_PER_S", help="total download speed in MB/s (default: unlimited)")
+
+    scan_parser = commands.add_parser("scan", parents=[common, reporting], help="list the account's courses")
+    scan_parser.add_argument("--json", action="store_true", help="print the course list as JSON")
+
+    download_parser = commands.add_parser("download", parents=[selection, pacing, reporting], help="download courses")
+    download_parser.add_argument("--course-workers", type=int, help="courses processed in parallel")
+    download_parser.add_argument("--once-per-run", action="store_true",
+                                 help="skip folders and files already handled for an earlier course of this run (sequential runs only)")
+    download_parser.add_argument("--archive", choices=sorted(ARCHIVE_FORMATS),
+                                 help="write each course into one archive instead of a folder tree (tar.zst needs the zstandard package)")
+    download_parser.add_argument("--archive-per", choices=["course", "term"], default="course",
+                                 help="with --archive: one archive per course (the default) or per term")
+
+    plan_parser = commands.add_parser("plan", parents=[selection, pacing, reporting], help="crawl courses and write what a download would change, without downloading")
+    plan_parser.add_argument("--plan-file", help="write the JSON plan here instead of to stdout (progress goes to stderr)")
+
+    apply_parser = commands.add_parser("apply-plan", parents=[login_options, pacing, reporting], help="download what a saved plan lists as new or changed")
+    apply_parser.add_argument("plan_file", help="plan written by the 'plan' command")
+    apply_parser.add_argument("--workers", type=int, help="parallel file downloads")
+    apply_parser.add_argument("--no-dedupe", action="store_true", help="store every file separately instead of hard-linking identical content")
+    apply_parser.add_argument("--quiet", action="store_true", help="leave out the per-file lines of the log")
+
+    jobs_parser = commands.add_parser("jobs", help="archive many accounts: queue batch jobs and run workers that share the work")
+    jobs_commands = jobs_parser.add_subparsers(dest="jobs_command", required=True)
+    queue_option = argparse.ArgumentParser(add_help=False)
+    queue_option.add_argument("--queue", metavar="PATH_OR_URL",
+                              help=f"work queue: a SQLite file all workers can reach, or a backend URL (default: {JOBS_QUEUE_PATH})")
+    enqueue_parser = jobs_commands.add_parser("enqueue", parents=[queue_option, reporting], help="queue the jobs of a jobs file")
+    enqueue_parser.add_argument("jobs_file", help="JSON file listing accounts, their courses/terms and output folders")
+    work_parser = jobs_commands.add_parser("work", parents=[queue_option, reporting], help="run queued tasks until the queue is drained")
+    work_parser.add_argument("--processes", type=int, default=1, help="worker processes on this machine (default: %(default)s)")
+    work_parser.add_argument("--workers", type=int, help="parallel file downloads per worker")
+    work_parser.add_argument("--browser", choices=["firefox", "chrome"], help="browser for logins without a saved session")
+    work_parser.add_argument("--lease-seconds", type=float, default=JOB_LEASE_SECONDS,
+                             help="a task whose worker sends no heartbeat for this long goes to another worker (default: %(default)s)")
+    work_parser.add_argument("--keep-running", action="store_true", help="wait for new tasks instead of exiting once the queue is drained")
+    work_parser.add_argument("--quiet", action="store_true", help="leave out the per-file lines of the log")
+    status_parser = jobs_commands.add_parser("status", parents=[queue_option, reporting], help="list the queue's tasks")
+    status_parser.add_argument("--json", action="store_true", help="print the tasks as JSON")
+
+    args = parser.parse_args(argv)
+    if args.command in (None, "gui"):
+        from course_downloader_gui import App
+        App().mainloop()
+        return 0
+
+    if args.command in ("download", "plan") and not (args.all or args.course or args.term):
+        parser.error(f"{args.command}: choose courses with --course/--term, or pass --all")
+    set_base_url(args.base_url)
+    if args.trace:
+        TRACER.start(args.profile_threads)
+    started_at, exit_code = time.time(), 1
+    try:
+        with TRACER.span(args.command, "run"):
+            exit_code = _run_cli_command(args)
+        return exit_code
+    except (RuntimeError, requests.exceptions.RequestException) as e:
+        # Browser/login failures and unreachable servers: one line instead of a traceback
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if args.metrics_json or args.metrics_textfile:
+            export_run_metrics(args.metrics_json, args.metrics_textfile, args.command, started_at, succeeded=exit_code == 0)
+        if args.trace:
+            TRACER.stop()
+            TRACER.write(args.trace)
+
+
+def _run_jobs_command(args):
+    settings = read_settings()
+    if args.jobs_command == "work":
+        log_level = logging.INFO if args.quiet else DETAIL
+        options = {"download_workers": args.workers or int(settings.get("download_workers") or DEFAULT_DOWNLOAD_WORKERS),
+                   "browser_choice": args.browser or settings.get("browser_choice", "firefox"), "lease_seconds": args.lease_seconds,
+                   "keep_running": args.keep_running, "log_level": log_level}
+        outcomes = run_job_workers(args.queue, max(1, args.processes), options, console_status(log_level))
+        print(f"\nThis run: {outcomes['done']} task(s) done, {outcomes['failed']} failed attempt(s).")
+
+    work_queue = open_work_queue(args.queue)
+    try:
+        if args.jobs_command == "enqueue":
+            jobs_file = read_jobs_file(args.jobs_file)
+            queued = enqueue_jobs(jobs_file, work_queue)
+            print(f"Queued {queued} of {len(jobs_file['jobs'])} job(s); the others are still queued or running.")
+            return 0
+        if args.jobs_command == "status" and args.json:
+            print(json.dumps(work_queue.tasks(), indent=2, ensure_ascii=False))
+        elif args.jobs_command == "status":
+            for task in work_queue.tasks():
+                detail = task['lease_owner'] if task['state'] == "leased" else (task['last_error'] or "")
+                print(f"{task['id']:>5}  {task['state']:<7} {task['kind']:<8} x{task['attempts']}  {task['key'].split('|', 1)[1]}  {detail}")
+        counts = work_queue.counts()
+        print("Queue: " + ", ".join(f"{counts[state]} {state}" for state in ("queued", "leased", "done", "failed")))
+        return 1 if counts['failed'] else 0
+    finally:
+        work_queue.close()
+
+
+def _run_cli_command(args):
+    if args.command == "jobs":
+        return _run_jobs_command(args)
+    settings = read_settings()
+    username, password = _cli_credentials(args, settings)
+    browser_choice = args.browser or settings.get("browser_choice", "firefox")
+    download_workers = getattr(args, "workers", None) or int(settings.get("download_workers") or DEFAULT_DOWNLOAD_WORKERS) # scan has no --workers
+    log_level = logging.INFO if getattr(args, "quiet", False) else DETAIL
+    pacing = {}
+    if args.command in ("download", "plan", "apply-plan"):
+        requests_per_second = args.max_requests_per_second or float(settings.get("max_requests_per_second") or 0)
+        bandwidth_mb_per_s = args.max_bandwidth or float(settings.get("max_bandwidth_mb_per_s") or 0)
+        pacing = {"requests_per_second": requests_per_second or None, "bytes_per_second": bandwidth_mb_per_s * 1e6 or None}
+    if args.command == "apply-plan":
+        with open(args.plan_file, 'r', encoding='utf-8') as f:
+            plan = json.load(f)
+        set_base_url(plan.get('base_url') or BASE_URL)
+        run_totals = execute_plan(plan, username, password, console_status(log_level), browser_choice=browser_choice, headless=not args.show_browser,
+                                  download_workers=download_workers, dedupe=not args.no_dedupe, **pacing)
+        print(format_run_totals(run_totals))
+        return 1 if run_totals['FAILED'] else 0
+
+    courses = _cli_courses(args, settings, username, password)
+    if not courses:
+        print("No courses found.")
+        return 1
+
+    if args.command == "scan":
+        if args.json:
+            print(json.dumps(courses, indent=2, ensure_ascii=False))
+        else:
+            for course in courses:
+                print(f"{course.get('term', 'Unknown Term')}\t{course['name']}")
+        return 0
+
+    selected = courses if args.all else _select_courses(courses, args.course, args.term)
+    if not selected:
+        print("No course matches the given --course/--term filters.")
+        return 1
+    download_root = args.output or settings.get("download_path") or DEFAULT_DOWNLOAD_DIR
+    folder_reuse_hours = 0 if args.full_crawl else args.folder_reuse_hours
+    if folder_reuse_hours is None:
+        folder_reuse_hours = float(settings.get("folder_reuse_hours", DEFAULT_FOLDER_REUSE_HOURS))
+    if args.command == "plan":
+        log = console_status(log_level, file=sys.stderr)
+        plan = plan_courses(selected, download_root, username, password, log, browser_choice=browser_choice,
+                            headless=not args.show_browser, http_crawl=not args.browser_crawl, check_workers=download_workers,
+                            crawl_workers=args.crawl_workers, dedupe=not args.no_dedupe,
+                            requests_per_second=pacing["requests_per_second"], folder_reuse_hours=folder_reuse_hours)
+        if args.plan_file:
+            with open(args.plan_file, 'w', encoding='utf-8') as f:
+                json.dump(plan, f, indent=2, ensure_ascii=False)
+        else:
+            print(json.dumps(plan, indent=2, ensure_ascii=False))
+        totals = plan['totals']
+        log("\nPlan: " + ", ".join(f"{totals[status]['count']} {status} ({totals[status]['bytes'] / 1e6:.1f} MB)"
+                                   for status in ("new", "changed", "unchanged", "removed")) +
+            f"; {plan['download_bytes'] / 1e6:.1f} MB to download, {totals['failed']['count']} could not be checked.")
+        return 1 if totals['failed']['count'] else 0
+
+    os.makedirs(download_root, exist_ok=True)
+    run_totals = download_selected_courses(
+        selected, download_root, username, password, console_status(log_level),
+        browser_choice=browser_choice, headless=not args.show_browser,
+        http_crawl=not args.browser_crawl,
+        download_workers=download_workers,
+        course_workers=args.course_workers or int(settings.get("course_workers") or DEFAULT_COURSE_WORKERS),
+        crawl_workers=args.crawl_workers, dedupe=not args.no_dedupe, visit_once_per_run=args.once_per_run,
+        folder_reuse_hours=folder_reuse_hours, archive_format=args.archive, archive_per=args.archive_per, **pacing)
+    print(format_run_totals(run_totals))
+    return 1 if run_totals['FAILED'] else 0
 
-            # ... (rest of the try...except...finally for the entire courses loop) ...
-            self.update_status("\nAll selected courses and their specified sections processed!")
-            messagebox.showinfo("Download Complete", "All selected courses have been processed. Check the status window for details.")
-        except RuntimeError as e: 
-            self.update_status(f"Driver Error during download: {e}")
-            messagebox.showerror("Driver Setup Error", str(e))
-        except Exception as e:
-            self.update_status(f"A critical error occurred during download: {e}")
-            import traceback; self.update_status(traceback.format_exc())
-            messagebox.showerror("Download Error", f"A critical error occurred: {e}. Check status for details.")
-        finally:
-            if driver: 
-                try: driver.quit()
-                except Exception as e_quit: self.update_status(f"Note: Error quitting driver post-download: {e_quit}")
-            self.after(0, self.set_ui_state, True)
-            self.after(0, self.update_progress, 0)
 
 if __name__ == "__main__":
-    app = App()
-    app.mainloop()
\ No newline at end of file
+    multiprocessing.freeze_support() # Needed for the course worker processes in the frozen (.exe) build
+    sys.exit(main())
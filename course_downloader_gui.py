@@ -0,0 +1,685 @@
+import os
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from logging.handlers import RotatingFileHandler
+import tkinter as tk
+from tkinter import filedialog, messagebox
+import customtkinter as ctk
+
+from course_downloader import (
+    CONFIG_DIR, DETAIL, DEFAULT_CATALOG_TTL_HOURS, DEFAULT_COURSE_WORKERS, DEFAULT_DOWNLOAD_DIR, DEFAULT_DOWNLOAD_WORKERS, TRACER,
+    diff_course_catalogs, download_selected_courses, format_run_totals, load_course_catalog, read_settings, save_course_catalog, scan_courses,
+)
+
+ctk.set_appearance_mode("Dark")
+ctk.set_default_color_theme("blue")
+
+# Status lines are shown in batches every LOG_FLUSH_MS; the log box keeps the last LOG_MAX_LINES of them.
+# The full log (per-file lines included) goes to LOG_PATH, rotated at LOG_MAX_BYTES with LOG_BACKUPS old files kept
+LOG_FLUSH_MS = 100
+LOG_MAX_LINES = 2000
+LOG_PATH = os.path.join(CONFIG_DIR, "logs", "downloader.log")
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+# Quick re-sync reuses the sub-folders of unchanged folders for this many hours (see FolderListings), unless
+# config.ini sets another folder_reuse_hours
+QUICK_RESYNC_HOURS = 72
+
+
+class StatusLog:
+    """
+    Thread-safe pipeline between the worker threads and the log textbox. Calling it (message, level) from any
+    thread only queues the line (and writes it to the rotating log file); the Tk thread drains the queue every
+    LOG_FLUSH_MS, inserts the whole batch with one widget update and trims the box to its last LOG_MAX_LINES lines.
+    Lines below show_level (the per-file DETAIL lines, unless shown) are kept out of the box but not out of the file.
+    """
+    def __init__(self, widget, show_level=logging.INFO):
+        self.widget = widget
+        self.show_level = show_level
+        self._pending = queue.SimpleQueue()
+        self._file_log = logging.getLogger("kfupm_bb_downloader")
+        self._file_log.setLevel(DETAIL)
+        self._file_log.propagate = False
+        if not self._file_log.handlers:
+            try:
+                os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+                handler = RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(message)s"))
+                self._file_log.addHandler(handler)
+            except OSError:
+                pass # No log file then; the box still works
+
+    def __call__(self, message, level=logging.INFO):
+        self._file_log.log(level, message)
+        if level >= self.show_level:
+            self._pending.put(message)
+
+    def flush(self):
+        """Moves every queued line into the widget. Tk thread only."""
+        batch = deque(maxlen=LOG_MAX_LINES) # A burst larger than the box only needs its tail
+        try:
+            while True:
+                batch.append(self._pending.get_nowait())
+        except queue.Empty:
+            pass
+        if not batch:
+            return
+        try:
+            self.widget.configure(state="normal")
+            self.widget.insert(tk.END, "\n".join(batch) + "\n")
+            overflow = int(self.widget.index("end-1c").split(".")[0]) - 1 - LOG_MAX_LINES
+            if overflow > 0:
+                self.widget.delete("1.0", f"{overflow + 1}.0")
+            self.widget.see(tk.END)
+            self.widget.configure(state="disabled")
+        except tk.TclError: pass # Handle if widget is destroyed
+
+    def clear(self):
+        try:
+            while True: self._pending.get_nowait()
+        except queue.Empty:
+            pass
+        self.widget.configure(state="normal"); self.widget.delete(1.0, tk.END); self.widget.configure(state="disabled")
+
+
+class CourseListModel:
+    """
+    The data behind VirtualCourseList: courses grouped by term (newest term first, names sorted), the selected
+    course URLs per term, and the rows - ("term", name) headers and ("course", course) entries - that match
+    the current filter. Filtering and (de)selecting only change this model; no widget is created for it.
+    """
+    def __init__(self):
+        self.terms = []
+        self.courses_by_term = {}
+        self.selected = {}         # term -> set of selected course URLs
+        self.visible_by_term = {}  # term -> courses of that term matching the filter
+        self.rows = []
+        self.filter_text = ""
+
+    def set_courses(self, courses, keep_selection=False):
+        """Replaces the courses; with keep_selection, courses that were selected stay selected."""
+        kept_urls = set().union(*self.selected.values()) if keep_selection else set()
+        self.courses_by_term = {}
+        for course in sorted(courses, key=lambda c: c.get('name', '')):
+            self.courses_by_term.setdefault(course.get('term', 'Unknown Term'), []).append(course)
+        self.terms = sorted(self.courses_by_term, reverse=True)
+        self.selected = {term: {c['url'] for c in term_courses if c['url'] in kept_urls} for term, term_courses in self.courses_by_term.items()}
+        self._update_rows()
+
+    def set_filter(self, text):
+        self.filter_text = text.strip().lower()
+        self._update_rows()
+
+    def _update_rows(self):
+        self.rows, self.visible_by_term = [], {}
+        for term in self.terms:
+            term_matches = self.filter_text in term.lower()
+            matches = [c for c in self.courses_by_term[term] if term_matches or self.filter_text in c.get('name', '').lower()]
+            if matches:
+                self.visible_by_term[term] = matches
+                self.rows.append(("term", term))
+                self.rows.extend(("course", c) for c in matches)
+
+    def is_selected(self, course):
+        return course['url'] in self.selected.get(course.get('term', 'Unknown Term'), ())
+
+    def term_selected(self, term):
+        """True when every course of term that matches the filter is selected."""
+        visible = self.visible_by_term.get(term, [])
+        return bool(visible) and all(c['url'] in self.selected[term] for c in visible)
+
+    def toggle_course(self, course):
+        term_selection = self.selected.setdefault(course.get('term', 'Unknown Term'), set())
+        term_selection.symmetric_difference_update({course['url']})
+
+    def toggle_term(self, term):
+        """Selects the term's courses matching the filter, or deselects them if they all were."""
+        urls = {c['url'] for c in self.visible_by_term.get(term, [])}
+        if self.term_selected(term): self.selected[term] -= urls
+        else: self.selected[term] |= urls
+
+    def courses(self):
+        """Every course, in display order."""
+        return [c for term in self.terms for c in self.courses_by_term[term]]
+
+    def selected_courses(self):
+        return [c for term in self.terms for c in self.courses_by_term[term] if c['url'] in self.selected[term]]
+
+
+class VirtualCourseList(ctk.CTkFrame):
+    """
+    Scrollable list of a CourseListModel's rows that only has widgets for the rows on screen: a small pool
+    of checkboxes (one per visible line) is re-labelled as the list scrolls or the model changes, so
+    hundreds of courses cost no more widgets than a dozen. Call refresh() after changing the model.
+    """
+    ROW_HEIGHT = 28
+
+    def __init__(self, master, model, header_font, item_font, **kwargs):
+        super().__init__(master, **kwargs)
+        self.model = model
+        self.header_font = header_font
+        self.item_font = item_font
+        self.top = 0
+        self.visible = 0
+        self.slots = []       # Pool of checkboxes, reused for whichever rows are on screen
+        self.slot_state = []  # What each slot currently shows, so unchanged slots are not reconfigured
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+        self.rows_frame = ctk.CTkFrame(self, fg_color="transparent", height=kwargs.get("height", 200))
+        self.rows_frame.grid(row=0, column=0, sticky="nsew")
+        self.rows_frame.grid_propagate(False) # Its size comes from the layout, never from the rows in it
+        self.rows_frame.grid_columnconfigure(0, weight=1)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.rows_frame.bind("<Configure>", lambda e: self._fit(e.height))
+        self._bind_wheel(self.rows_frame)
+
+    def _bind_wheel(self, widget):
+        # Linux sends Button-4/5, Windows and macOS MouseWheel
+        widget.bind("<Button-4>", lambda e: self.scroll_by(-3))
+        widget.bind("<Button-5>", lambda e: self.scroll_by(3))
+        widget.bind("<MouseWheel>", lambda e: self.scroll_by(-3 if e.delta > 0 else 3))
+
+    def _fit(self, height):
+        self.visible = max(1, height // self.ROW_HEIGHT)
+        while len(self.slots) < self.visible:
+            index = len(self.slots)
+            slot = ctk.CTkCheckBox(self.rows_frame, text="", height=self.ROW_HEIGHT - 4, text_color=("gray10", "gray90"),
+                                   command=lambda i=index: self._on_click(i))
+            self._bind_wheel(slot)
+            self.slots.append(slot)
+            self.slot_state.append(None)
+        self.refresh()
+
+    def scroll_by(self, rows):
+        self.top += rows
+        self.refresh()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.top = int(float(amount) * len(self.model.rows))
+        else:
+            self.top += int(amount) * (self.visible if unit == "pages" else 1)
+        self.refresh()
+
+    def _on_click(self, slot_index):
+        kind, value = self.model.rows[self.top + slot_index]
+        if kind == "term": self.model.toggle_term(value)
+        else: self.model.toggle_course(value)
+        self.refresh()
+
+    def refresh(self):
+        """Redraws the visible rows from the model."""
+        rows = self.model.rows
+        self.top = max(0, min(self.top, len(rows) - self.visible))
+        for slot_index, slot in enumerate(self.slots):
+            row_index = self.top + slot_index
+            if slot_index >= self.visible or row_index >= len(rows):
+                state = None
+            else:
+                kind, value = rows[row_index]
+                if kind == "term":
+                    state = (f"--- {value} ---", self.header_font, 5, self.model.term_selected(value))
+                else:
+                    state = (value['name'], self.item_font, 25, self.model.is_selected(value))
+            if state == self.slot_state[slot_index]:
+                continue
+            previous, self.slot_state[slot_index] = self.slot_state[slot_index], state
+            if state is None:
+                slot.grid_remove()
+                continue
+            text, font, indent, checked = state
+            slot.configure(text=text, font=font)
+            if checked: slot.select()
+            else: slot.deselect()
+            if previous is None or previous[2] != indent:
+                slot.grid(row=slot_index, column=0, sticky="w", padx=(indent, 5), pady=2)
+        total = len(rows) or 1
+        self.scrollbar.set(self.top / total, min(1.0, (self.top + self.visible) / total))
+
+
+# --- GUI Application Class (largely unchanged from your previous version with my UI tweaks) ---
+class App(ctk.CTk):
+    def __init__(self):
+        super().__init__()
+        self.title("Blackboard Course Downloader")
+        self.geometry("700x1000")
+        self.all_course_data = []
+        self.catalog_ttl_hours = DEFAULT_CATALOG_TTL_HOURS
+        self.max_requests_per_second = 0.0 # 0 = unlimited; only settable in config.ini for now
+        self.max_bandwidth_mb_per_s = 0.0
+        self.folder_reuse_hours = QUICK_RESYNC_HOURS # Used while quick re-sync is on
+        self.trace_file = "" # Chrome trace of each download run ("" = off) and cProfile output folder; config.ini only
+        self.profile_dir = ""
+        self.resizable(0,0)
+
+        # Configure grid layout (1x1)
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+
+        main_frame = ctk.CTkFrame(self)
+        main_frame.grid(row=0, column=0, sticky="nsew", padx=10, pady=10)
+
+        # --- UI Widgets setup ---
+        self.main_font = ctk.CTkFont(family="Roboto Medium", size=12)
+        self.header_font = ctk.CTkFont(family="Roboto Medium", size=13, weight="bold")
+        self.button_font = ctk.CTkFont(family="Roboto Medium", size=14, weight="bold") # New font for buttons
+        
+        row_idx = 0 # Keeps track of the current grid row
+
+        # Configure columns for the main frame to ensure alignment
+        # Column 0: Labels (Fixed width/content)
+        # Column 1: Entries (Expands)
+        # Column 2: Browse Button (Fixed width)
+        main_frame.grid_columnconfigure(0, weight=0) # Labels don't expand
+        main_frame.grid_columnconfigure(1, weight=1) # Entries expand
+        main_frame.grid_columnconfigure(2, weight=0) # Button doesn't expand
+
+        # Username
+        ctk.CTkLabel(main_frame, text="Username", font=self.header_font, text_color=("gray10", "gray90")).grid(row=row_idx, column=0, sticky="w", pady=(0, 5))
+        self.username_entry = ctk.CTkEntry(main_frame, width=200, font=self.main_font)
+        self.username_entry.grid(row=row_idx, column=1, columnspan=2, sticky="ew", pady=(0, 5), padx=(5, 0))
+        row_idx += 1
+
+        # Password
+        ctk.CTkLabel(main_frame, text="Password", font=self.header_font, text_color=("gray10", "gray90")).grid(row=row_idx, column=0, sticky="w", pady=(0, 5))
+        self.password_entry = ctk.CTkEntry(main_frame, width=200, show="*", font=self.main_font)
+        self.password_entry.grid(row=row_idx, column=1, columnspan=2, sticky="ew", pady=(0, 5), padx=(5, 0))
+        row_idx += 1
+
+        # Download Path (Isolated Frame for Robustness)
+        # We use a separate frame spanning all columns to ensure the button layout is isolated from the main grid's resizing logic.
+        path_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        path_frame.grid(row=row_idx, column=0, columnspan=3, sticky="ew", pady=(0, 5))
+        
+        # Configure grid within path_frame
+        path_frame.grid_columnconfigure(0, weight=0) # Label
+        path_frame.grid_columnconfigure(1, weight=1) # Entry
+        path_frame.grid_columnconfigure(2, weight=0) # Button
+
+        # Label (Col 0) - Matches main grid Col 0 alignment
+        ctk.CTkLabel(path_frame, text="Download To", font=self.header_font, text_color=("gray10", "gray90")).grid(row=0, column=0, sticky="w", padx=(0, 5))
+        
+        # Entry (Col 1)
+        self.path_var = tk.StringVar(value=DEFAULT_DOWNLOAD_DIR)
+        self.path_entry = ctk.CTkEntry(path_frame, textvariable=self.path_var, font=self.main_font)
+        self.path_entry.grid(row=0, column=1, sticky="ew", padx=(5, 5)) # Right padding to separate from button
+
+        # Browse Button (Col 2)
+        self.browse_button = ctk.CTkButton(path_frame, text="Browse", width=80, command=self.browse_directory, font=self.button_font)
+        self.browse_button.grid(row=0, column=2, sticky="ew", padx=(0, 0))
+        
+        # Force button to top layer to prevent any clipping issues
+        self.browse_button.lift()
+        
+        row_idx += 1
+
+        # Browser Selection Frame
+        browser_frame = ctk.CTkFrame(main_frame)
+        browser_frame.grid(row=row_idx, column=0, columnspan=3, sticky="ew", pady=10, padx=2)
+        # Explicitly set text_color to ensure visibility in dark mode
+        # Left aligned
+        ctk.CTkLabel(browser_frame, text="Browser for Automation (must be installed)", font=self.header_font, text_color=("gray10", "gray90")).pack(side="top", anchor="w", pady=5, padx=5)
+        
+        # Container for radio buttons (Left aligned)
+        rb_frame = ctk.CTkFrame(browser_frame, fg_color="transparent")
+        rb_frame.pack(side="top", anchor="w", pady=5, padx=5)
+
+        self.browser_var = tk.StringVar(value="firefox") 
+        self.firefox_rb = ctk.CTkRadioButton(rb_frame, text="Use Firefox", variable=self.browser_var, value="firefox", font=self.header_font, text_color=("gray10", "gray90"))
+        self.firefox_rb.pack(side="left", padx=(0, 20))
+        
+        self.chrome_rb = ctk.CTkRadioButton(rb_frame, text="Use Chrome", variable=self.browser_var, value="chrome", font=self.header_font, text_color=("gray10", "gray90"))
+        self.chrome_rb.pack(side="left", padx=0)
+        
+        row_idx += 1
+
+        # Headless Checkbox
+        self.headless_var = tk.BooleanVar(value=True)
+        self.headless_check = ctk.CTkCheckBox(main_frame, text="Run in Headless Mode (no browser window visible - recommended)", variable=self.headless_var, font=self.header_font, text_color=("gray10", "gray90"))
+        self.headless_check.grid(row=row_idx, column=0, columnspan=3, sticky="w", pady=5)
+        row_idx += 1
+
+        # HTTP Crawl Checkbox
+        self.http_crawl_var = tk.BooleanVar(value=True)
+        self.http_crawl_check = ctk.CTkCheckBox(main_frame, text="Crawl pages without the browser (faster)", variable=self.http_crawl_var, font=self.header_font,
+                                                text_color=("gray10", "gray90"), command=self.save_credentials)
+        self.http_crawl_check.grid(row=row_idx, column=0, columnspan=3, sticky="w", pady=5)
+        row_idx += 1
+
+        # Quick Re-sync Checkbox
+        self.quick_resync_var = tk.BooleanVar(value=False)
+        self.quick_resync_check = ctk.CTkCheckBox(main_frame, text="Quick re-sync: skip sub-folders of unchanged folders (files added deep inside\n"
+                                                  f"an unchanged folder are only found up to {QUICK_RESYNC_HOURS:g} hours later)",
+                                                  variable=self.quick_resync_var, font=self.header_font, text_color=("gray10", "gray90"),
+                                                  command=self.save_credentials)
+        self.quick_resync_check.grid(row=row_idx, column=0, columnspan=3, sticky="w", pady=5)
+        row_idx += 1
+
+        # Parallel Downloads / Parallel Courses
+        workers_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
+        workers_frame.grid(row=row_idx, column=0, columnspan=3, sticky="w", pady=5)
+        ctk.CTkLabel(workers_frame, text="Parallel Downloads", font=self.header_font, text_color=("gray10", "gray90")).pack(side="left", padx=(0, 10))
+        self.workers_var = tk.StringVar(value=str(DEFAULT_DOWNLOAD_WORKERS))
+        self.workers_menu = ctk.CTkOptionMenu(workers_frame, variable=self.workers_var, values=["1", "2", "4", "6", "8"], width=80, font=self.main_font,
+                                              command=lambda _: self.save_credentials())
+        self.workers_menu.pack(side="left")
+        ctk.CTkLabel(workers_frame, text="Parallel Courses", font=self.header_font, text_color=("gray10", "gray90")).pack(side="left", padx=(20, 10))
+        self.course_workers_var = tk.StringVar(value=str(DEFAULT_COURSE_WORKERS))
+        self.course_workers_menu = ctk.CTkOptionMenu(workers_frame, variable=self.course_workers_var, values=["1", "2", "3", "4"], width=80, font=self.main_font,
+                                                     command=lambda _: self.save_credentials())
+        self.course_workers_menu.pack(side="left")
+        row_idx += 1
+
+        # Scan Button
+        self.scan_button = ctk.CTkButton(main_frame, text="1. Scan Courses", command=self.start_scan_thread, font=self.button_font, height=40)
+        self.scan_button.grid(row=row_idx, column=0, columnspan=3, sticky="ew", pady=10)
+        row_idx += 1
+
+        # Select Courses Label (Left aligned)
+        ctk.CTkLabel(main_frame, text="Select Course(s) to Download", font=self.header_font, text_color=("gray10", "gray90")).grid(row=row_idx, column=0, columnspan=3, sticky="w", pady=(10, 0))
+        row_idx += 1
+        
+        # Course List: filter box over a virtualized list (only the rows on screen have widgets)
+        course_list_frame = ctk.CTkFrame(main_frame)
+        course_list_frame.grid(row=row_idx, column=0, columnspan=3, sticky="nsew", pady=5)
+        course_list_frame.grid_columnconfigure(0, weight=1)
+        course_list_frame.grid_rowconfigure(1, weight=1)
+        self.course_filter_entry = ctk.CTkEntry(course_list_frame, placeholder_text="Filter by course or term name...", font=self.main_font)
+        self.course_filter_entry.grid(row=0, column=0, sticky="ew", padx=5, pady=(5, 0))
+        self.course_filter_entry.bind("<KeyRelease>", lambda e: self.apply_course_filter())
+        self.course_model = CourseListModel()
+        self.course_list = VirtualCourseList(course_list_frame, self.course_model, self.header_font, self.header_font, height=200, fg_color="transparent")
+        self.course_list.grid(row=1, column=0, sticky="nsew", padx=5, pady=5)
+        row_idx += 1
+
+        # Download Button
+        self.download_button = ctk.CTkButton(main_frame, text="2. Download Selected Course(s)", command=self.start_download_thread, state="disabled", height=40, font=self.button_font)
+        self.download_button.grid(row=row_idx, column=0, columnspan=3, pady=15, sticky="ew")
+        row_idx += 1
+
+        # Status & Logs Frame
+        status_frame = ctk.CTkFrame(main_frame)
+        status_frame.grid(row=row_idx, column=0, columnspan=3, sticky="nsew", pady=(10,0))
+        status_frame.columnconfigure(0, weight=1)
+        status_frame.rowconfigure(0, weight=1)
+
+        self.status_text = ctk.CTkTextbox(status_frame, height=150, state="disabled", wrap="word", font=("Consolas", 11))
+        self.status_text.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
+        self.status_log = StatusLog(self.status_text)
+        self.verbose_log_var = tk.BooleanVar(value=False)
+        self.verbose_log_check = ctk.CTkCheckBox(status_frame, text=f"Show every file in the log (the full log is always saved to {LOG_PATH})",
+                                                 variable=self.verbose_log_var, font=self.main_font, text_color=("gray10", "gray90"),
+                                                 command=self.toggle_verbose_log)
+        self.verbose_log_check.grid(row=1, column=0, sticky="w", padx=5, pady=(0, 5))
+        row_idx +=1 
+
+        # Progress Bar
+        self.progress_bar = ctk.CTkProgressBar(main_frame, orientation="horizontal", mode="determinate")
+        self.progress_bar.grid(row=row_idx, column=0, columnspan=3, sticky="ew", pady=(5,10))
+        self.progress_bar.set(0)
+        row_idx += 1
+
+        # --- Column and Row Configurations for main_frame ---
+        main_frame.rowconfigure(12, weight=1)
+        
+        # Make the course list row expandable
+        # The course list is at a specific row index. Let's find it dynamically or hardcode if we know.
+        # Based on the code above:
+        # 0: Username, 1: Password, 2: Path, 3: Browser, 4: Headless, 5: HTTP Crawl, 6: Quick Re-sync, 7: Parallel Downloads/Courses,
+        # 8: Scan Button, 9: Label, 10: Course List
+        main_frame.rowconfigure(10, weight=1) 
+        main_frame.columnconfigure(1, weight=1)
+        
+        # Load saved settings (credentials, path, etc.)
+        self.load_credentials()
+        self.apply_log_level()
+        self._progress_value = None
+        self.after(LOG_FLUSH_MS, self.flush_ui_updates)
+        self.username_entry.bind("<KeyRelease>", lambda e: self.save_credentials_throttled())
+        self.password_entry.bind("<KeyRelease>", lambda e: self.save_credentials_throttled())
+        self.path_entry.bind("<KeyRelease>", lambda e: self.save_credentials_throttled())
+        self._save_timer = None
+
+        # Show the last scanned course list straight away; it is refreshed in the background once older than the TTL
+        self.after(100, self.load_cached_catalog)
+
+    def save_credentials_throttled(self):
+        if self._save_timer: self.after_cancel(self._save_timer)
+        self._save_timer = self.after(1000, self.save_credentials) 
+
+    def save_credentials(self):
+        try:
+            os.makedirs(CONFIG_DIR, exist_ok=True)
+            config_file = os.path.join(CONFIG_DIR, "config.ini")
+            with open(config_file, "w") as f:
+                f.write(f"username={self.username_entry.get()}\n")
+                # Storing password in plain text - UNSAFE, for local convenience only.
+                # Consider using 'keyring' for more secure storage.
+                f.write(f"password={self.password_entry.get()}\n") 
+                f.write(f"download_path={self.path_var.get()}\n")
+                f.write(f"browser_choice={self.browser_var.get()}\n")
+                f.write(f"headless_mode={self.headless_var.get()}\n")
+                f.write(f"download_workers={self.workers_var.get()}\n")
+                f.write(f"http_crawl={self.http_crawl_var.get()}\n")
+                f.write(f"course_workers={self.course_workers_var.get()}\n")
+                f.write(f"catalog_ttl_hours={self.catalog_ttl_hours:g}\n")
+                f.write(f"max_requests_per_second={self.max_requests_per_second:g}\n")
+                f.write(f"max_bandwidth_mb_per_s={self.max_bandwidth_mb_per_s:g}\n")
+                f.write(f"folder_reuse_hours={self.folder_reuse_hours if self.quick_resync_var.get() else 0:g}\n")
+                f.write(f"verbose_log={self.verbose_log_var.get()}\n")
+                f.write(f"trace_file={self.trace_file}\n")
+                f.write(f"profile_dir={self.profile_dir}\n")
+        except Exception as e:
+            self.update_status(f"Warning: Could not save settings: {e}")
+
+    def load_credentials(self):
+        try:
+            for name, value in read_settings().items():
+                if name == "username": self.username_entry.insert(0, value)
+                elif name == "password": self.password_entry.insert(0, value)
+                elif name == "download_path": self.path_var.set(value)
+                elif name == "browser_choice": self.browser_var.set(value)
+                elif name == "headless_mode": self.headless_var.set(value.lower() == 'true')
+                elif name == "download_workers" and value.isdigit(): self.workers_var.set(value)
+                elif name == "http_crawl": self.http_crawl_var.set(value.lower() == 'true')
+                elif name == "course_workers" and value.isdigit(): self.course_workers_var.set(value)
+                elif name == "catalog_ttl_hours": self.catalog_ttl_hours = float(value)
+                elif name == "max_requests_per_second": self.max_requests_per_second = float(value or 0)
+                elif name == "max_bandwidth_mb_per_s": self.max_bandwidth_mb_per_s = float(value or 0)
+                elif name == "folder_reuse_hours":
+                    self.quick_resync_var.set(float(value or 0) > 0)
+                    if float(value or 0) > 0: self.folder_reuse_hours = float(value)
+                elif name == "verbose_log": self.verbose_log_var.set(value.lower() == 'true')
+                elif name == "trace_file": self.trace_file = value
+                elif name == "profile_dir": self.profile_dir = value
+        except Exception as e:
+            self.update_status(f"Warning: Could not load saved settings: {e}")
+
+    def browse_directory(self):
+        directory = filedialog.askdirectory(initialdir=self.path_var.get())
+        if directory: 
+            self.path_var.set(directory)
+            self.save_credentials() 
+
+    def apply_log_level(self):
+        self.status_log.show_level = DETAIL if self.verbose_log_var.get() else logging.INFO
+
+    def toggle_verbose_log(self):
+        self.apply_log_level()
+        self.save_credentials()
+
+    def update_status(self, message, level=logging.INFO):
+        # Safe from any thread: the line is queued and shown by the next flush_ui_updates
+        self.status_log(message, level)
+
+    def update_progress(self, value):
+        self._progress_value = value # Only the latest value matters; shown by the next flush_ui_updates
+
+    def flush_ui_updates(self):
+        """Applies the queued log lines and the latest progress in one go, then reschedules itself."""
+        self.status_log.flush()
+        value, self._progress_value = self._progress_value, None
+        if value is not None:
+            try:
+                self.progress_bar.set(value / 100)
+            except tk.TclError: pass
+        self.after(LOG_FLUSH_MS, self.flush_ui_updates)
+
+    def set_ui_state(self, enabled):
+        state = "normal" if enabled else "disabled"
+        widgets_to_toggle = [
+            self.username_entry, self.password_entry, self.path_entry,
+            self.browse_button, self.scan_button, self.headless_check,
+            self.firefox_rb, self.chrome_rb, self.workers_menu, self.http_crawl_check, self.quick_resync_check, self.course_workers_menu
+        ]
+        for widget in widgets_to_toggle:
+            if widget: widget.configure(state=state)
+        
+        # Download button depends on courses being scanned
+        if enabled and self.all_course_data:
+            self.download_button.configure(state="normal")
+        else:
+            self.download_button.configure(state="disabled")
+
+    def start_scan_thread(self):
+        self.set_ui_state(False)
+        # Clear status text on new scan
+        self.status_log.clear()
+        self.update_status("Scan initiated...")
+        threading.Thread(target=self.scan_courses_task, daemon=True).start()
+
+    def start_background_refresh(self):
+        # Only the scan button is locked; the cached list stays usable while the refresh runs
+        self.scan_button.configure(state="disabled")
+        self.update_status("Refreshing the course list in the background...")
+        threading.Thread(target=self.scan_courses_task, kwargs={"background": True}, daemon=True).start()
+
+    def load_cached_catalog(self):
+        username = self.username_entry.get()
+        cached = load_course_catalog(username) if username else None
+        if not cached:
+            return
+        courses, saved_at = cached
+        age_hours = (time.time() - saved_at) / 3600
+        self.populate_course_list(courses)
+        self.update_status(f"Loaded {len(courses)} courses from the saved catalog (scanned {age_hours:.1f} h ago). Use '1. Scan Courses' to rescan now.")
+        if age_hours > self.catalog_ttl_hours:
+            self.start_background_refresh()
+
+    def scan_courses_task(self, background=False):
+        username = self.username_entry.get(); password = self.password_entry.get()
+        if not username or not password:
+            if background:
+                self.after(0, lambda: self.scan_button.configure(state="normal")); return
+            messagebox.showerror("Input Error", "Username and Password are required.")
+            self.after(0, self.set_ui_state, True); return
+        
+        if not background: self.save_credentials() 
+        try:
+            scanned_courses = scan_courses(username, password, self.browser_var.get(), self.headless_var.get(), self.update_status)
+            
+            if scanned_courses:
+                self.update_status(f"Scan complete. Found {len(scanned_courses)} courses across terms.")
+                if background:
+                    added, removed = diff_course_catalogs(self.all_course_data, scanned_courses)
+                    for course in added: self.update_status(f"  + New course: {course['name']} ({course.get('term', 'Unknown Term')})")
+                    for course in removed: self.update_status(f"  - No longer listed: {course['name']} ({course.get('term', 'Unknown Term')})")
+                    if not added and not removed: self.update_status("  Course list unchanged.")
+                try:
+                    save_course_catalog(username, scanned_courses)
+                except OSError as e_save:
+                    self.update_status(f"Note: Could not save the course catalog: {e_save}")
+                self.after(0, self.populate_course_list, scanned_courses, background)
+            elif background:
+                self.update_status("Background refresh found no courses; keeping the saved list.")
+            else:
+                self.update_status("Scan complete: No terms or courses found. Please check your Blackboard or the selectors in the script if the page structure has changed.")
+                # Ensure download button is disabled if no courses
+                self.after(0, self.populate_course_list, [])
+
+        except RuntimeError as e: 
+            self.update_status(f"Driver Error: {e}")
+            if not background: messagebox.showerror("Driver Setup Error", str(e))
+        except Exception as e:
+            self.update_status(f"An error occurred during scan: {e}")
+            import traceback; self.update_status(traceback.format_exc())
+            if not background: messagebox.showerror("Scan Error", f"An unexpected error occurred during scan: {e}")
+        finally:
+            if background:
+                self.after(0, lambda: self.scan_button.configure(state="normal"))
+            else:
+                self.after(0, self.set_ui_state, True)
+
+    def populate_course_list(self, courses, keep_selection=False):
+        """Shows courses in the list; with keep_selection, courses that were ticked stay ticked."""
+        self.course_model.set_courses(courses, keep_selection)
+        self.all_course_data = self.course_model.courses()
+        self.course_list.refresh()
+        self.download_button.configure(state="normal" if self.all_course_data else "disabled") # Enable download if courses found
+
+    def apply_course_filter(self):
+        self.course_model.set_filter(self.course_filter_entry.get())
+        self.course_list.top = 0
+        self.course_list.refresh()
+
+    def start_download_thread(self):
+        selected_courses = self.course_model.selected_courses()
+
+        if not selected_courses:
+            messagebox.showwarning("No Selection", "Please select at least one course to download.")
+            return
+
+        self.set_ui_state(False)
+        self.update_status("Download initiated...")
+        # Pass selected courses directly
+        threading.Thread(target=self.download_courses_task, args=(selected_courses,), daemon=True).start()
+
+    def download_courses_task(self, courses_to_process):
+        username = self.username_entry.get(); password = self.password_entry.get()
+        
+        self.update_status(f"Starting download for {len(courses_to_process)} selected course(s)...")
+        if self.trace_file:
+            TRACER.start(self.profile_dir or None)
+        try:
+            with TRACER.span("download_courses_task", "gui", courses=len(courses_to_process)):
+                run_totals = download_selected_courses(
+                    courses_to_process, self.path_var.get(), username, password, self.update_status,
+                    self.update_progress, browser_choice=self.browser_var.get(),
+                    headless=self.headless_var.get(), http_crawl=self.http_crawl_var.get(),
+                    download_workers=int(self.workers_var.get() or DEFAULT_DOWNLOAD_WORKERS),
+                    course_workers=int(self.course_workers_var.get() or DEFAULT_COURSE_WORKERS),
+                    requests_per_second=self.max_requests_per_second or None,
+                    bytes_per_second=self.max_bandwidth_mb_per_s * 1e6 or None,
+                    folder_reuse_hours=self.folder_reuse_hours if self.quick_resync_var.get() else 0)
+
+            # ... (rest of the try...except...finally for the entire courses loop) ...
+            self.update_status(format_run_totals(run_totals))
+            self.update_status("\nAll selected courses and their specified sections processed!")
+            messagebox.showinfo("Download Complete", "All selected courses have been processed. Check the status window for details.")
+        except RuntimeError as e: 
+            self.update_status(f"Driver Error during download: {e}")
+            messagebox.showerror("Driver Setup Error", str(e))
+        except Exception as e:
+            self.update_status(f"A critical error occurred during download: {e}")
+            import traceback; self.update_status(traceback.format_exc())
+            messagebox.showerror("Download Error", f"A critical error occurred: {e}. Check status for details.")
+        finally:
+            if self.trace_file:
+                TRACER.stop()
+                try:
+                    TRACER.write(self.trace_file)
+                    self.update_status(f"Trace written to {self.trace_file} (open it in ui.perfetto.dev).")
+                except OSError as e_trace:
+                    self.update_status(f"Warning: Could not write the trace: {e_trace}")
+            self.after(0, self.set_ui_state, True)
+            self.update_progress(0)
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support() # Needed for the course worker processes in the frozen (.exe) build
+    app = App()
+    app.mainloop()
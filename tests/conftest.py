@@ -0,0 +1,68 @@
+"""
+Shared fixtures: the local mock Blackboard (benchmarks/mock_blackboard.py) on a free port, and a session
+logged in to it. HOME points at a temporary folder before course_downloader is imported, because the module
+takes its state paths (saved sessions, manifest, catalog, job queue) from the home folder at import.
+"""
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [REPO_DIR, os.path.join(REPO_DIR, "benchmarks")]
+TEST_HOME = tempfile.mkdtemp(prefix="bb-tests-")
+os.environ["HOME"] = os.environ["USERPROFILE"] = TEST_HOME
+
+import course_downloader as bb # noqa: E402 - only after HOME is set
+from mock_blackboard import MockBlackboardServer, SyntheticCatalog # noqa: E402
+from run_benchmarks import USERNAME, PASSWORD, http_login # noqa: E402
+
+COURSE_SIZES = (12, 40)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(TEST_HOME, ignore_errors=True)
+
+
+def quiet(message, level=logging.INFO):
+    pass
+
+
+def file_bytes(server, file_id):
+    """The full body the mock server sends for file_id."""
+    size = server.catalog.files[file_id][1]
+    return b"".join(server.catalog.body(file_id, server.block, 0, size))
+
+
+@pytest.fixture(scope="session")
+def mock_server():
+    server = MockBlackboardServer(("127.0.0.1", 0), SyntheticCatalog(course_sizes=COURSE_SIZES, file_size=(16 * 1024, 256 * 1024)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def login_cookies(mock_server):
+    """Logs in to the mock server and saves the session, as a browser login would."""
+    bb.set_base_url(mock_server.base_url)
+    cookies = http_login(mock_server.base_url)
+    bb.save_session_cookies(USERNAME, cookies)
+    return cookies
+
+
+@pytest.fixture
+def session(login_cookies):
+    return bb.build_session(login_cookies)
+
+
+@pytest.fixture
+def credentials(login_cookies):
+    return USERNAME, PASSWORD
@@ -0,0 +1,102 @@
+"""Archive output: a run that dies, or fails to write a member, leaves the previous archive readable and reopenable."""
+import errno
+import io
+import os
+import subprocess
+import sys
+import tarfile
+import zipfile
+
+import pytest
+
+from conftest import REPO_DIR, bb
+
+# Opens the archive, writes one more member, waits until the writer thread has written it, then dies without close()
+CRASHING_RUN = """
+import os, sys, time
+sys.path.insert(0, {repo!r})
+import course_downloader as bb
+archive = bb.ARCHIVE_FORMATS[{archive_format!r}]({path!r})
+data = os.urandom(4 * 1024 * 1024) # Larger than any write buffer, so the member reaches the disk
+archive.add_bytes("course/lost.bin", data, {{"url": "u-lost", "size": len(data), "sha256": "x"}}, time.time())
+while not archive._queue.empty():
+    time.sleep(0.01)
+time.sleep(0.5)
+os._exit(1)
+"""
+
+
+class _FullDisk(io.BytesIO):
+    """A member whose bytes cannot be read back, like a spool file on a disk that filled up."""
+    def read(self, *args):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+
+def _entry(url, data):
+    return {"url": url, "size": len(data), "sha256": url, "etag": None, "last_modified": None}
+
+
+def _write(archive_format, path, members):
+    """Adds members in one run; returns the names in the archive's member index."""
+    archive = bb.ARCHIVE_FORMATS[archive_format](path)
+    for name, data in members.items():
+        archive.add_bytes(name, data, _entry("u-" + name, data), 1700000000)
+    archive.close()
+    return sorted(archive.index)
+
+
+def _read_members(archive_format, path):
+    if archive_format == "zip":
+        with zipfile.ZipFile(path) as archive:
+            return {name: archive.read(name) for name in archive.namelist() if name != bb.ZipArchiveWriter.ZIP_INDEX_MEMBER}
+    zstandard = pytest.importorskip("zstandard")
+    with open(path, "rb") as f:
+        data = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True).read()
+    members = {}
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:") as archive:
+        for info in archive:
+            members[info.name] = archive.extractfile(info).read()
+    return members
+
+
+@pytest.mark.parametrize("archive_format", ["zip", "tar.zst"])
+def test_archive_survives_a_crashed_run(archive_format, tmp_path):
+    if archive_format == "tar.zst":
+        pytest.importorskip("zstandard")
+    path = str(tmp_path / ("course" + bb.ARCHIVE_FORMATS[archive_format].extension))
+    first = {"course/a.txt": b"first file", "course/b.txt": b"second file"}
+    _write(archive_format, path, first)
+    with open(path, "rb") as f:
+        before = f.read()
+
+    crashed = subprocess.run([sys.executable, "-c", CRASHING_RUN.format(repo=REPO_DIR, archive_format=archive_format, path=path)])
+    assert crashed.returncode == 1
+    with open(path, "rb") as f:
+        assert f.read() == before
+
+    assert _write(archive_format, path, {"course/c.txt": b"third file"}) == ["course/a.txt", "course/b.txt", "course/c.txt"]
+    assert _read_members(archive_format, path) == {**first, "course/c.txt": b"third file"}
+    assert not os.path.exists(path + bb.PART_SUFFIX)
+
+
+@pytest.mark.parametrize("archive_format", ["zip", "tar.zst"])
+def test_failed_member_leaves_the_archive_unchanged(archive_format, tmp_path):
+    if archive_format == "tar.zst":
+        pytest.importorskip("zstandard")
+    path = str(tmp_path / ("course" + bb.ARCHIVE_FORMATS[archive_format].extension))
+    first = {"course/a.txt": b"first file", "course/b.txt": b"second file"}
+    _write(archive_format, path, first)
+    with open(path, "rb") as f:
+        before = f.read()
+
+    archive = bb.ARCHIVE_FORMATS[archive_format](path)
+    archive.add_bytes("course/c.txt", b"third file", _entry("u-course/c.txt", b"third file"), 1700000000)
+    archive.add("course/a.txt", _FullDisk(), _entry("u-course/a.txt", b"changed first file"), 1700000000)
+    with pytest.raises(IOError):
+        archive.close()
+    with open(path, "rb") as f:
+        assert f.read() == before
+    assert not os.path.exists(path + bb.PART_SUFFIX)
+
+    assert _write(archive_format, path, {"course/a.txt": b"changed first file"}) == ["course/a.txt", "course/b.txt"]
+    assert _read_members(archive_format, path) == {**first, "course/a.txt": b"changed first file"}
@@ -0,0 +1,65 @@
+"""The scan, plan and download commands, run in-process against the mock server."""
+import json
+import os
+
+import pytest
+
+from conftest import PASSWORD, USERNAME, bb, file_bytes
+
+
+@pytest.fixture
+def cli(mock_server, credentials, monkeypatch):
+    monkeypatch.setenv("BB_PASSWORD", PASSWORD)
+    return lambda *argv: bb.main(["--base-url", mock_server.base_url, *argv])
+
+
+def _downloaded_files(root):
+    """Paths of the files saved under root, leaving out the blob store and other hidden entries."""
+    files = []
+    for folder, folders, names in os.walk(root):
+        folders[:] = [name for name in folders if not name.startswith(".")]
+        files += [os.path.join(folder, name) for name in names if not name.startswith(".")]
+    return files
+
+
+def test_scan_prints_the_course_list_as_json(mock_server, cli, capsys):
+    assert cli("scan", "--username", USERNAME, "--rescan", "--json") == 0
+    courses = json.loads(capsys.readouterr().out)
+    assert sorted(course["name"] for course in courses) == sorted(course["name"] for course in mock_server.catalog.courses)
+
+
+def test_plan_then_download_then_plan_again(mock_server, cli, tmp_path, capsys):
+    output = str(tmp_path / "downloads")
+    file_count = len(mock_server.catalog.files)
+
+    assert cli("plan", "--username", USERNAME, "--rescan", "--all", "--output", output) == 0
+    plan = json.loads(capsys.readouterr().out)
+    assert plan["totals"]["new"]["count"] == file_count
+    assert not os.path.exists(output)
+
+    assert cli("download", "--username", USERNAME, "--all", "--output", output, "--workers", "2", "--quiet") == 0
+    files = _downloaded_files(output)
+    assert len(files) == file_count
+    file_id = max(mock_server.catalog.files)
+    saved = [path for path in files if open(path, "rb").read(64).startswith(b"%%PDF-1.4 synthetic file %d\n" % file_id)]
+    assert len(saved) == 1 and open(saved[0], "rb").read() == file_bytes(mock_server, file_id)
+
+    plan_file = str(tmp_path / "plan.json")
+    assert cli("plan", "--username", USERNAME, "--all", "--output", output, "--plan-file", plan_file) == 0
+    with open(plan_file, encoding="utf-8") as f:
+        totals = json.load(f)["totals"]
+    assert totals["unchanged"]["count"] == file_count
+    assert totals["new"]["count"] == totals["changed"]["count"] == totals["removed"]["count"] == 0
+
+
+def test_resync_reuses_unchanged_folders_only_when_asked(mock_server, cli, tmp_path):
+    download = ["download", "--username", USERNAME, "--course", "SYN40", "--output", str(tmp_path), "--quiet"]
+
+    def pages_fetched(*extra):
+        before = mock_server.stats["pages"]
+        assert cli(*download, *extra) == 0
+        return mock_server.stats["pages"] - before
+
+    fresh = pages_fetched()
+    assert pages_fetched() == fresh
+    assert pages_fetched("--folder-reuse-hours", "72") < fresh
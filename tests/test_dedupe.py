@@ -0,0 +1,36 @@
+"""The BlobStore: the same bytes saved into several course folders are stored once, as hard links to one blob."""
+import hashlib
+import os
+
+import pytest
+
+from conftest import bb, file_bytes, quiet
+
+
+@pytest.mark.parametrize("with_manifest", [False, True])
+def test_same_file_in_two_courses_is_stored_once(mock_server, session, tmp_path, with_manifest):
+    file_id = min(mock_server.catalog.files)
+    url = mock_server.base_url.rstrip("/") + mock_server.catalog.file_url(file_id)
+    expected = file_bytes(mock_server, file_id)
+    blob_store = bb.BlobStore(str(tmp_path / bb.BLOB_STORE_DIRNAME))
+    manifest = bb.DownloadManifest(str(tmp_path / "manifest.sqlite3")) if with_manifest else None
+    engine = bb.DownloadEngine(session, quiet, manifest=manifest, blob_store=blob_store)
+
+    saved = []
+    for course in ("Term/Course A", "Term/Course B"):
+        course_dir = tmp_path / course
+        course_dir.mkdir(parents=True)
+        before = mock_server.stats["bytes"]
+        assert engine._download_file(str(course_dir), url, str(course_dir), "notes", ".pdf") == "SAVED"
+        saved.append((str(course_dir / "notes.pdf"), mock_server.stats["bytes"] - before))
+
+    (first, first_bytes), (second, second_bytes) = saved
+    assert first_bytes == len(expected)
+    # With the manifest the server's 304 is enough to reuse the stored copy; without it the body is read and then linked
+    assert second_bytes == (0 if with_manifest else len(expected))
+    assert open(second, "rb").read() == expected
+    sha256 = hashlib.sha256(expected).hexdigest()
+    assert os.path.samefile(first, second) and os.path.samefile(first, blob_store.path_for(sha256))
+    assert engine.results["DEDUPED"] == 1
+    if manifest:
+        manifest.close()
@@ -0,0 +1,64 @@
+"""Reading listContent.jsp pages without a browser: the HTML tree, item extraction and classification."""
+import os
+
+from conftest import bb, quiet
+
+PAGE_URL = "https://blackboard.test/webapps/blackboard/content/listContent.jsp?course_id=_7_1&content_id=_100_1"
+
+LIST_PAGE = """<html><body><div id="content"><ul id="content_listContainer" class="contentList">
+<li class="clearfix liItem read" id="contentListItem:_101_1"><div class="item clearfix"><h3>
+  <a href="/webapps/blackboard/content/listContent.jsp?course_id=_7_1&amp;content_id=_101_1"><span>Week 1</span></a></h3></div></li>
+<li class="clearfix liItem read" id="contentListItem:_102_1"><div class="item clearfix"><h3>
+  <a href="/bbcswebdav/pid-102-dt-content-rid-1_1/courses/C7/slides.pdf"><span>Lecture 1 Slides</span></a></h3></div></li>
+<li class="clearfix liItem read" id="contentListItem:_103_1"><div class="item clearfix"><h3><span>Assignment 1</span></h3></div>
+  <div class="details"><ul class="attachments clearfix">
+    <li><a href="/bbcswebdav/pid-103-dt-content-rid-2_1/courses/C7/hw1.pdf">hw1.pdf</a></li>
+    <li><a href="https://www.example.com/dataset">Dataset</a></li></ul></div></li>
+<li class="clearfix liItem read" id="contentListItem:_104_1"><div class="item clearfix"><h3>
+  <a href="https://www.example.com/reading">Reading list</a></h3></div></li>
+<li class="clearfix liItem read" id="contentListItem:_105_1"><div class="item clearfix"><h3><span>Announcement only</span></h3></div>
+  <div class="details"><p>Nothing to download<br>here.</p></div></li>
+</ul></div></body></html>"""
+
+
+def test_html_tree_handles_void_and_stray_tags():
+    root = bb.parse_html('<div id="a"><p>one<br>two<img src="x.png"></p></span><p>three<script>var x = "<b>";</script></div><p>after')
+    div = root.find(lambda n: n.get("id") == "a")
+    assert [n.tag for n in div.children] == ["p", "p"] # br and img hold no children; the stray </span> closes nothing
+    assert div.text() == "onetwothree"
+    assert [n.text() for n in root.iter("p")] == ["onetwo", "three", "after"]
+
+
+def test_list_page_items_are_classified():
+    items = bb._extract_list_items_from_html(LIST_PAGE, PAGE_URL)
+    assert [item["title"] for item in items] == ["Week 1", "Lecture 1 Slides", "Assignment 1", "Reading list", "Announcement only"]
+
+    content_map = []
+    folders = bb._classify_list_items(items, content_map, quiet, "Course Content")
+
+    assert folders == [{"name": "Week 1", "url": "https://blackboard.test/webapps/blackboard/content/listContent.jsp?course_id=_7_1&content_id=_101_1"}]
+    assert content_map == [
+        {"type": "File", "url": "https://blackboard.test/bbcswebdav/pid-102-dt-content-rid-1_1/courses/C7/slides.pdf",
+         "name": "Lecture 1 Slides", "path": "Course Content"},
+        {"type": "File", "url": "https://blackboard.test/bbcswebdav/pid-103-dt-content-rid-2_1/courses/C7/hw1.pdf",
+         "name": "hw1.pdf", "path": os.path.join("Course Content", "Assignment 1")},
+        {"type": "WebLink", "url": "https://www.example.com/dataset", "name": "Dataset", "path": os.path.join("Course Content", "Assignment 1")},
+        {"type": "WebLink", "url": "https://www.example.com/reading", "name": "Reading list", "path": "Course Content"},
+    ]
+
+
+def test_page_without_a_content_list():
+    assert bb._extract_list_items_from_html("<html><body><p>Session expired</p></body></html>", PAGE_URL) is None
+
+
+def test_course_scan_is_paced(mock_server, credentials):
+    sent = []
+
+    class RecordingRateLimits(bb.RateLimits):
+        def request(self, session, method, url, **kwargs):
+            sent.append((method, url))
+            return super().request(session, method, url, **kwargs)
+
+    courses = bb.scan_courses(*credentials, "firefox", True, quiet, rate_limits=RecordingRateLimits())
+    assert len(courses) == len(mock_server.catalog.courses)
+    assert sent == [("GET", bb.SESSION_CHECK_URL)]
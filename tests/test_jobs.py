@@ -0,0 +1,67 @@
+"""Batch job workers: a lost lease stops the task, and shared budgets are re-read while they are charged."""
+import threading
+import time
+
+import pytest
+
+from conftest import PASSWORD, USERNAME, bb, quiet
+
+
+@pytest.fixture
+def work_queue(tmp_path):
+    work_queue = bb.SQLiteWorkQueue(str(tmp_path / "jobs.sqlite3"))
+    yield work_queue
+    work_queue.close()
+
+
+def test_lost_lease_stops_requests(work_queue):
+    work_queue.put("course", {}, key="course|a")
+    task = work_queue.lease("worker-a", lease_seconds=0.05)
+    time.sleep(0.1)
+    assert work_queue.lease("worker-b", lease_seconds=60)["id"] == task["id"] # a's lease ran out and b took the task over
+
+    with bb._lease_heartbeat(work_queue, task, "worker-a", 0.05, quiet) as lease_lost:
+        assert lease_lost.wait(5)
+    with pytest.raises(bb.LeaseLostError):
+        bb.RateLimits(budget=bb.SharedBudget(work_queue, lease_lost)).request(None, "GET", "http://blackboard.test/")
+
+
+def test_lost_lease_stops_the_remaining_downloads(work_queue, tmp_path):
+    lease_lost = threading.Event()
+    lease_lost.set()
+    engine = bb.DownloadEngine(bb.requests.Session(), quiet, rate_limits=bb.RateLimits(budget=bb.SharedBudget(work_queue, lease_lost)))
+    items = [{"type": "File", "url": f"http://blackboard.test/file{i}", "name": f"file{i}.pdf", "path": ""} for i in range(20)]
+    with pytest.raises(bb.LeaseLostError):
+        engine.download_items(str(tmp_path), items)
+    # Stopped rather than failed: nothing is reported or queued for the end-of-run retry
+    assert not engine.results["FAILED"] and not engine.retry_queue
+
+
+def test_worker_abandons_a_task_whose_lease_is_lost(mock_server, credentials, tmp_path, monkeypatch):
+    monkeypatch.setenv("BB_PASSWORD", PASSWORD)
+    course = bb.scan_courses(USERNAME, PASSWORD, "firefox", True, quiet)[-1]
+    queue_path = str(tmp_path / "jobs.sqlite3")
+    work_queue = bb.SQLiteWorkQueue(queue_path)
+    work_queue.put("course", {"account": USERNAME, "password_env": "BB_PASSWORD", "course": course, "output": str(tmp_path / "out"),
+                              "http_crawl": True, "dedupe": True, "base_url": mock_server.base_url}, key="course|lost")
+    monkeypatch.setattr(bb.SQLiteWorkQueue, "heartbeat", lambda self, task_id, worker, lease_seconds: False)
+
+    outcomes = bb.run_job_worker(queue_path, {"lease_seconds": 0.15, "poll_interval": 0.05}, quiet)
+
+    # Every attempt stopped without completing or failing the task itself; it failed only by running out of attempts
+    assert outcomes == {"failed": bb.JOB_MAX_ATTEMPTS}
+    [task] = work_queue.tasks()
+    assert task["state"] == "failed" and task["last_error"] == "lease expired on the last attempt"
+    work_queue.close()
+
+
+def test_budget_changes_apply_to_running_workers(work_queue):
+    work_queue.set_budget("requests", 8)
+    bucket = bb.SharedBudget(work_queue).requests
+    bucket.acquire()
+    work_queue.set_budget("requests", 400)
+    bucket.acquire(5)
+    assert bucket.rate == 400
+    work_queue.set_budget("requests", None)
+    bucket.acquire(200)
+    assert bucket.rate == 0
@@ -0,0 +1,26 @@
+"""The download manifest: a file recorded by an earlier run is checked with a conditional GET and skipped on 304."""
+from conftest import bb, file_bytes, quiet
+
+
+def test_unchanged_file_is_skipped_on_304(mock_server, session, tmp_path):
+    file_id = min(mock_server.catalog.files)
+    url = mock_server.base_url.rstrip("/") + mock_server.catalog.file_url(file_id)
+    manifest = bb.DownloadManifest(str(tmp_path / "manifest.sqlite3"))
+    course_dir = tmp_path / "course"
+    course_dir.mkdir()
+
+    def download():
+        before = dict(mock_server.stats)
+        outcome = bb.DownloadEngine(session, quiet, manifest=manifest)._download_file(str(course_dir), url, str(course_dir), "notes", ".pdf")
+        return outcome, {key: mock_server.stats[key] - before[key] for key in ("files", "not_modified", "bytes")}
+
+    assert download() == ("SAVED", {"files": 1, "not_modified": 0, "bytes": len(file_bytes(mock_server, file_id))})
+    entry = manifest.lookup(url)
+    assert entry["path"] == str(course_dir / "notes.pdf") and entry["etag"] and entry["last_modified"]
+
+    assert download() == ("SKIPPED", {"files": 0, "not_modified": 1, "bytes": 0})
+
+    (course_dir / "notes.pdf").write_bytes(b"truncated") # No longer what the manifest recorded: fetched in full again
+    assert download() == ("SAVED", {"files": 1, "not_modified": 0, "bytes": len(file_bytes(mock_server, file_id))})
+    assert (course_dir / "notes.pdf").read_bytes() == file_bytes(mock_server, file_id)
+    manifest.close()
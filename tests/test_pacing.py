@@ -0,0 +1,72 @@
+"""Throttled answers are retried by RetryPolicy alone, and retried items are counted once."""
+import pytest
+import requests
+
+from conftest import bb, quiet
+
+
+class ThrottledSession:
+    """Answers every request with status and headers, counting the requests."""
+    def __init__(self, status, headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        r = requests.Response()
+        r.status_code, r.url = self.status, url
+        r.headers.update(self.headers)
+        return r
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Replaces sleeping with a clock that jumps ahead; returns the list of the sleeps asked for."""
+    clock, sleeps = [1000.0], []
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+    monkeypatch.setattr(bb.time, "sleep", sleep)
+    monkeypatch.setattr(bb.time, "monotonic", lambda: clock[0])
+    return sleeps
+
+
+def test_throttled_answer_is_returned_without_retrying(sleeps):
+    rate_limits = bb.RateLimits(max_concurrency=8)
+    session = ThrottledSession(503, {"Retry-After": "2"})
+
+    r = rate_limits.request(session, "GET", "http://blackboard.test/file")
+
+    assert r.status_code == 503 and session.calls == 1
+    throttle = rate_limits.for_host("http://blackboard.test/file")
+    assert throttle.window == 4
+    assert throttle.breaker._failures == 0 # Pushback is not a failure of the server
+
+
+def test_retry_policy_waits_for_retry_after(sleeps):
+    session = ThrottledSession(429, {"Retry-After": "7"})
+    rate_limits = bb.RateLimits()
+
+    def attempt():
+        r = rate_limits.request(session, "GET", "http://blackboard.test/page")
+        r.raise_for_status()
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        bb.RetryPolicy(attempts=3, base_delay=0.01, max_delay=0.01).call(attempt)
+
+    assert session.calls == 3
+    assert sleeps == [7.0, 7.0] # Its own backoff is shorter; the server's pause has passed by the next attempt
+
+
+def test_retried_items_are_counted_once(session, tmp_path):
+    bb.METRICS.reset()
+    engine = bb.DownloadEngine(session, quiet, retry_policy=bb.RetryPolicy(attempts=1))
+    unreachable = {"type": "File", "name": "gone.pdf", "url": "http://127.0.0.1:9/bbcswebdav/gone.pdf", "path": ""}
+
+    engine.download_items(str(tmp_path), [unreachable])
+    engine.retry_failed()
+
+    assert engine.results["FAILED"] == 1
+    counted = {entry["labels"]["outcome"]: entry["value"] for entry in bb.METRICS.snapshot()["items_total"]}
+    assert counted == {"failed": 1}
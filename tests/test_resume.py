@@ -0,0 +1,60 @@
+"""Resuming an interrupted download from its .part file."""
+import hashlib
+import os
+
+import pytest
+
+from conftest import bb, file_bytes, quiet
+
+
+def _largest_file(server):
+    return max(server.catalog.files, key=lambda file_id: server.catalog.files[file_id][1])
+
+
+def _interrupted_download(server, folder, file_id, offset, validator=None):
+    """Leaves folder as a run that stopped after offset bytes of file_id would; returns (url, expected bytes, final path)."""
+    url = server.base_url.rstrip("/") + server.catalog.file_url(file_id)
+    expected = file_bytes(server, file_id)
+    final_path = folder / f"file_{file_id}.pdf"
+    part_path = str(final_path) + bb.PART_SUFFIX
+    with open(part_path, "wb") as f:
+        f.write(expected[:offset])
+    bb._write_part_meta(bb._part_meta_path(str(folder), url), url, validator or f'"syn-{file_id}-{len(expected)}"',
+                        len(expected), part_path)
+    return url, expected, final_path
+
+
+@pytest.mark.parametrize("kept", ["third", "all but the last 100 bytes"])
+def test_resume_fetches_only_the_missing_bytes(mock_server, session, tmp_path, kept):
+    file_id = _largest_file(mock_server)
+    size = mock_server.catalog.files[file_id][1]
+    offset = size // 3 if kept == "third" else size - 100
+    url, expected, final_path = _interrupted_download(mock_server, tmp_path, file_id, offset)
+
+    manifest = bb.DownloadManifest(str(tmp_path / "manifest.sqlite3"))
+    engine = bb.DownloadEngine(session, quiet, manifest=manifest)
+    before = dict(mock_server.stats)
+    outcome = engine._download_file(str(tmp_path), url, str(tmp_path), f"file_{file_id}", ".pdf")
+
+    assert outcome == "SAVED"
+    assert final_path.read_bytes() == expected
+    assert manifest.lookup(url)["sha256"] == hashlib.sha256(expected).hexdigest()
+    assert mock_server.stats["files"] - before["files"] == 1
+    assert mock_server.stats["bytes"] - before["bytes"] == size - offset
+    assert not [name for name in os.listdir(tmp_path) if bb.PART_SUFFIX in name]
+
+
+def test_changed_file_is_downloaded_again_in_full(mock_server, session, tmp_path):
+    file_id = _largest_file(mock_server)
+    size = mock_server.catalog.files[file_id][1]
+    url, expected, final_path = _interrupted_download(mock_server, tmp_path, file_id, size // 2, validator='"an-older-version"')
+    with open(str(final_path) + bb.PART_SUFFIX, "r+b") as f:
+        f.write(b"stale bytes")
+
+    before = dict(mock_server.stats)
+    outcome = bb.DownloadEngine(session, quiet)._download_file(str(tmp_path), url, str(tmp_path), f"file_{file_id}", ".pdf")
+
+    assert outcome == "SAVED"
+    assert final_path.read_bytes() == expected
+    assert mock_server.stats["bytes"] - before["bytes"] == size
+    assert os.listdir(tmp_path) == [final_path.name]
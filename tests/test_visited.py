@@ -0,0 +1,33 @@
+"""One VisitedIndex per course: the homepage and the sections never crawl a folder or queue a file twice."""
+from conftest import bb, quiet
+
+
+def test_folder_is_known_by_its_content_id():
+    visited = bb.VisitedIndex()
+    assert visited.claim("https://bb.test/webapps/blackboard/content/listContent.jsp?course_id=_7_1&content_id=_101_1")
+    assert not visited.claim("https://bb.test/webapps/blackboard/content/listContent.jsp?content_id=_101_1&mode=reset")
+    assert visited.claim("https://bb.test/bbcswebdav/pid-101/notes.pdf", kind="file")
+    assert not visited.claim("https://BB.test/bbcswebdav/pid-101/notes.pdf", kind="file")
+
+
+def test_course_pages_and_files_are_fetched_once(mock_server, session, tmp_path):
+    course = mock_server.catalog.courses[0]
+    course_pages = sum(1 for page in mock_server.catalog.pages.values() if page["course"] == course["id"])
+    course_files = sum(1 for content_id, _ in mock_server.catalog.files.values() if mock_server.catalog.pages[content_id]["course"] == course["id"])
+    engine = bb.DownloadEngine(session, quiet)
+    before = dict(mock_server.stats)
+
+    # The course entry point opens on the "Course Content" section, which is then crawled as the homepage only
+    bb.download_course({"name": course["name"], "term": course["term"],
+                        "url": f"{mock_server.base_url}webapps/blackboard/execute/launcher?type=Course&id=_{course['id']}_1&url="},
+                       str(tmp_path), session, engine, quiet)
+
+    assert mock_server.stats["pages"] - before["pages"] == course_pages
+    assert mock_server.stats["files"] - before["files"] == course_files
+    assert engine.results["SAVED"] == course_files
+
+
+def test_items_without_a_url_are_reported(session, tmp_path):
+    engine = bb.DownloadEngine(session, quiet)
+    items = [{"type": "File", "url": None, "name": "first"}, {"type": "File", "url": "", "name": "second"}]
+    assert engine.download_items(str(tmp_path), items) == {"SKIPPED": 2}